@@ -0,0 +1,304 @@
+"""Kiểm thử hồi quy cho vehicle_detector_core (chạy: python -m pytest -q)."""
+import os
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from vehicle_detector_core import (
+    ByteTracker, DetectionCache, DetectionStore, FileRecord, ImagePipeline, PipelineSignals, SearchIndex,
+    VideoDetections, detection_cache_key, load_session, merge_boxes, save_session, split_calibration, tiling_config
+)
+
+CLASS_NAMES = {0: 'Tank', 1: 'MRLS', 2: 'Civilian'}
+
+
+def _dets(*rows):
+    return np.array(rows, dtype=np.float32).reshape(-1, 6)
+
+
+def _moving_box(frame_idx, speed=0.02, conf=0.9):
+    return np.array([[0, 0.1 + speed * frame_idx, 0.5, 0.1, 0.1, conf]], dtype=np.float32)
+
+
+def test_tracker_keeps_id_through_occlusion():
+    """Vật thể bị che frame 15-24 (trong track_buffer) phải quay lại với cùng track_id."""
+    tracker = ByteTracker(track_buffer=30)
+    ids = []
+    for frame_idx in range(35):
+        detections = np.zeros((0, 6), dtype=np.float32) if 15 <= frame_idx <= 24 else _moving_box(frame_idx)
+        track_ids = tracker.update(detections, frame_idx)
+        ids.extend(track_ids.tolist())
+
+    assert set(ids) == {1}
+    assert tracker.next_id == 2
+
+
+def test_tracker_velocity_uses_frames_since_last_seen():
+    """Sau khi tìm lại, vận tốc tính theo số frame track bị mất chứ không theo khoảng giữa hai lần update."""
+    tracker = ByteTracker()
+    for frame_idx in list(range(15)) + list(range(25, 27)):
+        tracker.update(_moving_box(frame_idx), frame_idx)
+
+    assert np.allclose(tracker.velocity[0, 0], 0.02, atol=2e-3)
+
+
+def test_detection_store_readd_and_remove_drop_old_rows():
+    store = DetectionStore()
+    dets = np.array([[0, 0.5, 0.5, 0.1, 0.1, 0.9], [1, 0.2, 0.2, 0.1, 0.1, 0.8]], dtype=np.float32)
+    for _ in range(5):
+        store.add(1, dets)
+    assert len(store) == 2
+    assert store.class_counts() == {0: 1, 1: 1}
+
+    store.remove(1)
+    assert 1 not in store
+    assert len(store) == 0
+    assert store.class_counts() == {}
+
+
+def test_merge_boxes_keeps_full_box_over_truncated_seam_box():
+    """Box bị cắt ở mép tile (điểm cao hơn) không được loại box đầy đủ chứa nó."""
+    boxes = np.array([[100, 100, 160, 200], [100, 100, 220, 200]], dtype=np.float32) # cắt / đầy đủ
+    merged, keep = merge_boxes(boxes, np.array([0.9, 0.7], dtype=np.float32), np.zeros(2, dtype=np.float32), 0.6)
+
+    assert keep.tolist() == [0]
+    assert merged.tolist() == [[100, 100, 220, 200]]
+
+
+def test_split_calibration_holds_out_disjoint_eval_images():
+    paths = [f'img_{i:02d}.jpg' for i in range(10)]
+    calibration, evaluation = split_calibration(paths, eval_fraction=0.2)
+
+    assert evaluation == ['img_04.jpg', 'img_09.jpg']
+    assert not set(calibration) & set(evaluation)
+    assert len(calibration) + len(evaluation) == len(paths)
+
+
+def test_search_index_filters_by_class_count_and_confidence():
+    index = SearchIndex()
+    convoy_a, convoy_b, empty = '/data/convoy_a.jpg', '/data/convoy_b.jpg', '/data/empty.jpg'
+    index.add(convoy_a, _dets([0, .2, .2, .1, .1, .9], [0, .4, .4, .1, .1, .7], [0, .6, .6, .1, .1, .5],
+                              [1, .5, .5, .1, .1, .8]))
+    index.add(convoy_b, _dets([0, .5, .5, .1, .1, .9], [2, .3, .3, .1, .1, .6]))
+    index.add(empty, _dets())
+
+    assert index.search('any Tank', CLASS_NAMES) == {convoy_a, convoy_b}
+    assert index.search('no Civilian', CLASS_NAMES) == {convoy_a, empty}
+    assert index.search('>=3 Tank', CLASS_NAMES) == {convoy_a}
+    assert index.search('>=2 Tank above 0.6', CLASS_NAMES) == {convoy_a}
+    assert index.search('>=3 Tank above 0.6', CLASS_NAMES) == set()
+    assert index.search('Tank > 0.8', CLASS_NAMES) == {convoy_a, convoy_b}
+    assert index.search('convoy, any MRLS', CLASS_NAMES) == {convoy_a}
+    assert index.search('', CLASS_NAMES) is None
+    assert index.matches(convoy_a, 'any MRLS', CLASS_NAMES)
+    assert not index.matches(convoy_b, 'any MRLS', CLASS_NAMES)
+
+
+def test_search_index_counts_video_objects_per_frame():
+    """Với video, ">=N" cần N đối tượng trong cùng một frame chứ không cộng dồn qua các frame."""
+    video = VideoDetections()
+    video.append(_dets([0, .2, .2, .1, .1, .9], [0, .4, .4, .1, .1, .9]))
+    video.append(_dets([0, .3, .2, .1, .1, .9], [0, .5, .4, .1, .1, .9]))
+    index = SearchIndex()
+    index.add_video('/data/clip.mp4', video)
+
+    assert index.search('>=2 Tank', CLASS_NAMES) == {'/data/clip.mp4'}
+    assert index.search('>=3 Tank', CLASS_NAMES) == set()
+
+
+def test_search_index_updates_when_file_is_redetected_or_removed():
+    index = SearchIndex()
+    path = '/data/convoy_a.jpg'
+    index.add(path, _dets([0, .5, .5, .1, .1, .9]))
+    assert index.search('any Tank', CLASS_NAMES) == {path}
+    assert index.search('convoy', CLASS_NAMES) == {path}
+
+    index.add(path, _dets([2, .5, .5, .1, .1, .9])) # Xử lý lại: kết quả cũ phải bị thay thế
+    assert index.search('any Tank', CLASS_NAMES) == set()
+    assert index.search('any Civilian', CLASS_NAMES) == {path}
+    assert len(index) == 1
+
+    index.remove(path)
+    assert len(index) == 0
+    assert index.search('any Civilian', CLASS_NAMES) == set()
+    assert index.search('no Tank', CLASS_NAMES) == set()
+    assert index.search('convoy', CLASS_NAMES) == set()
+
+
+def _video(frames):
+    video = VideoDetections()
+    for detections, track_ids in frames:
+        video.append(detections, None if track_ids is None else np.array(track_ids, dtype=np.int64))
+    return video
+
+
+def test_session_round_trip_keeps_detections_track_ids_and_save_status(tmp_path):
+    store = DetectionStore()
+    image_dets = _dets([0, .5, .5, .1, .1, .9], [1, .2, .2, .1, .1, .8])
+    store.add(1, image_dets)
+    image = FileRecord(1, 'image', 640, 480, image_path='/data/a.jpg', source_path='/data/a.jpg')
+    image.save_status = True
+    # Hai video để kiểm tra cả đoạn hàng/frame của video thứ hai trong mảng chung
+    clip_1 = _video([(_dets([0, .1, .1, .1, .1, .9]), [7]), (_dets(), None),
+                     (_dets([0, .2, .1, .1, .1, .8], [2, .6, .6, .1, .1, .7]), [7, 8])])
+    clip_2 = _video([(_dets([1, .3, .3, .1, .1, .6]), [3]), (_dets([1, .4, .3, .1, .1, .6]), [3])])
+    videos = [FileRecord(2, 'video', 1280, 720, source_path='/data/v1.mp4', detections=clip_1, fps=25.0, total_frames=3),
+              FileRecord(3, 'video', 640, 360, source_path='/data/v2.mp4', detections=clip_2, fps=30.0, total_frames=2)]
+    records = [('/data/a.jpg', image), ('/data/v1.mp4', videos[0]), ('/data/v2.mp4', videos[1])]
+
+    assert save_session(str(tmp_path), records, store, CLASS_NAMES) == 3
+    loaded, loaded_store, class_names = load_session(str(tmp_path))
+
+    assert class_names == CLASS_NAMES
+    assert [path for path, _ in loaded] == [path for path, _ in records]
+    loaded_image = loaded[0][1]
+    assert loaded_image.save_status is True
+    assert (loaded_image.kind, loaded_image.width, loaded_image.height) == ('image', 640, 480)
+    assert loaded_image.image_path == '/data/a.jpg'
+    np.testing.assert_array_equal(loaded_store.get(1), image_dets)
+
+    for original, (_, record) in zip(videos, loaded[1:]):
+        assert record.save_status is False
+        assert (record.kind, record.fps, record.total_frames) == ('video', original.fps, original.total_frames)
+        assert len(record.detections) == len(original.detections)
+        for frame_idx in range(len(original.detections)):
+            np.testing.assert_array_equal(record.detections.get(frame_idx), original.detections.get(frame_idx))
+            np.testing.assert_array_equal(record.detections.get_track_ids(frame_idx),
+                                          original.detections.get_track_ids(frame_idx))
+
+
+def test_detection_cache_misses_when_model_or_params_change(tmp_path):
+    params = {'iou': 0.7, 'conf': 0.25, 'imgsz': 640}
+    cache = DetectionCache(str(tmp_path), 'model-a', params)
+    detections = _dets([0, .5, .5, .1, .1, .9])
+    cache.put(cache.key('digest'), detections)
+
+    same = DetectionCache(str(tmp_path), 'model-a', dict(params))
+    np.testing.assert_array_equal(same.get(same.key('digest')), detections)
+    for changed in (DetectionCache(str(tmp_path), 'model-a', {**params, 'conf': 0.5}),
+                    DetectionCache(str(tmp_path), 'model-b', params)):
+        assert changed.key('digest') != cache.key('digest')
+        assert changed.get(changed.key('digest')) is None
+    assert cache.get(cache.key('other-digest')) is None
+    assert cache.get(detection_cache_key(cache, 'digest', tiling=tiling_config(640))) is None
+
+
+def test_detection_cache_evicts_least_recently_used_entries(tmp_path):
+    cache = DetectionCache(str(tmp_path), 'model', {})
+    detections = _dets([0, .5, .5, .1, .1, .9])
+    keys = [cache.key(f'file-{i}') for i in range(3)]
+    paths = [cache._path(key, '.npy') for key in keys]
+
+    cache.put(keys[0], detections)
+    entry_size = os.path.getsize(paths[0])
+    cache.max_bytes = int(entry_size * 2.5) # Chứa được 2 mục
+    os.utime(paths[0], (1000, 1000))
+    cache.put(keys[1], detections)
+    os.utime(paths[1], (2000, 2000))
+    assert cache.get(keys[0]) is not None # Đọc trúng -> mục 0 thành mới dùng nhất
+
+    cache.put(keys[2], detections)
+    assert not os.path.exists(paths[1])
+    assert os.path.exists(paths[0]) and os.path.exists(paths[2])
+    total = sum(os.path.getsize(os.path.join(root, name))
+                for root, _, files in os.walk(str(tmp_path)) for name in files)
+    assert total <= cache.max_bytes
+
+
+class _Tensor:
+    def __init__(self, array):
+        self._array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self._array
+
+
+class _Boxes:
+    def __init__(self, code):
+        self.cls = _Tensor(np.array([code], dtype=np.float32))
+        self.xywhn = _Tensor(np.array([[.5, .5, .1, .1]], dtype=np.float32))
+        self.conf = _Tensor(np.array([.9], dtype=np.float32))
+
+    def __len__(self):
+        return 1
+
+
+class _Result:
+    def __init__(self, code):
+        self.boxes = _Boxes(code)
+
+
+class _StubModel:
+    """Trả về một box có class = mã của ảnh (pixel đầu / 10); raise khi gặp ảnh có mã fail_code."""
+    def __init__(self, fail_code=None):
+        self.fail_code = fail_code
+
+    def predict(self, images, **kwargs):
+        codes = [int(img[0, 0, 0]) // 10 for img in images]
+        if self.fail_code in codes:
+            raise RuntimeError("stub inference failure")
+        return [_Result(code) for code in codes]
+
+
+def _write_coded_images(directory, count):
+    paths = []
+    for i in range(count):
+        path = os.path.join(str(directory), f'img_{i:02d}.png')
+        cv2.imwrite(path, np.full((8, 8, 3), i * 10, dtype=np.uint8))
+        paths.append(path)
+    return paths
+
+
+def _run_pipeline(model, paths, temp_dir, fail_path=None, batch_size=1):
+    """Chạy ImagePipeline có prefetch (hàng đợi 1 lô) trong luồng riêng; trả về (emitted, errors, finished)."""
+    signals = PipelineSignals()
+    emitted, errors, finished = [], [], []
+    signals.file_processed.connect(lambda path, image_path, dets, w, h, thumb: emitted.append((path, int(dets[0, 0]))))
+    signals.error.connect(errors.append)
+    signals.finished.connect(lambda: finished.append(True))
+    pipeline = ImagePipeline(model, paths, temp_dir, signals, is_batch=True, batch_size=batch_size, prefetch=1,
+                             decode_workers=2)
+    if fail_path is not None:
+        load_one = pipeline._load_one
+
+        def failing_load(path):
+            if path == fail_path:
+                raise IOError("stub decode failure")
+            return load_one(path)
+        pipeline._load_one = failing_load
+
+    thread = threading.Thread(target=pipeline.run, daemon=True)
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive(), "pipeline bị kẹt"
+    return emitted, errors, finished
+
+
+def test_staged_pipeline_emits_results_in_file_order(tmp_path):
+    paths = _write_coded_images(tmp_path, 12)
+    emitted, errors, finished = _run_pipeline(_StubModel(), paths, str(tmp_path / 'temp'), batch_size=2)
+
+    assert errors == []
+    assert finished == [True]
+    assert emitted == [(path, i) for i, path in enumerate(paths)]
+
+
+@pytest.mark.parametrize('stage', ['decode', 'infer'])
+def test_staged_pipeline_stops_on_error_without_deadlock(tmp_path, stage):
+    """Lỗi ở giữa lượt chạy: báo lỗi đúng một lần, không kẹt khi hàng đợi đầy, kết quả đã gửi vẫn đúng thứ tự."""
+    paths = _write_coded_images(tmp_path, 12)
+    fail_index = 5
+    model = _StubModel(fail_code=fail_index if stage == 'infer' else None)
+    emitted, errors, finished = _run_pipeline(model, paths, str(tmp_path / 'temp'),
+                                              fail_path=paths[fail_index] if stage == 'decode' else None)
+
+    assert len(errors) == 1
+    assert finished == [True]
+    emitted_paths = [path for path, _ in emitted]
+    assert emitted_paths == paths[:len(emitted_paths)]
+    assert len(emitted_paths) <= fail_index
@@ -0,0 +1,427 @@
+"""Benchmark pipeline nhận diện: ảnh tổng hợp, ảnh mẫu và video tổng hợp, chạy offline trên CPU.
+
+Dùng đúng các đường xử lý của GUI/CLI (ImagePipeline như PredictionWorker, VideoPipeline như VideoWorker,
+draw_detections + bgr_to_rgb như _draw_boxes_on_image, không cần PyQt) và ghi kết quả JSON: thời gian từng
+giai đoạn (ms/ảnh), số ảnh/s, peak RSS, kèm so sánh với baseline đã lưu. Mỗi kịch bản chạy trong một tiến
+trình con mới nên peak RSS là của riêng kịch bản đó. Mặc định model được dựng từ
+'yolov8n.yaml' (trọng số ngẫu nhiên, seed cố định) nên không cần tải gì; đo tốc độ, không đo độ chính xác.
+
+Để so sánh được giữa các máy, mọi thời gian còn được chuẩn hóa theo một tải tham chiếu cố định
+(reference_s) đo ngay trước khi chạy.
+
+Baseline (bench_baseline.json cạnh file này) không có sẵn trong repo vì phụ thuộc máy và phiên bản thư viện:
+chạy --save-baseline một lần trên máy tham chiếu (cùng các tùy chọn sẽ dùng khi so sánh) trước khi kiểm tra
+hồi quy; chưa có baseline thì chỉ ghi kết quả, không so sánh.
+Ví dụ:
+    python vehicle_detector_bench.py --save-baseline
+    python vehicle_detector_bench.py --output bench.json   # so với baseline, mã thoát 1 nếu chậm đi
+"""
+import os
+import sys
+import glob
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import shutil
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+try:
+    import ultralytics
+except ImportError:
+    print("Lỗi: Thiếu thư viện 'ultralytics'. Vui lòng cài đặt bằng: pip install ultralytics")
+    sys.exit(1)
+
+# Tùy chọn: đo peak RSS (resource chỉ có trên Unix, psutil dùng được trên Windows)
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from vehicle_detector_core import (
+    DEFAULT_BATCH_SIZE, DEFAULT_PREFETCH_BATCHES, DEFAULT_DECODE_WORKERS, DEFAULT_MOTION_THRESHOLD,
+    ImagePipeline, VideoPipeline, PipelineSignals, ByteTracker, load_model, draw_detections, bgr_to_rgb
+)
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE_PATH = os.path.join(BENCH_DIR, 'bench_baseline.json')
+DEFAULT_SAMPLE_GLOB = os.path.join(BENCH_DIR, '..', 'import', '*.jpg')
+DEFAULT_BENCH_MODEL = 'yolov8n.yaml'
+DEFAULT_TOLERANCE = 0.15 # Chậm đi quá 15% (sau chuẩn hóa) thì coi là hồi quy
+MIN_COMPARABLE_MS = 0.05 # Giai đoạn nhanh hơn mức này chủ yếu là nhiễu đo -> không so sánh
+SEED = 0
+
+SYNTHETIC_SIZES = ((640, 480), (1280, 720), (1920, 1080))
+SYNTHETIC_BOXES = 20 # Số box vẽ trên mỗi ảnh ở bước draw (cố định, không phụ thuộc model)
+VIDEO_SIZE = (640, 360)
+VIDEO_FPS = 30
+
+# --- Dữ liệu tổng hợp (tất định theo seed) ---
+
+def synthetic_scene(rng, w, h, n_objects=8):
+    """Nền nhiễu mịn + các khối chữ nhật màu (giả phương tiện)."""
+    img = cv2.GaussianBlur(rng.integers(0, 255, (h, w, 3), dtype=np.uint8), (0, 0), 3)
+    for _ in range(n_objects):
+        bw, bh = int(rng.integers(w // 20, w // 6)), int(rng.integers(h // 20, h // 6))
+        x, y = int(rng.integers(0, w - bw)), int(rng.integers(0, h - bh))
+        cv2.rectangle(img, (x, y), (x + bw, y + bh), tuple(int(c) for c in rng.integers(0, 255, 3)), -1)
+    return img
+
+def write_synthetic_images(out_dir, count, rng):
+    """Ghi ảnh JPEG tổng hợp (xoay vòng các kích thước) để bước đọc + giải mã được đo như ảnh thật."""
+    paths = []
+    for i in range(count):
+        w, h = SYNTHETIC_SIZES[i % len(SYNTHETIC_SIZES)]
+        path = os.path.join(out_dir, f'synthetic_{i:04d}_{w}x{h}.jpg')
+        cv2.imwrite(path, synthetic_scene(rng, w, h))
+        paths.append(path)
+    return paths
+
+def write_synthetic_video(path, frames, rng):
+    """Video camera tĩnh: 1/3 đầu đứng yên, 1/3 giữa có khối chuyển động, 1/3 cuối đứng yên trở lại."""
+    w, h = VIDEO_SIZE
+    background = synthetic_scene(rng, w, h, n_objects=4)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), VIDEO_FPS, (w, h))
+    if not writer.isOpened():
+        raise IOError("Không thể khởi tạo VideoWriter cho video tổng hợp.")
+    moving = (frames // 3, 2 * frames // 3)
+    for i in range(frames):
+        frame = background.copy()
+        t = min(max(i, moving[0]), moving[1]) - moving[0]
+        x = 20 + (t * 6) % (w - 120)
+        cv2.rectangle(frame, (x, h // 2 - 30), (x + 100, h // 2 + 30), (40, 60, 200), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+def synthetic_detections(rng, n=SYNTHETIC_BOXES, num_classes=80):
+    """Mảng Nx6 chuẩn hóa hợp lệ, dùng cho bước vẽ để thời gian vẽ không phụ thuộc output model."""
+    dets = np.empty((n, 6), dtype=np.float32)
+    dets[:, 0] = rng.integers(0, num_classes, n)
+    dets[:, 3:5] = rng.uniform(0.03, 0.2, (n, 2))
+    dets[:, 1:3] = rng.uniform(0.1, 0.9, (n, 2))
+    dets[:, 5] = rng.uniform(0.25, 1.0, n)
+    return dets
+
+# --- Đo lường ---
+
+class StageTimer:
+    """Bọc model: cộng dồn thời gian preprocess/infer/postprocess mà ultralytics đo cho từng ảnh.
+
+    Mọi thuộc tính khác chuyển thẳng cho model gốc, nên pipeline chạy đúng như với model thật.
+    """
+    def __init__(self, model):
+        self._model = model
+        self.ms = {'preprocess': 0.0, 'infer': 0.0, 'postprocess': 0.0}
+        self.images = 0
+
+    def predict(self, *args, **kwargs):
+        results = self._model.predict(*args, **kwargs)
+        for result in results:
+            speed = getattr(result, 'speed', None) or {}
+            self.ms['preprocess'] += speed.get('preprocess') or 0.0
+            self.ms['infer'] += speed.get('inference') or 0.0
+            self.ms['postprocess'] += speed.get('postprocess') or 0.0
+        self.images += len(results)
+        return results
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+def peak_rss_mb():
+    """Peak RSS của tiến trình (MB) từ đầu tới giờ, None nếu không đo được.
+
+    Chỉ có nghĩa cho từng kịch bản vì mỗi kịch bản chạy trong tiến trình con riêng (run_scenario).
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1) # macOS trả byte, Linux KB
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return round(getattr(info, 'peak_wset', info.rss) / (1024 * 1024), 1)
+    return None
+
+def reference_seconds(repeats=3):
+    """Thời gian (median) của một tải CPU cố định (resize, blur, matmul) dùng để chuẩn hóa giữa các máy."""
+    rng = np.random.default_rng(SEED)
+    img = rng.integers(0, 255, (1080, 1920, 3), dtype=np.uint8)
+    a = rng.standard_normal((384, 384)).astype(np.float32)
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(10):
+            cv2.GaussianBlur(cv2.resize(img, (960, 540), interpolation=cv2.INTER_AREA), (5, 5), 0)
+            a @ a
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples))
+
+def per_image_ms(total_ms, count):
+    return round(total_ms / count, 3) if count else 0.0
+
+# --- Các kịch bản ---
+
+def bench_images(model, paths, batch_size, prefetch, decode_workers):
+    """Thư mục ảnh theo đường của PredictionWorker (ImagePipeline, is_batch=True)."""
+    timer = StageTimer(model)
+    signals = PipelineSignals()
+    count = {'images': 0, 'errors': []}
+    signals.file_processed.connect(lambda *args: count.__setitem__('images', count['images'] + 1))
+    signals.error.connect(count['errors'].append)
+
+    temp_dir = tempfile.mkdtemp(prefix="vehicle_detector_bench_")
+    try:
+        pipeline = ImagePipeline(timer, paths, temp_dir, signals, is_batch=True, batch_size=batch_size,
+                                 prefetch=prefetch, decode_workers=decode_workers)
+        start = time.perf_counter()
+        pipeline.run()
+        seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    n = count['images']
+    stages = {
+        # decode/pipeline_post là thời gian tường của giai đoạn (giải mã song song theo lô) chia cho số ảnh
+        'decode': per_image_ms(pipeline.stage_seconds['decode'] * 1000, n),
+        'preprocess': per_image_ms(timer.ms['preprocess'], timer.images),
+        'infer': per_image_ms(timer.ms['infer'], timer.images),
+        'postprocess': per_image_ms(timer.ms['postprocess'], timer.images),
+        'pipeline_post': per_image_ms(pipeline.stage_seconds['post'] * 1000, n),
+    }
+    return {'images': n, 'seconds': round(seconds, 3), 'images_per_s': round(n / seconds, 2) if seconds > 0 else 0.0,
+            'stages_ms': stages, 'max_queue_depths': list(pipeline.max_queue_depths), 'errors': count['errors'],
+            'peak_rss_mb': peak_rss_mb()}
+
+def bench_draw(paths, class_names, rng, repeats):
+    """Vẽ kết quả như _draw_boxes_on_image: copy ảnh gốc, draw_detections, rồi đổi BGR sang RGB cho QImage."""
+    class_colors = {c: [random.randint(0, 255) for _ in range(3)] for c in class_names}
+    images = [cv2.imread(path) for path in paths]
+    detections = [synthetic_detections(rng, num_classes=len(class_names)) for _ in images]
+    draw_ms = rgb_ms = 0.0
+    for _ in range(repeats):
+        for img, dets in zip(images, detections):
+            start = time.perf_counter()
+            annotated = draw_detections(img.copy(), dets, class_names, class_colors)
+            draw_ms += (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            bgr_to_rgb(annotated)
+            rgb_ms += (time.perf_counter() - start) * 1000
+    n = len(images) * repeats
+    stages = {'draw': per_image_ms(draw_ms, n), 'to_rgb': per_image_ms(rgb_ms, n)}
+    return {'images': n, 'boxes_per_image': SYNTHETIC_BOXES, 'stages_ms': stages, 'peak_rss_mb': peak_rss_mb()}
+
+def bench_video(model, video_path, batch_size, motion_threshold=None):
+    """Video theo đường của VideoWorker (VideoPipeline + ByteTracker)."""
+    timer = StageTimer(model)
+    signals = PipelineSignals()
+    state = {'frames': 0, 'errors': []}
+    signals.video_processed.connect(lambda path, detections: state.__setitem__('frames', len(detections)))
+    signals.error.connect(state['errors'].append)
+
+    temp_dir = tempfile.mkdtemp(prefix="vehicle_detector_bench_")
+    try:
+        pipeline = VideoPipeline(timer, video_path, temp_dir, signals, batch_size=batch_size, tracker=ByteTracker(),
+                                 motion_threshold=motion_threshold)
+        start = time.perf_counter()
+        pipeline.run()
+        seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    frames = state['frames']
+    stages = {
+        'preprocess': per_image_ms(timer.ms['preprocess'], timer.images),
+        'infer': per_image_ms(timer.ms['infer'], timer.images),
+        'postprocess': per_image_ms(timer.ms['postprocess'], timer.images),
+    }
+    return {'images': frames, 'inferred_frames': pipeline.inferred_frames, 'seconds': round(seconds, 3),
+            'images_per_s': round(frames / seconds, 2) if seconds > 0 else 0.0, 'stages_ms': stages,
+            'errors': state['errors'], 'peak_rss_mb': peak_rss_mb()}
+
+def seed_torch(threads):
+    """Cố định seed (và số luồng) torch nếu có; môi trường chỉ có runtime ONNX/OpenVINO thì bỏ qua."""
+    if importlib.util.find_spec('torch') is None:
+        return
+    import torch
+    torch.manual_seed(SEED) # Trọng số ngẫu nhiên của model .yaml giống nhau giữa các lần chạy
+    if threads > 0:
+        torch.set_num_threads(threads)
+
+def run_scenario(label, settings, kind, *args):
+    """Chạy một kịch bản trong tiến trình con (spawn): seed lại, nạp model nếu cần, trả về (kết quả, thông tin model)."""
+    random.seed(SEED)
+    rng = np.random.default_rng(SEED)
+
+    print(f"{label}...", file=sys.stderr)
+    if kind == 'draw':
+        return bench_draw(*args, rng, settings['draw_repeats']), None
+    seed_torch(settings['threads'])
+    model, _, timings = load_model(settings['model'], settings['warmup'])
+    info = {'load_s': round(timings['load_s'], 3), 'warmup_s': round(timings['warmup_s'], 3),
+            'class_names': dict(model.names)}
+    if kind == 'images':
+        return bench_images(model, *args), info
+    return bench_video(model, *args), info
+
+# --- So sánh với baseline ---
+
+def compare_with_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """So từng chỉ số đã chuẩn hóa theo reference_s; trả về {scenario.metric: {...}} và danh sách hồi quy.
+
+    Thời gian: current_ms / reference_s; thông lượng: images_per_s * reference_s. change_pct > 0 là chậm đi.
+    """
+    ref_now, ref_base = results['reference_s'], baseline['reference_s']
+    comparison, regressions = {}, []
+    for name, scenario in results['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if not base:
+            continue
+        metrics = []
+        if scenario.get('images_per_s') and base.get('images_per_s'):
+            # Thông lượng cao hơn là tốt -> đổi dấu để change_pct luôn cùng chiều "chậm đi"
+            metrics.append(('images_per_s', base['images_per_s'] * ref_base, scenario['images_per_s'] * ref_now, -1))
+        for stage, value in scenario.get('stages_ms', {}).items():
+            base_value = base.get('stages_ms', {}).get(stage)
+            if base_value is not None and base_value >= MIN_COMPARABLE_MS:
+                metrics.append((f'stages_ms.{stage}', base_value / ref_base, value / ref_now, 1))
+        for metric, base_norm, current_norm, sign in metrics:
+            change = sign * (current_norm - base_norm) / base_norm
+            key = f'{name}.{metric}'
+            comparison[key] = {'baseline_normalized': round(base_norm, 4), 'current_normalized': round(current_norm, 4),
+                               'change_pct': round(change * 100, 1), 'regression': change > tolerance}
+            if change > tolerance:
+                regressions.append(key)
+        if scenario.get('peak_rss_mb') and base.get('peak_rss_mb'):
+            # Bộ nhớ không phụ thuộc tốc độ máy -> so trực tiếp
+            change = (scenario['peak_rss_mb'] - base['peak_rss_mb']) / base['peak_rss_mb']
+            comparison[f'{name}.peak_rss_mb'] = {'baseline': base['peak_rss_mb'], 'current': scenario['peak_rss_mb'],
+                                                 'change_pct': round(change * 100, 1), 'regression': change > tolerance}
+            if change > tolerance:
+                regressions.append(f'{name}.peak_rss_mb')
+    return comparison, regressions
+
+def environment_info():
+    info = {'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'numpy': np.__version__, 'opencv': cv2.__version__, 'ultralytics': ultralytics.__version__}
+    try:
+        import torch
+        info.update(torch=torch.__version__, torch_threads=torch.get_num_threads())
+    except ImportError:
+        pass
+    return info
+
+# --- Dòng lệnh ---
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline nhận diện (offline, CPU).")
+    parser.add_argument('--model', default=DEFAULT_BENCH_MODEL,
+                        help="Model YOLO (.yaml = dựng trọng số ngẫu nhiên, không cần tải; .pt/.onnx để đo model thật)")
+    parser.add_argument('--output', default='bench_results.json', help="File JSON kết quả")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help="File baseline để so sánh")
+    parser.add_argument('--save-baseline', action='store_true', help="Ghi kết quả lần chạy này làm baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Tỉ lệ chậm đi tối đa so với baseline trước khi báo hồi quy")
+    parser.add_argument('--images', type=int, default=24, help="Số ảnh tổng hợp")
+    parser.add_argument('--samples', default=DEFAULT_SAMPLE_GLOB, help="Glob ảnh mẫu ('' = bỏ qua)")
+    parser.add_argument('--video-frames', type=int, default=90, help="Số frame video tổng hợp (0 = bỏ qua video)")
+    parser.add_argument('--draw-repeats', type=int, default=5, help="Số lần lặp bước vẽ trên mỗi ảnh")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--prefetch', type=int, default=DEFAULT_PREFETCH_BATCHES)
+    parser.add_argument('--decode-workers', type=int, default=DEFAULT_DECODE_WORKERS)
+    parser.add_argument('--threads', type=int, default=0, help="Cố định số luồng torch (0 = mặc định)")
+    parser.add_argument('--warmup', type=int, default=2, help="Số lần warm-up model trước khi đo")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    rng = np.random.default_rng(SEED)
+    settings = {'model': args.model, 'warmup': args.warmup, 'threads': args.threads,
+                'draw_repeats': args.draw_repeats}
+
+    print("Đo tải tham chiếu...", file=sys.stderr)
+    results = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'model': args.model, 'reference_s': reference_seconds(),
+               'settings': {'batch_size': args.batch_size, 'prefetch': args.prefetch,
+                            'decode_workers': args.decode_workers, 'images': args.images,
+                            'video_frames': args.video_frames, 'warmup': args.warmup},
+               'environment': environment_info(), 'scenarios': {}}
+
+    scenarios = results['scenarios']
+    model_info = {}
+    spawn = multiprocessing.get_context('spawn') # Tiến trình mới hoàn toàn, không kế thừa bộ nhớ của tiến trình cha
+
+    def isolated(key, label, kind, *scenario_args):
+        """Chạy kịch bản trong tiến trình con riêng để peak RSS không cộng dồn từ các kịch bản trước."""
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+            result, info = executor.submit(run_scenario, label, settings, kind, *scenario_args).result()
+        scenarios[key] = result
+        if info is not None and not model_info:
+            results['model_load_s'], results['model_warmup_s'] = info['load_s'], info['warmup_s']
+            model_info.update(info)
+
+    data_dir = tempfile.mkdtemp(prefix="vehicle_detector_bench_data_")
+    try:
+        synthetic = write_synthetic_images(data_dir, args.images, rng)
+        samples = sorted(glob.glob(args.samples)) if args.samples else []
+
+        isolated('images_synthetic', "Ảnh tổng hợp (prefetch)", 'images',
+                 synthetic, args.batch_size, args.prefetch, args.decode_workers)
+        isolated('images_synthetic_sequential', "Ảnh tổng hợp (tuần tự)", 'images', synthetic, args.batch_size, 0, 1)
+        if samples:
+            isolated('images_sample', f"Ảnh mẫu ({len(samples)})", 'images',
+                     samples, args.batch_size, args.prefetch, args.decode_workers)
+
+        # Bước vẽ không cần model, dùng tên lớp lấy từ kịch bản trước
+        isolated('draw', "Vẽ kết quả", 'draw', synthetic + samples, model_info['class_names'])
+
+        if args.video_frames > 0:
+            video_path = write_synthetic_video(os.path.join(data_dir, 'synthetic.mp4'), args.video_frames, rng)
+            isolated('video', "Video tổng hợp", 'video', video_path, args.batch_size)
+            isolated('video_motion_gate', "Video tổng hợp (motion gate)", 'video',
+                     video_path, args.batch_size, DEFAULT_MOTION_THRESHOLD)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    # Mỗi kịch bản có tiến trình riêng -> peak chung là giá trị lớn nhất giữa các kịch bản
+    results['peak_rss_mb'] = max((s['peak_rss_mb'] for s in scenarios.values() if s.get('peak_rss_mb')), default=None)
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        results['baseline'] = {'path': os.path.abspath(args.baseline), 'created': baseline.get('created'),
+                               'environment': baseline.get('environment')}
+        results['comparison'], regressions = compare_with_baseline(results, baseline, args.tolerance)
+        results['regressions'] = regressions
+    elif not args.save_baseline:
+        print(f"Chưa có baseline {os.path.abspath(args.baseline)}: bỏ qua so sánh, "
+              "chạy lại với --save-baseline để tạo.", file=sys.stderr)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"Đã lưu baseline: {os.path.abspath(args.baseline)}")
+
+    for name, scenario in results['scenarios'].items():
+        throughput = f", {scenario['images_per_s']} ảnh/s" if 'images_per_s' in scenario else ""
+        stages = ", ".join(f"{stage} {ms} ms" for stage, ms in scenario['stages_ms'].items())
+        print(f"{name}: {scenario['images']} ảnh{throughput} | {stages}")
+    print(f"Peak RSS (lớn nhất giữa các kịch bản): {results['peak_rss_mb']} MB, reference_s: {results['reference_s']:.4f}")
+    for key in regressions:
+        item = results['comparison'][key]
+        print(f"HỒI QUY {key}: chậm/tăng {item['change_pct']}% so với baseline", file=sys.stderr)
+    print(f"Kết quả đã lưu tại: {os.path.abspath(args.output)}")
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
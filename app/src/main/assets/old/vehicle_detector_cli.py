@@ -0,0 +1,332 @@
+"""Chạy nhận diện không cần giao diện (headless) trên thư mục ảnh/video.
+
+Dùng lại đúng pipeline của GUI (vehicle_detector_core) với tín hiệu dạng callback.
+Ví dụ:
+    python vehicle_detector_cli.py --model best.pt --output out/ data/images data/clip.mp4
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import tempfile
+import shutil
+
+import cv2
+
+try:
+    import ultralytics # noqa: F401 (load_model import YOLO khi cần)
+except ImportError:
+    print("Lỗi: Thiếu thư viện 'ultralytics'. Vui lòng cài đặt bằng: pip install ultralytics")
+    sys.exit(1)
+
+try:
+    from tqdm import tqdm
+except ImportError:
+    tqdm = None
+
+from vehicle_detector_core import (
+    DEFAULT_BATCH_SIZE, DEFAULT_PREFETCH_BATCHES, DEFAULT_DECODE_WORKERS, ImagePipeline, ParallelImagePipeline, VideoPipeline, PipelineSignals, ByteTracker,
+    DetectionCache, DETECTION_CACHE_DIR, file_digest, inference_params, decode_image, draw_detections,
+    export_annotated_video, load_model, DEFAULT_WARMUP_RUNS,
+    INFERENCE_BACKENDS, BACKEND_PYTORCH, quantize_model, compare_models, read_class_labels, DEFAULT_LABELS_PATH,
+    DEFAULT_CALIBRATION_IMAGES, DEFAULT_EVAL_FRACTION, split_calibration, tiling_config, DEFAULT_TILE_OVERLAP,
+    DEFAULT_MOTION_THRESHOLD
+)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov')
+
+def collect_inputs(paths):
+    """Tách danh sách đường dẫn (file hoặc thư mục) thành ảnh và video."""
+    images, videos = [], []
+    for path in paths:
+        if os.path.isdir(path):
+            files = [os.path.join(path, f) for f in sorted(os.listdir(path))]
+        else:
+            files = [path]
+        for f in files:
+            lower = f.lower()
+            if lower.endswith(IMAGE_EXTENSIONS):
+                images.append(f)
+            elif lower.endswith(VIDEO_EXTENSIONS):
+                videos.append(f)
+    return images, videos
+
+class ProgressBar:
+    """Bọc tqdm (nếu có), ngược lại in tiến độ đơn giản ra stderr."""
+    def __init__(self, total, desc):
+        self.total = total
+        self.desc = desc
+        self.count = 0
+        self.bar = tqdm(total=total or None, desc=desc, unit='f') if tqdm else None
+
+    def update(self, n=1):
+        self.count += n
+        if self.bar is not None:
+            self.bar.update(n)
+        elif self.total and (self.count % 50 == 0 or self.count == self.total):
+            print(f"\r{self.desc}: {self.count}/{self.total}", end='', file=sys.stderr)
+
+    def close(self):
+        if self.bar is not None:
+            self.bar.close()
+        elif self.total:
+            print(file=sys.stderr)
+
+def write_video_csv(csv_path, detections):
+    """Ghi detection từng frame (VideoDetections) ra CSV."""
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['frame', 'track_id', 'class_id', 'x_c', 'y_c', 'w', 'h', 'conf'])
+        for frame_idx in range(len(detections)):
+            frame_dets = detections.get(frame_idx)
+            track_ids = detections.get_track_ids(frame_idx)
+            for det, track_id in zip(frame_dets, track_ids):
+                writer.writerow([frame_idx, int(track_id), int(det[0])] + [f'{v:.6f}' for v in det[1:5]] + [f'{det[5]:.4f}'])
+
+def run_images(model, images, args, class_names, class_colors, temp_dir, cache=None):
+    """Chạy ImagePipeline trên toàn bộ ảnh, ghi nhãn/ảnh kết quả ngay khi có."""
+    labels_dir = os.path.join(args.output, 'labels') if args.save_labels else None
+    images_dir = os.path.join(args.output, 'images')
+    if args.save_images:
+        os.makedirs(images_dir, exist_ok=True)
+
+    stats = {'images': 0, 'detections': 0, 'errors': []}
+    progress = ProgressBar(len(images), 'Ảnh')
+    signals = PipelineSignals()
+
+    def on_result(original_path, image_path, detections, w, h, img):
+        stats['images'] += 1
+        stats['detections'] += len(detections)
+        if args.save_images and img is not None:
+            annotated = draw_detections(img.copy(), detections, class_names, class_colors)
+            ext = os.path.splitext(original_path)[1] or '.jpg'
+            ok, buf = cv2.imencode(ext, annotated)
+            if ok:
+                buf.tofile(os.path.join(images_dir, os.path.basename(original_path)))
+        progress.update()
+
+    def on_file_processed(original_path, image_path, detections, w, h, thumbnail):
+        # Tiến trình con chỉ trả về thumbnail -> giải mã lại khi cần ghi ảnh kết quả
+        img = decode_image(image_path) if args.save_images else None
+        on_result(original_path, image_path, detections, w, h, img)
+
+    signals.result.connect(on_result)
+    signals.file_processed.connect(on_file_processed)
+    signals.error.connect(stats['errors'].append)
+
+    tiling = tiling_config(args.tile, args.tile_overlap, not args.keep_empty_tiles) if args.tile else None
+    start = time.perf_counter()
+    if args.workers > 0:
+        ParallelImagePipeline(args.runtime_model, images, temp_dir, signals, num_workers=args.workers,
+                              batch_size=args.batch_size, label_export_dir=labels_dir, cache=cache,
+                              tiling=tiling).run()
+    else:
+        # is_batch=False -> nhận ảnh đã giải mã đầy đủ để vẽ kết quả
+        pipeline = ImagePipeline(model, images, temp_dir, signals, is_batch=False, batch_size=args.batch_size,
+                                 label_export_dir=labels_dir, cache=cache, tiling=tiling, prefetch=args.prefetch,
+                                 decode_workers=args.decode_workers)
+        pipeline.run()
+        stats['stage_seconds'] = {name: round(value, 3) for name, value in pipeline.stage_seconds.items()}
+        stats['max_queue_depths'] = {'decoded': pipeline.max_queue_depths[0],
+                                     'post': pipeline.max_queue_depths[1], 'capacity': args.prefetch}
+    stats['seconds'] = time.perf_counter() - start
+    progress.close()
+    return stats
+
+def run_video(model, video_path, args, class_names, class_colors, temp_dir, cache=None):
+    """Chạy VideoPipeline cho một video, ghi detection từng frame ra CSV."""
+    base_name = os.path.splitext(os.path.basename(video_path))[0]
+    videos_dir = os.path.join(args.output, 'videos')
+    os.makedirs(videos_dir, exist_ok=True)
+
+    stats = {'frames': 0, 'detections': 0, 'inferred_frames': 0, 'errors': []}
+    state = {'progress': None, 'detections': None}
+    signals = PipelineSignals()
+
+    def on_started(original_path, thumbnail_path, w, h, fps, total_frames):
+        state['progress'] = ProgressBar(total_frames, os.path.basename(original_path))
+
+    def on_frame(original_path, frame_idx, detections, track_ids):
+        if state['progress'] is not None:
+            state['progress'].update()
+
+    def on_processed(original_path, detections):
+        # Trúng cache thì không có video_frame nào, nên đếm từ kết quả cuối
+        state['detections'] = detections
+        stats['frames'] = len(detections)
+        stats['detections'] = len(detections.to_arrays()[0])
+
+    signals.video_started.connect(on_started)
+    signals.video_frame.connect(on_frame)
+    signals.video_processed.connect(on_processed)
+    signals.error.connect(stats['errors'].append)
+
+    tracker = None if args.no_track else ByteTracker()
+    pipeline = VideoPipeline(model, video_path, temp_dir, signals, batch_size=args.batch_size, stride=args.stride,
+                             adaptive=args.adaptive, tracker=tracker, cache=cache,
+                             motion_threshold=args.motion_threshold)
+    start = time.perf_counter()
+    try:
+        pipeline.run()
+    finally:
+        if state['progress'] is not None:
+            state['progress'].close()
+    stats['seconds'] = time.perf_counter() - start
+    stats['inferred_frames'] = pipeline.inferred_frames
+
+    if state['detections'] is not None:
+        write_video_csv(os.path.join(videos_dir, f'{base_name}.csv'), state['detections'])
+
+    if args.save_videos and state['detections'] is not None:
+        save_path = os.path.join(videos_dir, f'{base_name}_detected.mp4')
+        try:
+            export_annotated_video(video_path, save_path, state['detections'], class_names, class_colors)
+        except Exception as e:
+            stats['errors'].append(f"Lỗi ghi video {os.path.basename(save_path)}: {e}")
+    return stats
+
+def run_quantize(model, calibration, evaluation, args):
+    """Tạo model INT8 từ tập hiệu chuẩn, rồi ghi báo cáo so sánh với FP32 trên tập đánh giá riêng."""
+    int8_path = quantize_model(args.model, calibration, progress=print)
+    candidate, _, _ = load_model(int8_path, warmup_runs=0)
+    labels_path = args.labels or DEFAULT_LABELS_PATH
+    class_names = read_class_labels(labels_path) if os.path.exists(labels_path) else model.names
+    report = compare_models(model, candidate, evaluation, class_names)
+    report.update(reference_model=args.model, candidate_model=int8_path,
+                  calibration_images=calibration, eval_images=evaluation)
+    with open(os.path.join(args.output, 'quantization_report.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print(f"Model INT8: {int8_path}")
+    print(f"FP32 {report['ms_per_image']['reference']} ms/ảnh, INT8 {report['ms_per_image']['candidate']} ms/ảnh "
+          f"(x{report['speedup']}), {report['images']} ảnh đánh giá (hiệu chuẩn: {len(calibration)} ảnh khác)")
+    for name, stats in report['classes'].items():
+        print(f"  {name}: recall {stats['recall']}, precision {stats['precision']} "
+              f"({stats['matched']}/{stats['reference']})")
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Nhận diện phương tiện quân sự không cần giao diện.")
+    parser.add_argument('inputs', nargs='+', help="File ảnh/video hoặc thư mục chứa chúng")
+    parser.add_argument('--model', required=True, help="Đường dẫn model YOLOv8 (.pt)")
+    parser.add_argument('--output', default='detections_out', help="Thư mục ghi kết quả")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Số ảnh/frame mỗi lần suy luận")
+    parser.add_argument('--backend', choices=list(INFERENCE_BACKENDS), default=BACKEND_PYTORCH,
+                        help="Backend suy luận; onnx/openvino export .pt một lần và lưu cạnh file trọng số")
+    parser.add_argument('--quantize', action='store_true',
+                        help="Tạo model INT8 (cạnh file .pt, backend pytorch) với các ảnh đầu vào làm tập hiệu chuẩn "
+                             "và so sánh với FP32")
+    parser.add_argument('--eval', help="Thư mục ảnh đánh giá INT8 (mặc định giữ lại "
+                                       f"{int(DEFAULT_EVAL_FRACTION * 100)}%% ảnh đầu vào, không dùng để hiệu chuẩn)")
+    parser.add_argument('--labels', help="File nhãn class cho báo cáo INT8 (mặc định assets/models/coco_labels.txt)")
+    parser.add_argument('--warmup', type=int, default=DEFAULT_WARMUP_RUNS,
+                        help="Số lần suy luận ảnh giả sau khi load model (0 = tắt)")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Số tiến trình suy luận ảnh song song, mỗi tiến trình load model riêng (0 = tắt)")
+    parser.add_argument('--prefetch', type=int, default=DEFAULT_PREFETCH_BATCHES,
+                        help="Số lô ảnh giải mã trước trong khi model chạy (0 = đọc/suy luận tuần tự)")
+    parser.add_argument('--decode-workers', type=int, default=DEFAULT_DECODE_WORKERS,
+                        help="Số luồng đọc + giải mã ảnh")
+    parser.add_argument('--tile', type=int, default=0,
+                        help="Suy luận ảnh theo tile cạnh N px chồng lấn nhau, cho ảnh UAV độ phân giải cao (0 = tắt)")
+    parser.add_argument('--tile-overlap', type=float, default=DEFAULT_TILE_OVERLAP, help="Tỉ lệ chồng lấn giữa các tile")
+    parser.add_argument('--keep-empty-tiles', action='store_true', help="Không bỏ qua các tile gần như đồng màu")
+    parser.add_argument('--stride', type=int, default=1, help="Chỉ suy luận 1 frame mỗi N frame video")
+    parser.add_argument('--adaptive', action='store_true', help="Tự giảm stride khi cảnh thay đổi")
+    parser.add_argument('--motion-threshold', type=float, default=0.0,
+                        help="Chỉ suy luận lại frame khi tỉ lệ pixel thay đổi (0..1) vượt ngưỡng, "
+                             f"VD {DEFAULT_MOTION_THRESHOLD} cho camera tĩnh (0 = tắt)")
+    parser.add_argument('--no-track', action='store_true', help="Không gán track_id cho video")
+    parser.add_argument('--cache-dir', default=DETECTION_CACHE_DIR, help="Thư mục detection cache")
+    parser.add_argument('--no-cache', action='store_true', help="Không dùng detection cache")
+    parser.add_argument('--no-labels', dest='save_labels', action='store_false', help="Không ghi file nhãn YOLO")
+    parser.add_argument('--save-images', action='store_true', help="Ghi ảnh đã vẽ kết quả")
+    parser.add_argument('--save-videos', action='store_true', help="Ghi video đã vẽ kết quả")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    images, videos = collect_inputs(args.inputs)
+    if not images and not videos:
+        print("Không tìm thấy ảnh hoặc video hợp lệ.")
+        return 1
+    os.makedirs(args.output, exist_ok=True)
+
+    if args.quantize:
+        # FP32 tham chiếu phải là chính file .pt, không phải bản export onnx/openvino
+        if args.backend != BACKEND_PYTORCH or not args.model.endswith('.pt'):
+            print("--quantize cần model .pt với --backend pytorch.")
+            return 1
+        try:
+            if args.eval:
+                evaluation = collect_inputs([args.eval])[0]
+                held_out = {os.path.abspath(path) for path in evaluation}
+                calibration = [path for path in images if os.path.abspath(path) not in held_out][:DEFAULT_CALIBRATION_IMAGES]
+                if not calibration or not evaluation:
+                    raise ValueError("Cần ảnh hiệu chuẩn và ảnh trong thư mục --eval.")
+            else:
+                calibration, evaluation = split_calibration(images)
+        except ValueError as e:
+            print(e)
+            return 1
+
+    model, args.runtime_model, timings = load_model(args.model, args.warmup, backend=args.backend)
+    class_names = model.names
+    class_colors = {i: [random.randint(100, 255) for _ in range(3)] for i in class_names.keys()}
+    if args.quantize:
+        return run_quantize(model, calibration, evaluation, args)
+
+    cache = None
+    if not args.no_cache:
+        cache = DetectionCache(args.cache_dir, file_digest(args.model), inference_params(model, args.backend))
+
+    temp_dir = tempfile.mkdtemp(prefix="vehicle_detector_cli_")
+    summary = {'model': args.model, 'backend': args.backend, 'model_export_s': round(timings['export_s'], 3),
+               'model_load_s': round(timings['load_s'], 3),
+               'model_warmup_s': round(timings['warmup_s'], 3), 'errors': []}
+    try:
+        if images:
+            stats = run_images(model, images, args, class_names, class_colors, temp_dir, cache)
+            summary['images'] = stats['images']
+            summary['image_detections'] = stats['detections']
+            summary['image_seconds'] = round(stats['seconds'], 3)
+            summary['images_per_s'] = round(stats['images'] / stats['seconds'], 2) if stats['seconds'] > 0 else 0.0
+            for name in ('stage_seconds', 'max_queue_depths'):
+                if name in stats:
+                    summary[f'image_{name}'] = stats[name]
+            summary['errors'] += stats['errors']
+
+        video_frames, video_seconds = 0, 0.0
+        summary['videos'] = []
+        for video_path in videos:
+            stats = run_video(model, video_path, args, class_names, class_colors, temp_dir, cache)
+            video_frames += stats['frames']
+            video_seconds += stats['seconds']
+            summary['videos'].append({'path': video_path, 'frames': stats['frames'],
+                                      'inferred_frames': stats['inferred_frames'],
+                                      'detections': stats['detections'], 'seconds': round(stats['seconds'], 3)})
+            summary['errors'] += stats['errors']
+        if videos:
+            summary['frames_per_s'] = round(video_frames / video_seconds, 2) if video_seconds > 0 else 0.0
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    with open(os.path.join(args.output, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+
+    if images:
+        print(f"Ảnh: {summary['images']} ảnh, {summary['image_detections']} đối tượng, "
+              f"{summary['images_per_s']} ảnh/s")
+    if videos:
+        print(f"Video: {len(videos)} video, {video_frames} frame, {summary['frames_per_s']} frame/s")
+    for err in summary['errors']:
+        print(err, file=sys.stderr)
+    print(f"Kết quả đã lưu tại: {os.path.abspath(args.output)}")
+    return 1 if summary['errors'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
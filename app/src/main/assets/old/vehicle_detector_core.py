@@ -0,0 +1,2031 @@
+"""Phần xử lý nhận diện không phụ thuộc PyQt.
+
+Dùng chung cho giao diện (vehicle_detector_gui.py, bọc trong QRunnable + pyqtSignal)
+và chế độ dòng lệnh (vehicle_detector_cli.py, dùng tín hiệu dạng callback).
+"""
+import os
+import re
+import cv2
+import numpy as np
+import shutil
+import random
+import json
+import time
+import hashlib
+import importlib.util
+import multiprocessing
+import queue
+import threading
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+# Tùy chọn: ghép cặp Hungarian cho tracker (không có scipy thì dùng greedy)
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+# Số ảnh gộp vào một lần model.predict khi xử lý theo lô
+DEFAULT_BATCH_SIZE = 8
+
+# Số lô ảnh đã giải mã được đọc trước (hàng đợi giới hạn) trong khi model chạy lô hiện tại; 0 = tuần tự
+DEFAULT_PREFETCH_BATCHES = 2
+DEFAULT_DECODE_WORKERS = min(4, os.cpu_count() or 1)
+
+# Ngưỡng IoU của NMS dùng cho mọi lần model.predict
+PREDICT_IOU = 0.7
+
+# Mỗi detection là 1 hàng [class_id, x_c, y_c, w, h, conf] (tọa độ chuẩn hóa 0..1)
+DETECTION_COLUMNS = 6
+EMPTY_DETECTIONS = np.zeros((0, DETECTION_COLUMNS), dtype=np.float32)
+
+def results_to_detections(result):
+    """Lấy box trực tiếp từ tensor của Results thành mảng float32 Nx6."""
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return EMPTY_DETECTIONS
+    dets = np.empty((len(boxes), DETECTION_COLUMNS), dtype=np.float32)
+    dets[:, 0] = boxes.cls.cpu().numpy()
+    dets[:, 1:5] = boxes.xywhn.cpu().numpy()
+    dets[:, 5] = boxes.conf.cpu().numpy()
+    return dets
+
+# Kích thước cạnh dài của thumbnail trong File List
+THUMBNAIL_SIZE = 128
+
+def read_file_bytes(path):
+    """Đọc toàn bộ file thành mảng uint8 (hỗ trợ đường dẫn Unicode), None nếu lỗi hoặc rỗng."""
+    try:
+        data = np.fromfile(path, dtype=np.uint8)
+    except OSError:
+        return None
+    return data if data.size else None
+
+def decode_image(path):
+    """Đọc file và giải mã ảnh đúng một lần."""
+    data = read_file_bytes(path)
+    if data is None:
+        return None
+    return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+def make_thumbnail(img, size=THUMBNAIL_SIZE):
+    """Thu nhỏ ảnh BGR đã giải mã về cạnh dài = size."""
+    h, w = img.shape[:2]
+    scale = size / max(h, w)
+    if scale >= 1:
+        return img.copy()
+    return cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+THUMBNAIL_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "vehicle_detector", "thumbnails")
+
+def thumbnail_cache_path(cache_dir, source_path):
+    """File thumbnail trên đĩa, khóa theo đường dẫn + mtime + kích thước (file nguồn đổi thì tạo lại)."""
+    try:
+        stat = os.stat(source_path)
+        stamp = f"{stat.st_mtime_ns}:{stat.st_size}"
+    except OSError:
+        stamp = ""
+    key = hashlib.blake2b(f"{os.path.abspath(source_path)}|{stamp}".encode('utf-8'), digest_size=16).hexdigest()
+    return os.path.join(cache_dir, key[:2], key + '.jpg')
+
+def write_image(path, img):
+    """Mã hóa theo đuôi file và ghi (hỗ trợ đường dẫn Unicode); trả về True nếu thành công."""
+    ok, buf = cv2.imencode(os.path.splitext(path)[1] or '.jpg', img)
+    if ok:
+        buf.tofile(path)
+    return ok
+
+def volatile_copy(file_path, temp_dir, originals_dir):
+    """Copy file dễ mất (VD: screenshot) vào originals_dir; file đã nằm trong temp_dir thì dùng luôn."""
+    temp_prefix = os.path.normcase(os.path.join(os.path.abspath(temp_dir), ''))
+    if os.path.normcase(os.path.abspath(file_path)).startswith(temp_prefix):
+        return file_path
+    image_path = os.path.join(originals_dir, os.path.basename(file_path))
+    shutil.copy(file_path, image_path)
+    return image_path
+
+def bgr_to_rgb(img_bgr):
+    """Đổi BGR sang mảng RGB liền bộ nhớ (bước nặng của việc chuyển ảnh sang QImage)."""
+    return cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+
+def save_detections_txt(detections, label_path):
+    """Ghi mảng detection ra file nhãn YOLO (class x y w h conf)."""
+    with open(label_path, 'w') as f:
+        for row in detections:
+            f.write(f"{int(row[0])} {row[1]:.6f} {row[2]:.6f} {row[3]:.6f} {row[4]:.6f} {row[5]:.6f}\n")
+
+def detections_to_pixel_boxes(label_data, w, h, clip=False):
+    """Đổi (x_c, y_c, w, h) chuẩn hóa của mảng Nx6 sang góc (x1, y1, x2, y2) pixel int32 trong một phép tính."""
+    if label_data is None or not len(label_data):
+        return np.zeros((0, 4), dtype=np.int32)
+    xywh = np.asarray(label_data, dtype=np.float32)[:, 1:5] * np.array([w, h, w, h], dtype=np.float32)
+    half = xywh[:, 2:] / 2
+    boxes = np.concatenate([xywh[:, :2] - half, xywh[:, :2] + half], axis=1).astype(np.int32)
+    if clip:
+        np.clip(boxes, 0, np.array([w - 1, h - 1, w - 1, h - 1], dtype=np.int32), out=boxes)
+    return boxes
+
+@lru_cache(maxsize=4096)
+def label_text_size(label):
+    """(text_w, text_h, baseline) của nhãn; cache theo chuỗi nhãn (class + conf) vì số tổ hợp có hạn."""
+    (text_w, text_h), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
+    return text_w, text_h, baseline
+
+def layout_labels(boxes, text_sizes, img_h, margin=10):
+    """Vị trí nhãn cho cả mảng: trên box, sát mép trên thì xuống dưới box, tràn mép dưới thì vào trong box.
+
+    Trả về (rect_top, text_y, rect_bottom) dạng mảng int.
+    """
+    y1, y2 = boxes[:, 1], boxes[:, 3]
+    text_h, baseline = text_sizes[:, 1], text_sizes[:, 2]
+
+    rect_top = y1 - text_h - (baseline + 3)
+    text_y = y1 - (baseline // 2) - 3
+
+    below = rect_top < margin
+    rect_top = np.where(below, y2 + 3, rect_top)
+    text_y = np.where(below, y2 + text_h + 3, text_y)
+
+    inside = below & (text_y + baseline > img_h - margin)
+    rect_top = np.where(inside, y1 + 3, rect_top)
+    text_y = np.where(inside, y1 + text_h + 3, text_y)
+    return rect_top, text_y, text_y + baseline
+
+def draw_detections(img_np, label_data, class_names, class_colors, show_box=True, show_class=True, show_conf=True,
+                    track_ids=None):
+    """Vẽ box/nhãn (mảng Nx6 chuẩn hóa) trực tiếp lên ảnh BGR; có track_ids thì nhãn kèm '#id'.
+
+    Đổi tọa độ, cắt theo khung ảnh và bố trí nhãn được tính vectorized cho cả mảng; box cùng class
+    được vẽ bằng một lần cv2.polylines.
+    """
+    if not show_box or label_data is None or not len(label_data):
+        return img_np
+
+    h, w = img_np.shape[:2]
+    label_data = np.asarray(label_data, dtype=np.float32)
+    boxes = detections_to_pixel_boxes(label_data, w, h, clip=True)
+    class_ids = label_data[:, 0].astype(np.int64)
+
+    colors = {class_id: class_colors.setdefault(class_id, [random.randint(0, 255) for _ in range(3)])
+              for class_id in np.unique(class_ids).tolist()}
+    corners = boxes[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+    for class_id, color in colors.items():
+        cv2.polylines(img_np, list(corners[class_ids == class_id]), True, color, 2)
+
+    if not show_class:
+        return img_np
+
+    labels = [f"{class_names.get(class_id, 'Unknown')}" for class_id in class_ids.tolist()]
+    if track_ids is not None and len(track_ids) == len(labels):
+        labels = [f"#{track_id} {label}" if track_id >= 0 else label
+                  for label, track_id in zip(labels, np.asarray(track_ids).tolist())]
+    if show_conf:
+        labels = [f"{label} {conf:.2f}" for label, conf in zip(labels, label_data[:, 5].tolist())]
+
+    text_sizes = np.array([label_text_size(label) for label in labels], dtype=np.int32)
+    rect_top, text_y, rect_bottom = layout_labels(boxes, text_sizes, h)
+    x1 = boxes[:, 0]
+    x2 = x1 + text_sizes[:, 0]
+
+    for label, class_id, left, right, top, bottom, text_pos in zip(labels, class_ids.tolist(), x1.tolist(), x2.tolist(),
+                                                                    rect_top.tolist(), rect_bottom.tolist(), text_y.tolist()):
+        cv2.rectangle(img_np, (left, top), (right, bottom), colors[class_id], -1)
+        cv2.putText(img_np, label, (left, text_pos), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+    return img_np
+
+# Ngưỡng thay đổi cảnh (0..1) để chế độ adaptive quay về suy luận mọi frame
+SCENE_CHANGE_THRESHOLD = 0.08
+
+def scene_signature(frame):
+    """Ảnh xám thu nhỏ dùng để so sánh nhanh mức thay đổi giữa hai frame."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (64, 36), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+def scene_change(signature_a, signature_b):
+    """Mức khác biệt trung bình (0..1) giữa hai chữ ký cảnh."""
+    return float(np.mean(np.abs(signature_a - signature_b))) / 255.0
+
+# Motion gate: tỉ lệ pixel thay đổi (0..1) tối thiểu để suy luận lại một frame
+DEFAULT_MOTION_THRESHOLD = 0.005
+MOTION_PIXEL_DELTA = 20 # Chênh lệch mức xám để coi một pixel (ảnh thu nhỏ) là thay đổi
+MOTION_MAX_SKIP = 150 # Tối đa bấy nhiêu frame liên tiếp dùng lại kết quả cũ rồi bắt buộc suy luận lại
+MOTION_SIZE = (160, 90)
+
+class MotionGate:
+    """Bộ lọc chuyển động rẻ cho camera tĩnh / quay màn hình: quyết định frame nào cần suy luận lại.
+
+    So ảnh xám thu nhỏ (đã làm mờ để bỏ nhiễu nén) của frame hiện tại với frame được suy luận gần nhất
+    - không phải frame liền trước - nên chuyển động chậm vẫn cộng dồn tới ngưỡng. Có ROI thì chỉ xét
+    thay đổi trong ROI.
+    """
+    def __init__(self, threshold=DEFAULT_MOTION_THRESHOLD, rois=None, max_skip=MOTION_MAX_SKIP):
+        self.threshold = float(threshold)
+        self.max_skip = max(1, int(max_skip))
+        self.mask = roi_mask(rois, *MOTION_SIZE) > 0 if rois else None
+        self.inferred = 0
+        self.skipped = 0
+        self._reference = None
+        self._run = 0 # Số frame liên tiếp đã bỏ qua
+
+    @staticmethod
+    def signature(frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        small = cv2.resize(gray, MOTION_SIZE, interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def motion(self, signature):
+        """Tỉ lệ pixel (trong ROI nếu có) thay đổi so với frame suy luận gần nhất."""
+        changed = cv2.absdiff(signature, self._reference) > MOTION_PIXEL_DELTA
+        if self.mask is not None:
+            return float(np.count_nonzero(changed & self.mask)) / max(1, np.count_nonzero(self.mask))
+        return float(np.count_nonzero(changed)) / changed.size
+
+    def should_infer(self, frame):
+        signature = self.signature(frame)
+        if self._reference is None or self._run >= self.max_skip or self.motion(signature) >= self.threshold:
+            self._reference = signature
+            self._run = 0
+            self.inferred += 1
+            return True
+        self._run += 1
+        self.skipped += 1
+        return False
+
+def box_iou_matrix(boxes_a, boxes_b):
+    """Ma trận IoU NxM giữa hai tập box dạng (x_c, y_c, w, h), tính vector hóa."""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    a1, a2 = a[:, :2] - a[:, 2:] / 2, a[:, :2] + a[:, 2:] / 2
+    b1, b2 = b[:, :2] - b[:, 2:] / 2, b[:, :2] + b[:, 2:] / 2
+    wh = np.clip(np.minimum(a2[:, None], b2[None]) - np.maximum(a1[:, None], b1[None]), 0, None)
+    inter = wh[..., 0] * wh[..., 1]
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None] - inter
+    return inter / np.maximum(union, 1e-9)
+
+def interpolate_detections(dets_start, dets_end, t):
+    """Nội suy detection giữa hai keyframe (t trong 0..1).
+
+    Box được ghép theo class + IoU lớn nhất; box không ghép được thì giữ nguyên (carry forward).
+    """
+    if not len(dets_start) or not len(dets_end):
+        return dets_start
+    iou = box_iou_matrix(dets_start[:, 1:5], dets_end[:, 1:5])
+    iou[dets_start[:, 0][:, None] != dets_end[:, 0][None]] = 0
+    best = iou.argmax(axis=1)
+    matched = iou[np.arange(len(dets_start)), best] > 0.1
+
+    out = dets_start.copy()
+    out[matched, 1:6] = (1 - t) * dets_start[matched, 1:6] + t * dets_end[best[matched], 1:6]
+    return out
+
+class VideoDetections:
+    """Detection theo frame của một video: một mảng Nx6 liền khối + offset cho từng frame.
+
+    Song song với mỗi hàng detection là track_id (-1 nếu không theo dõi).
+    """
+    def __init__(self):
+        self._data = np.zeros((64, DETECTION_COLUMNS), dtype=np.float32)
+        self._track_ids = np.full(64, -1, dtype=np.int64)
+        self._offsets = np.zeros(64, dtype=np.int64)
+        self._size = 0
+        self._frames = 0
+
+    def __len__(self):
+        return self._frames
+
+    def append(self, detections, track_ids=None):
+        """Thêm detection của frame kế tiếp (frame đã suy luận theo thứ tự)."""
+        n = len(detections)
+        end = self._size + n
+        if end > len(self._data):
+            capacity = max(end, 2 * len(self._data))
+            grown = np.zeros((capacity, DETECTION_COLUMNS), dtype=np.float32)
+            grown[:self._size] = self._data[:self._size]
+            self._data = grown
+            grown_ids = np.full(capacity, -1, dtype=np.int64)
+            grown_ids[:self._size] = self._track_ids[:self._size]
+            self._track_ids = grown_ids
+        if self._frames + 2 > len(self._offsets):
+            self._offsets = np.concatenate([self._offsets, np.zeros(len(self._offsets), dtype=np.int64)])
+
+        self._data[self._size:end] = detections
+        self._track_ids[self._size:end] = -1 if track_ids is None else track_ids
+        self._size = end
+        self._frames += 1
+        self._offsets[self._frames] = end
+
+    def to_arrays(self):
+        """(data Nx6, track_ids N, offsets frames+1) - bản gọn để ghi ra đĩa."""
+        return (self._data[:self._size], self._track_ids[:self._size], self._offsets[:self._frames + 1])
+
+    @classmethod
+    def from_arrays(cls, data, track_ids, offsets):
+        """Dựng lại từ kết quả của to_arrays()."""
+        detections = cls()
+        detections._data = np.ascontiguousarray(data, dtype=np.float32).reshape(-1, DETECTION_COLUMNS)
+        detections._track_ids = np.ascontiguousarray(track_ids, dtype=np.int64)
+        detections._offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+        detections._size = len(detections._data)
+        detections._frames = len(detections._offsets) - 1
+        return detections
+
+    def get(self, frame_idx):
+        """Mảng Nx6 của frame frame_idx (rỗng nếu frame chưa được xử lý)."""
+        if frame_idx < 0 or frame_idx >= self._frames:
+            return EMPTY_DETECTIONS
+        return self._data[self._offsets[frame_idx]:self._offsets[frame_idx + 1]]
+
+    def get_track_ids(self, frame_idx):
+        """track_id của từng detection trong frame frame_idx."""
+        if frame_idx < 0 or frame_idx >= self._frames:
+            return np.zeros(0, dtype=np.int64)
+        return self._track_ids[self._offsets[frame_idx]:self._offsets[frame_idx + 1]]
+
+    def unique_class_counts(self):
+        """Số phương tiện (track) khác nhau theo class - {class_id: count}."""
+        ids = self._track_ids[:self._size]
+        tracked = ids >= 0
+        if not tracked.any():
+            return {}
+        classes = self._data[:self._size, 0].astype(np.int64)[tracked]
+        _, first = np.unique(ids[tracked], return_index=True)
+        counts = np.bincount(classes[first])
+        return {class_id: int(n) for class_id, n in enumerate(counts) if n}
+
+class FileRecord:
+    """Thông tin một file trong danh sách (ảnh hoặc video).
+
+    Dùng __slots__ thay cho dict để mỗi file chỉ tốn vài con trỏ; detection của ảnh nằm trong
+    DetectionStore (tra theo file_id), detection của video nằm trong VideoDetections riêng.
+    """
+    __slots__ = ('file_id', 'kind', 'image_path', 'source_path', 'thumbnail_path', 'width', 'height',
+                 'save_status', 'detections', 'processing', 'fps', 'total_frames')
+
+    def __init__(self, file_id, kind, width=0, height=0, image_path=None, source_path=None, thumbnail_path=None,
+                 detections=None, processing=False, fps=0.0, total_frames=0):
+        self.file_id = file_id
+        self.kind = kind # 'image' | 'video'
+        self.image_path = image_path
+        self.source_path = source_path
+        self.thumbnail_path = thumbnail_path
+        self.width = width
+        self.height = height
+        self.save_status = False
+        self.detections = detections # VideoDetections (chỉ với video)
+        self.processing = processing
+        self.fps = fps
+        self.total_frames = total_frames
+
+class DetectionStore:
+    """Detection của mọi ảnh trong phiên, lưu theo cột liền khối thay vì một mảng nhỏ cho mỗi file.
+
+    Các cột file_id (int32), class_id (int16), box (Nx4 float32, xc yc w h chuẩn hóa) và conf (float32)
+    tốn ~26 byte/detection; mỗi file chiếm một đoạn [start, end) liên tục, tra theo file_id.
+    Ghi lại file đã có thì đoạn cũ bị bỏ, được dồn lại khi số hàng bỏ vượt số hàng còn dùng.
+    """
+    def __init__(self, capacity=1024):
+        self._file_ids = np.zeros(capacity, dtype=np.int32)
+        self._class_ids = np.zeros(capacity, dtype=np.int16)
+        self._boxes = np.zeros((capacity, 4), dtype=np.float32)
+        self._confs = np.zeros(capacity, dtype=np.float32)
+        self._starts = np.full(64, -1, dtype=np.int64) # theo file_id, -1 = chưa có
+        self._ends = np.full(64, -1, dtype=np.int64)
+        self._size = 0
+        self._dead = 0
+
+    def __len__(self):
+        """Số detection còn dùng."""
+        return self._size - self._dead
+
+    def __contains__(self, file_id):
+        return 0 <= file_id < len(self._starts) and self._starts[file_id] >= 0
+
+    def _grow_rows(self, needed):
+        capacity = max(needed, 2 * len(self._confs), 1024)
+        for name in ('_file_ids', '_class_ids', '_boxes', '_confs'):
+            column = getattr(self, name)
+            grown = np.zeros((capacity,) + column.shape[1:], dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            setattr(self, name, grown)
+
+    def _grow_files(self, file_id):
+        capacity = max(file_id + 1, 2 * len(self._starts))
+        self._starts = np.concatenate([self._starts, np.full(capacity - len(self._starts), -1, dtype=np.int64)])
+        self._ends = np.concatenate([self._ends, np.full(capacity - len(self._ends), -1, dtype=np.int64)])
+
+    def add(self, file_id, detections):
+        """Ghi detection (mảng Nx6) của file file_id, thay cho kết quả cũ nếu có."""
+        if file_id >= len(self._starts):
+            self._grow_files(file_id)
+        if self._starts[file_id] >= 0:
+            self._dead += int(self._ends[file_id] - self._starts[file_id])
+
+        n = len(detections)
+        end = self._size + n
+        if end > len(self._confs):
+            self._grow_rows(end)
+        rows = slice(self._size, end)
+        self._file_ids[rows] = file_id
+        if n:
+            self._class_ids[rows] = detections[:, 0]
+            self._boxes[rows] = detections[:, 1:5]
+            self._confs[rows] = detections[:, 5]
+        self._starts[file_id] = self._size
+        self._ends[file_id] = end
+        self._size = end
+
+        if self._dead > len(self):
+            self.compact()
+
+    def remove(self, file_id):
+        """Bỏ detection của file file_id (các hàng thành hàng bỏ, được dồn lại như khi ghi đè)."""
+        if file_id not in self:
+            return
+        self._dead += int(self._ends[file_id] - self._starts[file_id])
+        self._starts[file_id] = -1
+        self._ends[file_id] = -1
+        if self._dead > len(self):
+            self.compact()
+
+    def to_arrays(self):
+        """(file_ids, class_ids, boxes, confs, starts, ends) đã dồn gọn - bản để ghi ra đĩa."""
+        self.compact()
+        n = self._size
+        return (self._file_ids[:n], self._class_ids[:n], self._boxes[:n], self._confs[:n], self._starts, self._ends)
+
+    @classmethod
+    def from_arrays(cls, file_ids, class_ids, boxes, confs, starts, ends):
+        """Dựng lại từ kết quả của to_arrays() (có thể là mảng memory-map, không sao chép)."""
+        store = cls(capacity=0)
+        store._file_ids, store._class_ids, store._boxes, store._confs = file_ids, class_ids, boxes, confs
+        store._starts, store._ends = starts, ends
+        store._size = len(confs)
+        return store
+
+    def get(self, file_id):
+        """Mảng Nx6 [class, xc, yc, w, h, conf] của file file_id (rỗng nếu chưa có)."""
+        if file_id not in self:
+            return EMPTY_DETECTIONS
+        start, end = self._starts[file_id], self._ends[file_id]
+        out = np.empty((end - start, DETECTION_COLUMNS), dtype=np.float32)
+        out[:, 0] = self._class_ids[start:end]
+        out[:, 1:5] = self._boxes[start:end]
+        out[:, 5] = self._confs[start:end]
+        return out
+
+    def class_counts(self, file_id=None):
+        """{class_id: số box} của một file, hoặc của cả phiên nếu file_id là None."""
+        if file_id is None:
+            class_ids = self._class_ids[:self._size][self._live_mask()]
+        elif file_id in self:
+            class_ids = self._class_ids[self._starts[file_id]:self._ends[file_id]]
+        else:
+            return {}
+        counts = np.bincount(class_ids.astype(np.int64))
+        return {class_id: int(n) for class_id, n in enumerate(counts) if n}
+
+    def _live_mask(self):
+        """Hàng nào còn thuộc đoạn hiện hành của file sở hữu nó."""
+        rows = np.arange(self._size)
+        owners = self._file_ids[:self._size]
+        return (rows >= self._starts[owners]) & (rows < self._ends[owners])
+
+    def compact(self):
+        """Dồn các hàng còn dùng về đầu mảng, bỏ các đoạn đã bị ghi đè."""
+        if not self._dead:
+            return
+        keep = self._live_mask()
+        removed_before = np.concatenate([[0], np.cumsum(~keep)])
+        for name in ('_file_ids', '_class_ids', '_boxes', '_confs'):
+            column = getattr(self, name)
+            column[:len(self)] = column[:self._size][keep]
+        valid = self._starts >= 0
+        self._starts[valid] -= removed_before[self._starts[valid]]
+        self._ends[valid] -= removed_before[self._ends[valid]]
+        self._size = len(self)
+        self._dead = 0
+
+    def clear(self):
+        self._starts[:] = -1
+        self._ends[:] = -1
+        self._size = 0
+        self._dead = 0
+
+def match_by_iou(iou, threshold):
+    """Ghép cặp hàng/cột của ma trận IoU (Hungarian nếu có scipy, ngược lại greedy theo IoU giảm dần)."""
+    if iou.size == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(-iou)
+        keep = iou[rows, cols] >= threshold
+        return np.stack([rows[keep], cols[keep]], axis=1).astype(np.int64)
+
+    cand_rows, cand_cols = np.nonzero(iou >= threshold)
+    order = np.argsort(-iou[cand_rows, cand_cols], kind='stable')
+    used_rows, used_cols, pairs = set(), set(), []
+    for k in order:
+        r, c = cand_rows[k], cand_cols[k]
+        if r not in used_rows and c not in used_cols:
+            used_rows.add(r)
+            used_cols.add(c)
+            pairs.append((r, c))
+    return np.array(pairs, dtype=np.int64).reshape(-1, 2)
+
+class ByteTracker:
+    """Theo dõi đa đối tượng kiểu ByteTrack (giống ByteTrackManager.kt phía Android).
+
+    Ghép lần 1 với detection conf cao, lần 2 với detection conf thấp; chi phí là ma trận IoU
+    (cùng class) giữa vị trí dự đoán của track và detection. Trạng thái track lưu dạng mảng.
+    """
+    def __init__(self, track_buffer=30, high_thresh=0.5, low_thresh=0.1, match_iou=0.3):
+        self.track_buffer = track_buffer
+        self.high_thresh = high_thresh
+        self.low_thresh = low_thresh
+        self.match_iou = match_iou
+        self.next_id = 1
+
+        self.boxes = np.zeros((0, 4), dtype=np.float32) # x_c, y_c, w, h (chuẩn hóa)
+        self.velocity = np.zeros((0, 4), dtype=np.float32) # thay đổi mỗi frame
+        self.classes = np.zeros(0, dtype=np.float32)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.last_seen = np.zeros(0, dtype=np.int64)
+
+    def _associate(self, predicted, track_idx, detections, det_idx):
+        if not len(track_idx) or not len(det_idx):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        iou = box_iou_matrix(predicted[track_idx], detections[det_idx, 1:5])
+        iou[self.classes[track_idx][:, None] != detections[det_idx, 0][None]] = 0
+        pairs = match_by_iou(iou, self.match_iou)
+        return track_idx[pairs[:, 0]], det_idx[pairs[:, 1]]
+
+    def update(self, detections, frame_idx):
+        """Cập nhật với detection Nx6 của frame frame_idx, trả về track_id cho từng detection (-1 = chưa có track)."""
+        # Mỗi track dự đoán theo số frame kể từ lần cuối được thấy (track bị che vẫn tiếp tục di chuyển)
+        elapsed = np.maximum(frame_idx - self.last_seen, 1).astype(np.float32)[:, None]
+
+        track_ids = np.full(len(detections), -1, dtype=np.int64)
+        predicted = self.boxes + self.velocity * elapsed
+        conf = detections[:, 5]
+        high = np.flatnonzero(conf >= self.high_thresh)
+        low = np.flatnonzero((conf >= self.low_thresh) & (conf < self.high_thresh))
+
+        all_tracks = np.arange(len(self.ids))
+        t1, d1 = self._associate(predicted, all_tracks, detections, high)
+        remaining = np.setdiff1d(all_tracks, t1)
+        t2, d2 = self._associate(predicted, remaining, detections, low)
+
+        matched_t = np.concatenate([t1, t2])
+        matched_d = np.concatenate([d1, d2])
+        if len(matched_t):
+            new_boxes = detections[matched_d, 1:5]
+            step = (new_boxes - self.boxes[matched_t]) / elapsed[matched_t]
+            self.velocity[matched_t] = 0.5 * self.velocity[matched_t] + 0.5 * step
+            self.boxes[matched_t] = new_boxes
+            self.last_seen[matched_t] = frame_idx
+            track_ids[matched_d] = self.ids[matched_t]
+
+        # Detection conf cao chưa ghép được -> track mới
+        new_d = np.setdiff1d(high, d1)
+        if len(new_d):
+            new_ids = np.arange(self.next_id, self.next_id + len(new_d), dtype=np.int64)
+            self.next_id += len(new_d)
+            self.boxes = np.concatenate([self.boxes, detections[new_d, 1:5]])
+            self.velocity = np.concatenate([self.velocity, np.zeros((len(new_d), 4), dtype=np.float32)])
+            self.classes = np.concatenate([self.classes, detections[new_d, 0]])
+            self.ids = np.concatenate([self.ids, new_ids])
+            self.last_seen = np.concatenate([self.last_seen, np.full(len(new_d), frame_idx, dtype=np.int64)])
+            track_ids[new_d] = new_ids
+
+        # Bỏ các track đã mất quá track_buffer frame
+        keep = (frame_idx - self.last_seen) <= self.track_buffer
+        if not keep.all():
+            self.boxes, self.velocity = self.boxes[keep], self.velocity[keep]
+            self.classes, self.ids, self.last_seen = self.classes[keep], self.ids[keep], self.last_seen[keep]
+
+        return track_ids
+
+def create_video_thumbnail(video_path, thumbnail_path):
+    """Lấy frame ở 1/3 video làm thumbnail (kèm nút play mờ), trả về (thumbnail_path|None, w, h)."""
+    width, height = 0, 0
+    
+    try:
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            return None, 0, 0
+        
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        thumb_frame = max(1, total_frames // 3)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, thumb_frame) 
+        
+        ret, frame = cap.read()
+        cap.release()
+        
+        if not ret:
+            return None, width, height
+
+        h, w = frame.shape[:2]
+        center_x, center_y = w // 2, h // 2
+        size = min(w, h) // 4
+        points = np.array([
+            [center_x - size // 2 + 5, center_y - size // 2],
+            [center_x + size // 2 + 5, center_y],
+            [center_x - size // 2 + 5, center_y + size // 2],
+        ], dtype=np.int32)
+        overlay = frame.copy()
+        cv2.fillPoly(overlay, [points], (255, 255, 255))
+        alpha = 180 / 255
+        frame = cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0)
+
+        ok, buf = cv2.imencode('.jpg', frame)
+        if not ok:
+            return None, width, height
+        buf.tofile(thumbnail_path)
+        return thumbnail_path, width, height
+
+    except Exception as e:
+        print(f"Lỗi tạo thumbnail: {e}")
+        return None, width, height
+
+def export_annotated_video(source_path, save_path, detections, class_names, class_colors,
+                           show_box=True, show_class=True, show_conf=True):
+    """Đọc video gốc, vẽ detection (VideoDetections) lên từng frame và ghi ra save_path (mp4v)."""
+    cap = None
+    writer = None
+    try:
+        cap = cv2.VideoCapture(source_path)
+        if not cap.isOpened():
+            raise IOError(f"Không thể mở video {os.path.basename(source_path)}")
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if fps <= 0: fps = 30
+        w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+        writer = cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+        if not writer.isOpened():
+            raise Exception("Không thể khởi tạo VideoWriter.")
+
+        frame_idx = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            draw_detections(frame, detections.get(frame_idx), class_names, class_colors, show_box, show_class, show_conf,
+                            track_ids=detections.get_track_ids(frame_idx))
+            writer.write(frame)
+            frame_idx += 1
+        return frame_idx
+    finally:
+        if cap is not None:
+            cap.release()
+        if writer is not None:
+            writer.release()
+
+# --- Suy luận theo tile (SAHI) cho ảnh độ phân giải cao ---
+
+DEFAULT_TILE_SIZE = 640
+DEFAULT_TILE_OVERLAP = 0.2
+TILE_MERGE_THRESHOLD = 0.6 # Ngưỡng giao / box nhỏ hơn để gộp box trùng ở mép tile
+EMPTY_TILE_STD = 6.0 # Độ lệch chuẩn mức sáng dưới ngưỡng -> tile gần như đồng màu (trời, mặt nước)
+
+def tiling_config(tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_TILE_OVERLAP, skip_empty=True):
+    """Tham số suy luận theo tile (dict để đưa thẳng vào khóa cache); None = tắt."""
+    return {'tile_size': int(tile_size), 'overlap': float(overlap), 'skip_empty': bool(skip_empty)}
+
+def tile_grid(w, h, tile_size, overlap):
+    """Mảng Kx4 (x0, y0, x1, y1) các tile chồng lấn phủ kín ảnh; tile cuối mỗi hàng/cột áp sát mép."""
+    step = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return np.zeros(1, dtype=np.int64)
+        return np.append(np.arange(0, length - tile_size, step), length - tile_size)
+
+    x0, y0 = (grid.ravel() for grid in np.meshgrid(starts(w), starts(h)))
+    return np.stack([x0, y0, np.minimum(x0 + tile_size, w), np.minimum(y0 + tile_size, h)], axis=1)
+
+def tile_is_empty(tile, threshold=EMPTY_TILE_STD):
+    """Tile gần như đồng màu thì bỏ qua; ước lượng trên ảnh lấy mẫu thưa cho rẻ."""
+    return float(tile[::8, ::8].std()) < threshold
+
+def _overlap_pairs(b, c, threshold, metric):
+    """Ma trận bool NxN (tam giác trên): cặp box cùng class chồng lấn quá ngưỡng, box đã xếp theo score giảm dần.
+
+    metric='iou' hoặc 'ios' (giao / box nhỏ hơn - nhận ra box bị cắt ở mép tile nằm trong box đầy đủ).
+    """
+    wh = np.clip(np.minimum(b[:, None, 2:], b[None, :, 2:]) - np.maximum(b[:, None, :2], b[None, :, :2]), 0, None)
+    inter = wh[..., 0] * wh[..., 1]
+    area = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    if metric == 'ios':
+        denom = np.minimum(area[:, None], area[None])
+    else:
+        denom = area[:, None] + area[None] - inter
+    return np.triu((inter / np.maximum(denom, 1e-9) > threshold) & (c[:, None] == c[None]), k=1)
+
+def nms(boxes, scores, classes, threshold, metric='iou'):
+    """NMS theo class trên box (x0, y0, x1, y1); trả về chỉ số box giữ lại, theo score giảm dần."""
+    if not len(boxes):
+        return np.zeros(0, dtype=np.int64)
+    order = np.argsort(-scores, kind='stable')
+    # Hàng i: các box điểm thấp hơn i, cùng class, chồng lấn quá ngưỡng
+    suppress = _overlap_pairs(boxes[order], classes[order], threshold, metric)
+    keep = np.ones(len(order), dtype=bool)
+    for i in range(len(order)):
+        if keep[i]:
+            keep[suppress[i]] = False
+    return order[keep]
+
+def merge_boxes(boxes, scores, classes, threshold, metric='ios'):
+    """Gộp kiểu NMM theo class: box điểm cao nhất hút các box chồng lấn với nó và lấy hình chữ nhật bao cả nhóm.
+
+    Khác NMS, box đầy đủ không bị box bị cắt ở mép tile (điểm cao hơn) loại bỏ mà được gộp vào kết quả.
+    Trả về (box Kx4 đã gộp, chỉ số box đại diện của từng nhóm - class/score lấy theo box này).
+    """
+    if not len(boxes):
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.int64)
+    order = np.argsort(-scores, kind='stable')
+    b = boxes[order]
+    pairs = _overlap_pairs(b, classes[order], threshold, metric)
+    merged = b.copy()
+    used = np.zeros(len(b), dtype=bool)
+    keep = []
+    for i in range(len(b)):
+        if used[i]:
+            continue
+        group = np.flatnonzero(pairs[i] & ~used)
+        if len(group):
+            used[group] = True
+            merged[i, :2] = np.minimum(b[i, :2], b[group, :2].min(axis=0))
+            merged[i, 2:] = np.maximum(b[i, 2:], b[group, 2:].max(axis=0))
+        keep.append(i)
+    return merged[keep], order[keep]
+
+def predict_tiled(model, img, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_TILE_OVERLAP, skip_empty=True,
+                  merge_threshold=TILE_MERGE_THRESHOLD):
+    """Suy luận SAHI: các tile chồng lấn (kèm nguyên khung để giữ vật thể lớn) chạy trong một batch,
+    box được đổi về toạ độ chuẩn hóa của ảnh gốc rồi gộp trùng lặp (merge_boxes). Trả về mảng Nx6."""
+    h, w = img.shape[:2]
+    if w <= tile_size and h <= tile_size:
+        return results_to_detections(model.predict(img, save=False, verbose=False, iou=PREDICT_IOU)[0])
+
+    tiles = tile_grid(w, h, tile_size, overlap)
+    crops = [img[y0:y1, x0:x1] for x0, y0, x1, y1 in tiles.tolist()]
+    if skip_empty:
+        keep = [i for i, crop in enumerate(crops) if not tile_is_empty(crop)]
+        tiles, crops = tiles[keep], [crops[i] for i in keep]
+    regions = np.vstack([tiles.reshape(-1, 4), [[0, 0, w, h]]]).astype(np.float32)
+
+    results = model.predict(crops + [img], save=False, verbose=False, iou=PREDICT_IOU)
+    return _regions_to_image([results_to_detections(result) for result in results], regions, w, h, merge_threshold)
+
+def _regions_to_image(parts, regions, w, h, merge_threshold=TILE_MERGE_THRESHOLD):
+    """Đổi detection của các vùng cắt (chuẩn hóa theo vùng) về toạ độ chuẩn hóa của ảnh gốc w x h.
+
+    Nhiều vùng chồng lấn thì box trùng được gộp bằng merge_boxes (box bị cắt ở mép tile gộp vào box
+    đầy đủ); một vùng duy nhất giữ nguyên kết quả của model.
+    """
+    counts = [len(dets) for dets in parts]
+    if not sum(counts):
+        return EMPTY_DETECTIONS
+    dets = np.concatenate(parts)
+    region = np.repeat(np.asarray(regions, dtype=np.float32).reshape(-1, 4), counts, axis=0)
+    size = region[:, 2:] - region[:, :2]
+    dets[:, 1:3] = (region[:, :2] + dets[:, 1:3] * size) / np.array([w, h], dtype=np.float32)
+    dets[:, 3:5] = dets[:, 3:5] * size / np.array([w, h], dtype=np.float32)
+    if len(parts) == 1:
+        return dets
+
+    scale = np.array([w, h], dtype=np.float32)
+    half = dets[:, 3:5] / 2
+    corners = np.concatenate([dets[:, 1:3] - half, dets[:, 1:3] + half], axis=1) * np.tile(scale, 2)
+    merged, keep = merge_boxes(corners, dets[:, 5], dets[:, 0], merge_threshold)
+    out = dets[keep]
+    out[:, 1:3] = (merged[:, :2] + merged[:, 2:]) / 2 / scale
+    out[:, 3:5] = (merged[:, 2:] - merged[:, :2]) / scale
+    return out
+
+# --- Vùng quan tâm (ROI): chỉ suy luận trong các polygon người dùng vẽ ---
+
+ROI_STORE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "vehicle_detector", "rois.json")
+ROI_FILL = 114 # Màu phủ phần ngoài polygon trong vùng cắt (giống màu pad của letterbox)
+
+def roi_polygons_px(rois, w, h):
+    """ROI (list polygon, toạ độ chuẩn hóa) -> list mảng Kx2 int32 pixel cho cv2."""
+    scale = np.array([w, h], dtype=np.float32)
+    return [np.round(np.asarray(polygon, dtype=np.float32).reshape(-1, 2) * scale).astype(np.int32) for polygon in rois]
+
+def roi_mask(rois, w, h):
+    mask = np.zeros((h, w), dtype=np.uint8)
+    cv2.fillPoly(mask, roi_polygons_px(rois, w, h), 255)
+    return mask
+
+def roi_regions(rois, w, h):
+    """Mảng Kx4 (x0, y0, x1, y1) hình chữ nhật bao từng ROI, cắt theo mép ảnh; ROI quá nhỏ bị bỏ."""
+    regions = []
+    for polygon in roi_polygons_px(rois, w, h):
+        x0, y0 = np.clip(polygon.min(axis=0), 0, (w, h)).tolist()
+        x1, y1 = np.clip(polygon.max(axis=0) + 1, 0, (w, h)).tolist()
+        if x1 - x0 >= 2 and y1 - y0 >= 2:
+            regions.append((x0, y0, x1, y1))
+    return np.array(regions, dtype=np.int64).reshape(-1, 4)
+
+def roi_keep(detections, mask):
+    """Mảng bool: detection nào có tâm nằm trong ROI (mask HxW khác 0)."""
+    h, w = mask.shape
+    xs = np.clip((detections[:, 1] * w).astype(np.int64), 0, w - 1)
+    ys = np.clip((detections[:, 2] * h).astype(np.int64), 0, h - 1)
+    return mask[ys, xs] > 0
+
+def detections_in_roi(detections, mask):
+    """Chỉ giữ detection có tâm nằm trong ROI."""
+    if not len(detections):
+        return detections
+    return detections[roi_keep(detections, mask)]
+
+def predict_roi_batch(model, images, rois_list, tiling=None, merge_threshold=TILE_MERGE_THRESHOLD):
+    """Suy luận chỉ trong ROI, trả về list mảng Nx6 theo thứ tự images.
+
+    Mỗi ảnh được cắt theo hình chữ nhật bao của từng ROI (phần ngoài polygon tô màu nền) và mọi vùng cắt
+    của cả lô chạy trong một lần predict; box đổi về toạ độ ảnh gốc, detection có tâm ngoài ROI bị bỏ.
+    Ảnh không có ROI (None/rỗng) được suy luận nguyên khung.
+    """
+    crops, owners, regions, masks = [], [], [], []
+    for i, (img, rois) in enumerate(zip(images, rois_list)):
+        h, w = img.shape[:2]
+        mask = roi_mask(rois, w, h) if rois else None
+        masks.append(mask)
+        if mask is None:
+            crops.append(img)
+            owners.append(i)
+            regions.append((0, 0, w, h))
+            continue
+        for x0, y0, x1, y1 in roi_regions(rois, w, h).tolist():
+            crop = img[y0:y1, x0:x1].copy()
+            crop[mask[y0:y1, x0:x1] == 0] = ROI_FILL
+            crops.append(crop)
+            owners.append(i)
+            regions.append((x0, y0, x1, y1))
+
+    if tiling:
+        parts = [predict_tiled(model, crop, **tiling) for crop in crops]
+    elif crops:
+        parts = [results_to_detections(r) for r in model.predict(crops, save=False, verbose=False, iou=PREDICT_IOU)]
+    else:
+        parts = []
+
+    owners = np.asarray(owners, dtype=np.int64)
+    detections = []
+    for i, img in enumerate(images):
+        h, w = img.shape[:2]
+        idx = np.nonzero(owners == i)[0].tolist()
+        dets = _regions_to_image([parts[k] for k in idx], [regions[k] for k in idx], w, h, merge_threshold)
+        detections.append(detections_in_roi(dets, masks[i]) if masks[i] is not None else dets)
+    return detections
+
+class RoiStore:
+    """ROI của từng file ảnh/video (list polygon, toạ độ chuẩn hóa 0..1), lưu bền vững trong một file JSON."""
+    def __init__(self, path=ROI_STORE_PATH):
+        self.path = path
+        self._rois = {} # đường dẫn tuyệt đối -> [[[x, y], ...], ...]
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self._rois = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def get(self, file_path):
+        return self._rois.get(os.path.abspath(file_path), [])
+
+    def set(self, file_path, rois):
+        key = os.path.abspath(file_path)
+        if rois:
+            self._rois[key] = [[[round(float(x), 5), round(float(y), 5)] for x, y in polygon] for polygon in rois]
+        else:
+            self._rois.pop(key, None)
+        self.save()
+
+    def snapshot(self, file_paths):
+        """{path: rois} của các file có ROI - bản sao để chuyển cho worker."""
+        return {path: rois for path, rois in ((p, self.get(p)) for p in file_paths) if rois}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._rois, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+# --- Cache detection trên đĩa (theo nội dung file) ---
+
+DETECTION_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "vehicle_detector", "detections")
+DETECTION_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+def buffer_digest(data):
+    """Hash nội dung của một buffer đã đọc sẵn."""
+    return hashlib.blake2b(memoryview(data), digest_size=16).hexdigest()
+
+def file_digest(path, chunk_size=1 << 20):
+    """Hash nội dung file, đọc theo từng khối (dùng cho video và trọng số model)."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def inference_params(model, backend=None):
+    """Các tham số suy luận ảnh hưởng tới kết quả (thành phần của khóa cache).
+
+    backend khác PyTorch cho kết quả lệch chút ít nên được đưa vào khóa; PyTorch giữ nguyên khóa cũ.
+    """
+    overrides = getattr(model, 'overrides', None) or {}
+    params = {'iou': PREDICT_IOU, 'conf': overrides.get('conf', 0.25), 'imgsz': overrides.get('imgsz', 640)}
+    if backend and backend != BACKEND_PYTORCH:
+        params['backend'] = backend
+    return params
+
+class DetectionCache:
+    """Cache detection trên đĩa, khóa = hash nội dung file + hash trọng số model + tham số suy luận.
+
+    Mỗi mục là một file .npy (ảnh) hoặc .npz (video). mtime được cập nhật khi đọc trúng và dùng
+    làm thứ tự LRU; khi tổng dung lượng vượt max_bytes thì xóa các mục cũ nhất.
+    """
+    def __init__(self, cache_dir, model_hash, params, max_bytes=DETECTION_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.model_hash = model_hash
+        self.params = dict(params)
+        self.max_bytes = max_bytes
+        self._size = None # Tổng dung lượng, chỉ quét thư mục ở lần ghi đầu tiên
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, content_digest, **extra):
+        payload = json.dumps({'file': content_digest, 'model': self.model_hash, 'params': self.params, **extra},
+                             sort_keys=True)
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+    def _path(self, key, ext):
+        return os.path.join(self.cache_dir, key[:2], key + ext)
+
+    def get(self, key):
+        """Mảng Nx6 đã cache của một ảnh, None nếu chưa có."""
+        path = self._path(key, '.npy')
+        try:
+            detections = np.load(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return detections
+
+    def put(self, key, detections):
+        self._write(key, '.npy', lambda f: np.save(f, np.ascontiguousarray(detections, dtype=np.float32)))
+
+    def get_video(self, key):
+        """VideoDetections đã cache của một video, None nếu chưa có."""
+        path = self._path(key, '.npz')
+        try:
+            with np.load(path) as archive:
+                detections = VideoDetections.from_arrays(archive['data'], archive['track_ids'], archive['offsets'])
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            return None
+        return detections
+
+    def put_video(self, key, detections):
+        data, track_ids, offsets = detections.to_arrays()
+        self._write(key, '.npz', lambda f: np.savez(f, data=data, track_ids=track_ids, offsets=offsets))
+
+    def _write(self, key, ext, writer):
+        """Ghi qua file tạm rồi os.replace để các tiến trình khác không đọc phải file ghi dở."""
+        path = self._path(key, ext)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                writer(f)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            print(f"Không ghi được cache {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        if self._size is None:
+            self._size = sum(entry[1] for entry in self._entries())
+        else:
+            self._size += size
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(('.npy', '.npz')):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        """Xóa các mục ít dùng gần đây nhất cho tới khi còn dưới 90% giới hạn."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._size = total
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._size = 0
+
+def detection_cache_key(cache, content_digest, tiling=None, rois=None):
+    """Khóa cache của một ảnh; chế độ tile và ROI cho kết quả khác nên được đưa vào khóa."""
+    if cache is None:
+        return None
+    extra = {name: value for name, value in (('tiling', tiling), ('rois', rois)) if value}
+    return cache.key(content_digest, **extra)
+
+def predict_with_cache(model, images, keys, cache, tiling=None, rois=None):
+    """Suy luận một batch chỉ gồm các ảnh chưa có trong cache; trả về list detection theo thứ tự images.
+
+    tiling (dict từ tiling_config) bật suy luận theo tile: mỗi ảnh thành một batch tile riêng.
+    rois (list song song với images, phần tử None = nguyên ảnh) giới hạn suy luận trong ROI.
+    """
+    detections = [cache.get(key) if cache is not None and key else None for key in keys]
+    missing = [i for i, dets in enumerate(detections) if dets is None]
+    if missing:
+        missing_rois = [rois[i] for i in missing] if rois else []
+        if any(missing_rois):
+            predicted = predict_roi_batch(model, [images[i] for i in missing], missing_rois, tiling)
+        elif tiling:
+            predicted = [predict_tiled(model, images[i], **tiling) for i in missing]
+        else:
+            results = model.predict([images[i] for i in missing], save=False, verbose=False, iou=PREDICT_IOU)
+            predicted = [results_to_detections(result) for result in results]
+        for i, dets in zip(missing, predicted):
+            detections[i] = dets
+            if cache is not None and keys[i]:
+                cache.put(keys[i], detections[i])
+    return detections
+
+# --- Load model (dùng chung cho GUI/CLI) ---
+
+DEFAULT_WARMUP_RUNS = 1
+
+BACKEND_PYTORCH = 'pytorch'
+BACKEND_ONNX = 'onnx'
+BACKEND_OPENVINO = 'openvino'
+# backend -> module runtime cần có (PyTorch luôn có sẵn cùng ultralytics)
+INFERENCE_BACKENDS = {BACKEND_PYTORCH: None, BACKEND_ONNX: 'onnxruntime', BACKEND_OPENVINO: 'openvino'}
+
+def backend_available(backend):
+    module = INFERENCE_BACKENDS.get(backend)
+    return module is None or importlib.util.find_spec(module) is not None
+
+def exported_model_path(model_path, backend):
+    """Vị trí ultralytics ghi bản export: cạnh file trọng số (best.onnx, best_openvino_model/)."""
+    base = os.path.splitext(model_path)[0]
+    if backend == BACKEND_ONNX:
+        return f"{base}.onnx"
+    if backend == BACKEND_OPENVINO:
+        return f"{base}_openvino_model"
+    return model_path
+
+def runtime_backend(path):
+    """Backend thực sự chạy một file model (theo định dạng file)."""
+    if path.endswith('.onnx'):
+        return BACKEND_ONNX
+    if path.rstrip('/\\').endswith('_openvino_model'):
+        return BACKEND_OPENVINO
+    return BACKEND_PYTORCH
+
+def export_model(model_path, backend, progress=None):
+    """Export .pt sang backend (chỉ một lần): dùng lại bản export nếu mới hơn file trọng số."""
+    target = exported_model_path(model_path, backend)
+    if target == model_path or not model_path.endswith('.pt'):
+        return model_path # Đã là bản export (VD: model INT8 .onnx) -> load trực tiếp
+    if not backend_available(backend):
+        raise RuntimeError(f"Thiếu thư viện '{INFERENCE_BACKENDS[backend]}' cho backend {backend}")
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(model_path):
+        return target
+
+    from ultralytics import YOLO
+    (progress or (lambda message: None))(f"Đang export {os.path.basename(model_path)} sang {backend}...")
+    model = YOLO(model_path)
+    # dynamic=True: nhận batch nhiều ảnh như khi chạy PyTorch
+    exported = model.export(format=backend, imgsz=inference_params(model)['imgsz'], dynamic=True, verbose=False)
+    return str(exported or target)
+
+def warmup_model(model, runs=DEFAULT_WARMUP_RUNS, imgsz=None):
+    """Suy luận trên ảnh giả (đen) để khởi tạo trước predictor, fuse layer, cấp phát bộ nhớ thiết bị...
+
+    Lần predict đầu tiên của YOLO chậm hơn hẳn các lần sau; warm-up dời chi phí đó khỏi ảnh thật đầu tiên.
+    """
+    imgsz = imgsz or inference_params(model)['imgsz']
+    dummy = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    for _ in range(runs):
+        model.predict(dummy, save=False, verbose=False, iou=PREDICT_IOU)
+
+def load_model(model_path, warmup_runs=DEFAULT_WARMUP_RUNS, progress=None, backend=BACKEND_PYTORCH):
+    """Load model YOLO (qua backend đã chọn) rồi warm-up.
+
+    Trả về (model, runtime_path, {'export_s', 'load_s', 'warmup_s'}); runtime_path là file thực sự được
+    load (bản export nếu không phải PyTorch), dùng cho các tiến trình suy luận con.
+    progress(message) được gọi trước mỗi bước để báo tiến độ.
+    """
+    from ultralytics import YOLO
+    report = progress or (lambda message: None)
+
+    start = time.perf_counter()
+    runtime_path = export_model(model_path, backend, progress=report)
+    timings = {'export_s': time.perf_counter() - start}
+
+    report(f"Đang load {os.path.basename(runtime_path)}...")
+    start = time.perf_counter()
+    model = YOLO(runtime_path, task='detect')
+    timings.update(load_s=time.perf_counter() - start, warmup_s=0.0)
+
+    if warmup_runs > 0:
+        report(f"Đang warm-up model ({warmup_runs} lần)...")
+        start = time.perf_counter()
+        warmup_model(model, warmup_runs)
+        timings['warmup_s'] = time.perf_counter() - start
+    return model, runtime_path, timings
+
+# --- Lượng tử hóa INT8 (post-training, ONNX Runtime) ---
+
+# Nhãn class dùng chung với app Android (assets/models/coco_labels.txt)
+DEFAULT_LABELS_PATH = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                    '..', 'models', 'coco_labels.txt'))
+DEFAULT_CALIBRATION_IMAGES = 200
+DEFAULT_EVAL_FRACTION = 0.2 # Tỉ lệ ảnh giữ lại để đánh giá INT8, không dùng để hiệu chuẩn
+
+def split_calibration(paths, eval_fraction=DEFAULT_EVAL_FRACTION, max_calibration=DEFAULT_CALIBRATION_IMAGES):
+    """Chia ảnh thành (hiệu chuẩn, đánh giá) không giao nhau: cứ 1/eval_fraction ảnh thì giữ lại một ảnh để đánh giá."""
+    paths = sorted(paths)
+    if len(paths) < 2:
+        raise ValueError("Cần ít nhất 2 ảnh để tách tập hiệu chuẩn và tập đánh giá.")
+    step = max(2, int(round(1 / eval_fraction)))
+    evaluation = paths[step - 1::step] or paths[-1:]
+    held_out = set(evaluation)
+    calibration = [path for path in paths if path not in held_out][:max_calibration]
+    return calibration, evaluation
+
+def read_class_labels(path):
+    """{class_id: tên} từ file nhãn một dòng một class (bỏ dòng trống)."""
+    with open(path, encoding='utf-8') as f:
+        names = [line.strip() for line in f if line.strip()]
+    return dict(enumerate(names))
+
+def letterbox(img, size, color=114):
+    """Resize giữ tỉ lệ rồi pad về size x size, giống tiền xử lý của ultralytics."""
+    h, w = img.shape[:2]
+    scale = min(size / h, size / w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    resized = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    out = np.full((size, size, 3), color, dtype=np.uint8)
+    top, left = (size - new_h) // 2, (size - new_w) // 2
+    out[top:top + new_h, left:left + new_w] = resized
+    return out
+
+def quantized_model_path(model_path):
+    return f"{os.path.splitext(model_path)[0]}_int8.onnx"
+
+def quantize_model(model_path, calibration_paths, output_path=None, progress=None):
+    """Lượng tử hóa INT8 tĩnh: export .pt sang ONNX (FP32) rồi quantize_static với ảnh hiệu chuẩn.
+
+    Trả về đường dẫn file _int8.onnx (cạnh file trọng số); file giữ metadata của bản FP32
+    (names, imgsz, stride) để YOLO(path) load được như model thường.
+    """
+    import onnx
+    import onnxruntime
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    report = progress or (lambda message: None)
+    fp32_path = export_model(model_path, BACKEND_ONNX, progress=report)
+    output_path = output_path or quantized_model_path(model_path)
+    fp32_model = onnx.load(fp32_path)
+    imgsz = int(json.loads(next((p.value for p in fp32_model.metadata_props if p.key == 'imgsz'), '[640]'))[0])
+    input_name = onnxruntime.InferenceSession(fp32_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+
+    class ImageReader(CalibrationDataReader):
+        def __init__(self):
+            self._paths = iter(calibration_paths)
+            self._count = 0
+
+        def get_next(self):
+            for path in self._paths:
+                img = decode_image(path)
+                if img is None:
+                    continue
+                self._count += 1
+                report(f"Hiệu chuẩn INT8: {self._count}/{len(calibration_paths)} ảnh")
+                rgb = letterbox(img, imgsz)[:, :, ::-1]
+                tensor = np.ascontiguousarray(rgb.transpose(2, 0, 1), dtype=np.float32)[None] / 255.0
+                return {input_name: tensor}
+            return None
+
+    quantize_static(fp32_path, output_path, ImageReader(), quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True)
+
+    int8_model = onnx.load(output_path)
+    del int8_model.metadata_props[:]
+    int8_model.metadata_props.extend(fp32_model.metadata_props)
+    onnx.save(int8_model, output_path)
+    return output_path
+
+def compare_models(reference, candidate, image_paths, class_names, iou_threshold=0.5, progress=None):
+    """So sánh model candidate (VD: INT8) với reference (FP32) trên cùng tập ảnh (nên tách khỏi tập hiệu chuẩn).
+
+    Detection của reference được coi là chuẩn: với từng class, box hai bên được ghép theo IoU;
+    recall = matched / reference, precision = matched / candidate. Tốc độ đo theo ms/ảnh (batch 1).
+    """
+    report = progress or (lambda message: None)
+    stats = {class_id: np.zeros(3, dtype=np.int64) for class_id in class_names} # reference, candidate, matched
+    iou_sums = dict.fromkeys(class_names, 0.0)
+    seconds = {'reference': 0.0, 'candidate': 0.0}
+    warmup_model(reference)
+    warmup_model(candidate)
+
+    images = 0
+    for i, path in enumerate(image_paths, 1):
+        img = decode_image(path)
+        if img is None:
+            continue
+        report(f"So sánh model: {i}/{len(image_paths)} ảnh")
+        images += 1
+        detections = {}
+        for role, model in (('reference', reference), ('candidate', candidate)):
+            start = time.perf_counter()
+            result = model.predict(img, save=False, verbose=False, iou=PREDICT_IOU)[0]
+            seconds[role] += time.perf_counter() - start
+            detections[role] = results_to_detections(result)
+
+        ref, cand = detections['reference'], detections['candidate']
+        for class_id in np.union1d(ref[:, 0], cand[:, 0]).astype(np.int64).tolist():
+            ref_boxes = ref[ref[:, 0] == class_id, 1:5]
+            cand_boxes = cand[cand[:, 0] == class_id, 1:5]
+            iou = box_iou_matrix(ref_boxes, cand_boxes)
+            pairs = match_by_iou(iou, iou_threshold)
+            counts = stats.setdefault(class_id, np.zeros(3, dtype=np.int64))
+            counts += (len(ref_boxes), len(cand_boxes), len(pairs))
+            iou_sums[class_id] = iou_sums.get(class_id, 0.0) + float(iou[pairs[:, 0], pairs[:, 1]].sum())
+
+    def summarize(counts, iou_sum):
+        n_ref, n_cand, matched = (int(v) for v in counts)
+        return {'reference': n_ref, 'candidate': n_cand, 'matched': matched,
+                'recall': round(matched / n_ref, 4) if n_ref else None,
+                'precision': round(matched / n_cand, 4) if n_cand else None,
+                'mean_iou': round(iou_sum / matched, 4) if matched else None}
+
+    ms = {role: round(1000 * s / images, 2) if images else None for role, s in seconds.items()}
+    return {
+        'images': images,
+        'iou_threshold': iou_threshold,
+        'ms_per_image': ms,
+        'speedup': round(seconds['reference'] / seconds['candidate'], 2) if images and seconds['candidate'] else None,
+        'classes': {str(class_names.get(c, c)): summarize(counts, iou_sums[c]) for c, counts in sorted(stats.items())},
+        'overall': summarize(sum(stats.values(), np.zeros(3, dtype=np.int64)), sum(iou_sums.values())),
+    }
+
+# --- Lưu/mở phiên làm việc (không cần suy luận lại) ---
+
+SESSION_MANIFEST = 'session.json'
+SESSION_VERSION = 1
+_SESSION_FIELDS = ('path', 'kind', 'file_id', 'image_path', 'source_path', 'thumbnail_path', 'width', 'height',
+                   'save_status', 'fps', 'total_frames', 'rows_start', 'rows_end', 'frames_start', 'frames_end')
+_STORE_ARRAYS = ('file_ids', 'class_ids', 'boxes', 'confs', 'starts', 'ends')
+_VIDEO_ARRAYS = ('data', 'track_ids', 'offsets')
+
+def _save_array(path, array):
+    # Ghi qua file tạm rồi đổi tên: phiên đang mở có thể đang memory-map file cũ
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, np.ascontiguousarray(array))
+    os.replace(tmp_path, path)
+
+def _load_array(path):
+    """Memory-map một file .npy (copy-on-write: ghi vào mảng không đụng tới file)."""
+    try:
+        return np.load(path, mmap_mode='c')
+    except ValueError: # Mảng rỗng không map được
+        return np.load(path)
+
+def save_session(session_dir, records, store, class_names=None, temp_dir=None):
+    """Ghi phiên: manifest JSON nhỏ + các mảng detection dạng .npy để mở lại bằng memory-map.
+
+    records là danh sách (path, FileRecord) theo thứ tự hiển thị; video chưa xử lý xong bị bỏ qua.
+    File nằm trong temp_dir (ảnh chụp màn hình, video quay, thumbnail) được chép vào phiên
+    vì thư mục tạm bị xóa khi đóng ứng dụng.
+    """
+    files_dir = os.path.join(session_dir, 'files')
+    os.makedirs(os.path.join(session_dir, 'detections'), exist_ok=True)
+    os.makedirs(os.path.join(session_dir, 'videos'), exist_ok=True)
+    temp_root = os.path.join(os.path.abspath(temp_dir), '') if temp_dir else None
+
+    def persist(file_id, path):
+        if not temp_root or not path or not os.path.abspath(path).startswith(temp_root) or not os.path.exists(path):
+            return path
+        os.makedirs(files_dir, exist_ok=True)
+        relative = os.path.join('files', f"{file_id}_{os.path.basename(path)}")
+        shutil.copy(path, os.path.join(session_dir, relative))
+        return relative
+
+    rows = []
+    video_parts = ([], [], [])
+    video_rows = video_frames = 0
+    for path, record in records:
+        if record.kind == 'video' and (record.processing or record.detections is None):
+            continue
+        spans = (0, 0, 0, 0)
+        if record.kind == 'video':
+            data, track_ids, offsets = record.detections.to_arrays()
+            spans = (video_rows, video_rows + len(data), video_frames, video_frames + len(offsets))
+            for part, array in zip(video_parts, (data, track_ids, offsets)):
+                part.append(array)
+            video_rows, video_frames = spans[1], spans[3]
+        rows.append([path, record.kind, record.file_id, persist(record.file_id, record.image_path),
+                     persist(record.file_id, record.source_path), persist(record.file_id, record.thumbnail_path),
+                     record.width, record.height, record.save_status, record.fps, record.total_frames, *spans])
+
+    for name, array in zip(_STORE_ARRAYS, store.to_arrays()):
+        _save_array(os.path.join(session_dir, 'detections', f'{name}.npy'), array)
+    empty_parts = (EMPTY_DETECTIONS, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    for name, part, empty in zip(_VIDEO_ARRAYS, video_parts, empty_parts):
+        _save_array(os.path.join(session_dir, 'videos', f'{name}.npy'), np.concatenate(part) if part else empty)
+
+    manifest = {
+        'version': SESSION_VERSION,
+        'class_names': {str(k): v for k, v in (class_names or {}).items()},
+        'fields': list(_SESSION_FIELDS),
+        'files': rows,
+    }
+    manifest_path = os.path.join(session_dir, SESSION_MANIFEST)
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, manifest_path)
+    return len(rows)
+
+def load_session(session_dir):
+    """Mở phiên đã lưu: (records [(path, FileRecord)], DetectionStore, class_names).
+
+    Mảng detection được memory-map chứ không đọc hết vào RAM; detection của từng video là view
+    trên mảng chung nên chỉ các trang được dùng tới mới được nạp.
+    """
+    with open(os.path.join(session_dir, SESSION_MANIFEST), encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != SESSION_VERSION:
+        raise ValueError(f"Phiên bản phiên không hỗ trợ: {manifest.get('version')}")
+
+    store = DetectionStore.from_arrays(*(_load_array(os.path.join(session_dir, 'detections', f'{name}.npy'))
+                                         for name in _STORE_ARRAYS))
+    video_data = video_track_ids = video_offsets = None
+
+    def resolve(path):
+        return os.path.join(session_dir, path) if path and not os.path.isabs(path) else path
+
+    records = []
+    for row in manifest['files']:
+        entry = dict(zip(manifest['fields'], row))
+        record = FileRecord(entry['file_id'], entry['kind'], entry['width'], entry['height'],
+                            image_path=resolve(entry['image_path']), source_path=resolve(entry['source_path']),
+                            thumbnail_path=resolve(entry['thumbnail_path']), fps=entry['fps'],
+                            total_frames=entry['total_frames'])
+        record.save_status = entry['save_status']
+        if record.kind == 'video':
+            if video_data is None:
+                video_data, video_track_ids, video_offsets = (
+                    _load_array(os.path.join(session_dir, 'videos', f'{name}.npy')) for name in _VIDEO_ARRAYS)
+            rows = slice(entry['rows_start'], entry['rows_end'])
+            record.detections = VideoDetections.from_arrays(video_data[rows], video_track_ids[rows],
+                                                            video_offsets[entry['frames_start']:entry['frames_end']])
+        records.append((entry['path'], record))
+
+    class_names = {int(k): v for k, v in manifest.get('class_names', {}).items()}
+    return records, store, class_names
+
+# --- Chỉ mục tìm kiếm theo tên file và nội dung detection ---
+
+_ANY_CLAUSE = re.compile(r'(any|no)\s+([\w-]+)')
+_COUNT_CLAUSE = re.compile(r'(?:>=|≥)?\s*(\d+)\s+([\w-]+)(?:\s+(?:above|>)\s*(\d*\.?\d+))?')
+_CONF_CLAUSE = re.compile(r'([\w-]+)\s+(?:above|>)\s*(\d*\.?\d+)')
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class SearchIndex:
+    """Chỉ mục tìm kiếm cho File List: trigram của đường dẫn + danh sách file theo class.
+
+    Truy vấn gồm các mệnh đề nối bằng dấu phẩy (AND), không phân biệt hoa thường:
+      "any MRLS"            có ít nhất một MRLS
+      "no Civilian"         không có Civilian
+      ">=3 Tank above 0.6"  ít nhất 3 Tank có conf > 0.6 (video: trong cùng một frame); "≥3", "3 Tank", "Tank > 0.6" cũng được
+      chữ khác              tìm chuỗi con trong đường dẫn file
+    """
+    def __init__(self):
+        self._names = {} # path -> đường dẫn viết thường
+        self._trigrams = {} # trigram -> set(path)
+        self._classes = {} # class_id -> {path: (frame_ids, confs)}
+        self._file_classes = {} # path -> set(class_id) để cập nhật lại khi file được xử lý lại
+        self._last_name = None # (chuỗi, kết quả) của lần tìm tên trước, để thu hẹp khi gõ thêm
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, path, detections, frame_ids=None):
+        """Thêm/cập nhật một file; frame_ids (song song với detections) dùng cho video."""
+        self.remove(path)
+        name = path.lower()
+        self._names[path] = name
+        for trigram in _trigrams(name):
+            self._trigrams.setdefault(trigram, set()).add(path)
+
+        classes = set()
+        if detections is not None and len(detections):
+            detections = np.asarray(detections, dtype=np.float32)
+            if frame_ids is None:
+                frame_ids = np.zeros(len(detections), dtype=np.int64)
+            class_ids = detections[:, 0].astype(np.int64)
+            for class_id in np.unique(class_ids).tolist():
+                mask = class_ids == class_id
+                self._classes.setdefault(class_id, {})[path] = (frame_ids[mask], detections[mask, 5])
+                classes.add(class_id)
+        self._file_classes[path] = classes
+        self._last_name = None
+
+    def add_video(self, path, video_detections):
+        data, _, offsets = video_detections.to_arrays()
+        frame_ids = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        self.add(path, data, frame_ids)
+
+    def remove(self, path):
+        name = self._names.pop(path, None)
+        if name is None:
+            return
+        for trigram in _trigrams(name):
+            paths = self._trigrams.get(trigram)
+            if paths is not None:
+                paths.discard(path)
+        for class_id in self._file_classes.pop(path, ()):
+            self._classes[class_id].pop(path, None)
+        self._last_name = None
+
+    def clear(self):
+        self.__init__()
+
+    def parse(self, query, class_names):
+        """Tách truy vấn thành các mệnh đề (kind, ...); mệnh đề không nhận ra class được coi là tìm tên."""
+        class_ids = {str(name).lower(): class_id for class_id, name in class_names.items()}
+        clauses = []
+        for text in query.lower().split(','):
+            text = text.strip()
+            if not text:
+                continue
+            clause = None
+            match = _ANY_CLAUSE.fullmatch(text)
+            if match and match.group(2) in class_ids:
+                kind = 'any' if match.group(1) == 'any' else 'none'
+                clause = (kind, class_ids[match.group(2)])
+            match = _COUNT_CLAUSE.fullmatch(text)
+            if clause is None and match and match.group(2) in class_ids:
+                clause = ('count', class_ids[match.group(2)], int(match.group(1)), float(match.group(3) or 0.0))
+            match = _CONF_CLAUSE.fullmatch(text)
+            if clause is None and match and match.group(1) in class_ids:
+                clause = ('count', class_ids[match.group(1)], 1, float(match.group(2)))
+            clauses.append(clause or ('name', text))
+        return clauses
+
+    def search(self, query, class_names):
+        """Tập path khớp truy vấn, None nếu truy vấn rỗng (không lọc)."""
+        clauses = self.parse(query, class_names)
+        if not clauses:
+            return None
+        result = None
+        for clause in clauses:
+            matched = self._search_clause(clause)
+            result = matched if result is None else result & matched
+            if not result:
+                break
+        return set(result)
+
+    def matches(self, path, query, class_names):
+        """Kiểm tra một file (dùng khi worker vừa xử lý xong file trong lúc đang lọc)."""
+        if path not in self._names:
+            return False
+        for clause in self.parse(query, class_names):
+            kind = clause[0]
+            if kind == 'name':
+                ok = clause[1] in self._names[path]
+            elif kind == 'none':
+                ok = path not in self._classes.get(clause[1], {})
+            else:
+                entry = self._classes.get(clause[1], {}).get(path)
+                ok = entry is not None
+                if ok and kind == 'count':
+                    ok = self._entry_matches(entry, *clause[2:])
+            if not ok:
+                return False
+        return True
+
+    def _search_clause(self, clause):
+        kind = clause[0]
+        if kind == 'name':
+            return self._search_name(clause[1])
+        postings = self._classes.get(clause[1], {})
+        if kind == 'any':
+            return set(postings)
+        if kind == 'none':
+            return set(self._names) - set(postings)
+        _, _, min_count, min_conf = clause
+        return {path for path, entry in postings.items() if self._entry_matches(entry, min_count, min_conf)}
+
+    @staticmethod
+    def _entry_matches(entry, min_count, min_conf):
+        frame_ids, confs = entry
+        keep = confs > min_conf
+        if min_count <= 1:
+            return bool(keep.any())
+        kept = frame_ids[keep]
+        return len(kept) >= min_count and int(np.bincount(kept).max()) >= min_count
+
+    def _search_name(self, text):
+        # Gõ thêm ký tự: kết quả mới là tập con của kết quả cũ
+        if self._last_name is not None and self._last_name[0] in text:
+            candidates = self._last_name[1]
+        elif len(text) >= 3:
+            posting_sets = sorted((self._trigrams.get(t, set()) for t in _trigrams(text)), key=len)
+            candidates = set.intersection(*posting_sets) if posting_sets else set()
+        else:
+            candidates = self._names.keys()
+        result = {path for path in candidates if text in self._names[path]}
+        self._last_name = (text, result)
+        return result
+
+# --- Tín hiệu dạng callback (thay cho pyqtSignal khi chạy không có Qt) ---
+
+class CallbackSignal:
+    """Tín hiệu tối giản có connect/emit giống pyqtSignal, gọi callback ngay trong luồng hiện tại."""
+    def __init__(self):
+        self._callbacks = []
+
+    def connect(self, callback):
+        self._callbacks.append(callback)
+
+    def emit(self, *args):
+        for callback in self._callbacks:
+            callback(*args)
+
+class PipelineSignals:
+    """Cùng tên tín hiệu với WorkerSignals của GUI để pipeline dùng chung."""
+    def __init__(self):
+        self.file_processed = CallbackSignal() # original_path, image_path, detections (Nx6), w, h, thumbnail (BGR)
+        self.result = CallbackSignal() # original_path, image_path, detections (Nx6), w, h, image (BGR đã giải mã)
+        self.queue_depths = CallbackSignal() # số lô chờ suy luận, số lô chờ hậu xử lý, sức chứa mỗi hàng đợi
+        self.video_started = CallbackSignal() # original_path, thumbnail_path, w, h, fps, total_frames
+        self.video_frame = CallbackSignal() # original_path, frame_idx, detections (Nx6), track_ids
+        self.video_processed = CallbackSignal() # original_path, VideoDetections
+        self.finished = CallbackSignal()
+        self.error = CallbackSignal()
+
+# --- Pipeline xử lý ---
+
+class ImagePipeline:
+    """Xử lý ảnh: suy luận theo lô, mỗi ảnh chỉ giải mã một lần, kết quả gửi qua signals.
+
+    Khi có nhiều lô và prefetch > 0, ba giai đoạn chạy song song qua các hàng đợi giới hạn: luồng đọc
+    (giải mã bằng pool decode_workers luồng) -> suy luận (luồng gọi run) -> luồng hậu xử lý (ghi nhãn,
+    thumbnail, gửi signal). Thông lượng tiến tới max(giải mã, suy luận) thay vì tổng của chúng; độ sâu
+    hàng đợi được gửi qua signals.queue_depths trước mỗi lần suy luận để tinh chỉnh.
+    """
+    def __init__(self, model, file_paths, temp_dir, signals, is_batch=False, batch_size=DEFAULT_BATCH_SIZE,
+                 label_export_dir=None, volatile=False, cache=None, tiling=None, rois=None,
+                 prefetch=DEFAULT_PREFETCH_BATCHES, decode_workers=DEFAULT_DECODE_WORKERS):
+        self.model = model
+        self.file_paths = file_paths if isinstance(file_paths, list) else [file_paths]
+        self.temp_dir = temp_dir
+        self.signals = signals
+        self.is_batch = is_batch 
+        self.batch_size = max(1, int(batch_size))
+        self.label_export_dir = label_export_dir # None = không ghi file nhãn
+        self.volatile = volatile # File nguồn có thể biến mất (VD: screenshot) -> copy vào temp
+        self.cache = cache # DetectionCache hoặc None
+        self.tiling = tiling # tiling_config(...) hoặc None (suy luận nguyên ảnh)
+        self.rois = rois or {} # {file_path: ROI} của các file chỉ suy luận trong ROI
+        self.prefetch = max(0, int(prefetch))
+        self.decode_workers = max(1, int(decode_workers))
+        self.stage_seconds = {'decode': 0.0, 'infer': 0.0, 'post': 0.0} # Thời gian cộng dồn của từng giai đoạn
+        self.max_queue_depths = [0, 0] # Độ sâu lớn nhất đã gặp: (chờ suy luận, chờ hậu xử lý)
+        self._filename = ""
+        
+        self.temp_originals_dir = os.path.join(self.temp_dir, 'originals')
+        os.makedirs(self.temp_originals_dir, exist_ok=True)
+        if self.label_export_dir:
+            os.makedirs(self.label_export_dir, exist_ok=True)
+
+    def _load_one(self, file_path):
+        """Đọc + giải mã một ảnh (kèm khóa cache từ cùng buffer), None nếu không đọc được."""
+        data = read_file_bytes(file_path)
+        img = cv2.imdecode(data, cv2.IMREAD_COLOR) if data is not None else None
+        if img is None:
+            print(f"Không thể đọc ảnh: {file_path}")
+            return None
+
+        key = (detection_cache_key(self.cache, buffer_digest(data), self.tiling, self.rois.get(file_path))
+               if self.cache is not None else None)
+        image_path = file_path
+        if self.volatile:
+            image_path = volatile_copy(file_path, self.temp_dir, self.temp_originals_dir)
+        return (file_path, image_path, img, key)
+
+    def _load_chunk(self, chunk, pool=None):
+        """Đọc + giải mã một lô ảnh (song song nếu có pool, giữ thứ tự), bỏ qua các file không đọc được."""
+        start = time.perf_counter()
+        loaded = [item for item in (pool.map(self._load_one, chunk) if pool else map(self._load_one, chunk)) if item]
+        self.stage_seconds['decode'] += time.perf_counter() - start
+        return loaded
+
+    def _predict(self, loaded):
+        # Một lần forward cho các ảnh chưa có trong cache (list ndarray -> 1 batch)
+        self._filename = os.path.basename(loaded[0][0])
+        start = time.perf_counter()
+        batch_detections = predict_with_cache(self.model, [item[2] for item in loaded],
+                                              [item[3] for item in loaded], self.cache, self.tiling,
+                                              [self.rois.get(item[0]) for item in loaded])
+        self.stage_seconds['infer'] += time.perf_counter() - start
+        return batch_detections
+
+    def _emit(self, loaded, batch_detections):
+        start = time.perf_counter()
+        for (file_path, image_path, img, _), detections in zip(loaded, batch_detections):
+            filename = os.path.basename(file_path)
+            h, w = img.shape[:2]
+
+            if self.label_export_dir:
+                base_name = os.path.splitext(filename)[0]
+                save_detections_txt(detections, os.path.join(self.label_export_dir, f'{base_name}.txt'))
+
+            # Bộ đệm đã giải mã dùng chung cho suy luận, kích thước, thumbnail và hiển thị
+            if self.is_batch:
+                self.signals.file_processed.emit(file_path, image_path, detections, w, h, make_thumbnail(img))
+            else:
+                self.signals.result.emit(file_path, image_path, detections, w, h, img)
+        self.stage_seconds['post'] += time.perf_counter() - start
+
+    def run(self):
+        try:
+            chunks = [self.file_paths[start:start + self.batch_size]
+                      for start in range(0, len(self.file_paths), self.batch_size)]
+            if self.prefetch and len(chunks) > 1:
+                self._run_staged(chunks)
+            else:
+                for chunk in chunks:
+                    self._filename = os.path.basename(chunk[0])
+                    loaded = self._load_chunk(chunk)
+                    if loaded:
+                        self._emit(loaded, self._predict(loaded))
+        except Exception as e:
+            self.signals.error.emit(f"Lỗi xử lý file {self._filename}: {e}")
+        finally:
+            self.signals.finished.emit()
+
+    def _run_staged(self, chunks):
+        """Đọc/giải mã trước và hậu xử lý trên hai luồng riêng; luồng hiện tại chỉ suy luận.
+
+        Mỗi hàng đợi chứa tối đa `prefetch` lô nên bộ nhớ ảnh đã giải mã bị chặn trên; giai đoạn nào lỗi
+        thì đặt cờ dừng, các giai đoạn còn lại vẫn rút cạn hàng đợi để không luồng nào bị kẹt.
+        """
+        decoded = queue.Queue(maxsize=self.prefetch)
+        processed = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        errors = []
+
+        def read_stage():
+            try:
+                with ThreadPoolExecutor(self.decode_workers) as pool:
+                    for chunk in chunks:
+                        if stop.is_set():
+                            break
+                        decoded.put(self._load_chunk(chunk, pool))
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                decoded.put(None)
+
+        def post_stage():
+            while True:
+                item = processed.get()
+                if item is None:
+                    break
+                if stop.is_set():
+                    continue
+                try:
+                    self._emit(*item)
+                except Exception as e:
+                    errors.append(e)
+                    stop.set()
+
+        reader = threading.Thread(target=read_stage, name="ImagePipeline-read", daemon=True)
+        poster = threading.Thread(target=post_stage, name="ImagePipeline-post", daemon=True)
+        reader.start()
+        poster.start()
+        try:
+            while True:
+                loaded = decoded.get()
+                if loaded is None:
+                    break
+                if stop.is_set() or not loaded:
+                    continue
+                depths = (decoded.qsize(), processed.qsize())
+                self.max_queue_depths = [max(a, b) for a, b in zip(self.max_queue_depths, depths)]
+                self.signals.queue_depths.emit(depths[0], depths[1], self.prefetch)
+                processed.put((loaded, self._predict(loaded)))
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+            while decoded.get() is not None: # Giải phóng luồng đọc đang chờ put
+                pass
+        finally:
+            processed.put(None)
+            reader.join()
+            poster.join()
+        if errors:
+            raise errors[0]
+
+# --- Suy luận đa tiến trình (mỗi tiến trình giữ một model YOLO riêng) ---
+
+_process_model = None
+
+def _init_process_worker(model_path, torch_threads):
+    """Initializer của tiến trình con: chia luồng torch và load model một lần."""
+    global _process_model
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+    from ultralytics import YOLO
+    _process_model = YOLO(model_path, task='detect')
+
+def _predict_chunk_in_process(chunk, label_export_dir, cache=None, tiling=None, rois=None):
+    """Chạy trong tiến trình con: giải mã + suy luận một lô, chỉ trả về detection và thumbnail."""
+    rois = rois or {}
+    loaded = []
+    for file_path in chunk:
+        data = read_file_bytes(file_path)
+        img = cv2.imdecode(data, cv2.IMREAD_COLOR) if data is not None else None
+        if img is None:
+            print(f"Không thể đọc ảnh: {file_path}")
+            continue
+        key = detection_cache_key(cache, buffer_digest(data), tiling, rois.get(file_path)) if cache is not None else None
+        loaded.append((file_path, img, key))
+    if not loaded:
+        return []
+
+    batch_detections = predict_with_cache(_process_model, [img for _, img, _ in loaded],
+                                          [key for _, _, key in loaded], cache, tiling,
+                                          [rois.get(file_path) for file_path, _, _ in loaded])
+    processed = []
+    for (file_path, img, _), detections in zip(loaded, batch_detections):
+        if label_export_dir:
+            base_name = os.path.splitext(os.path.basename(file_path))[0]
+            save_detections_txt(detections, os.path.join(label_export_dir, f'{base_name}.txt'))
+        h, w = img.shape[:2]
+        processed.append((file_path, detections, w, h, make_thumbnail(img)))
+    return processed
+
+class ParallelImagePipeline:
+    """Xử lý thư mục ảnh bằng nhiều tiến trình: chia file_paths thành các lô, mỗi tiến trình
+    load model riêng (tránh GIL), kết quả được gửi qua signals.file_processed đúng thứ tự ban đầu."""
+    def __init__(self, model_path, file_paths, temp_dir, signals, num_workers=None, batch_size=DEFAULT_BATCH_SIZE,
+                 label_export_dir=None, volatile=False, cache=None, tiling=None, rois=None):
+        self.model_path = model_path
+        self.file_paths = file_paths if isinstance(file_paths, list) else [file_paths]
+        self.temp_dir = temp_dir
+        self.signals = signals
+        self.num_workers = max(1, int(num_workers or os.cpu_count() or 1))
+        self.batch_size = max(1, int(batch_size))
+        self.label_export_dir = label_export_dir
+        self.volatile = volatile
+        self.cache = cache # DetectionCache được pickle sang từng tiến trình con
+        self.tiling = tiling
+        self.rois = rois or {}
+        self.is_running = True
+
+        self.temp_originals_dir = os.path.join(self.temp_dir, 'originals')
+        os.makedirs(self.temp_originals_dir, exist_ok=True)
+        if self.label_export_dir:
+            os.makedirs(self.label_export_dir, exist_ok=True)
+
+    def run(self):
+        filename = ""
+        try:
+            chunks = [self.file_paths[i:i + self.batch_size] for i in range(0, len(self.file_paths), self.batch_size)]
+            workers = min(self.num_workers, len(chunks))
+            if workers == 0:
+                return
+            # Chia đều số lõi CPU cho các tiến trình để torch không tranh luồng lẫn nhau
+            torch_threads = max(1, (os.cpu_count() or 1) // workers)
+
+            # spawn: an toàn với Qt/torch đã khởi tạo trong tiến trình cha
+            context = multiprocessing.get_context('spawn')
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_process_worker,
+                                           initargs=(self.model_path, torch_threads))
+            futures = {executor.submit(_predict_chunk_in_process, chunk, self.label_export_dir, self.cache,
+                                       self.tiling, {p: self.rois[p] for p in chunk if p in self.rois}): index
+                       for index, chunk in enumerate(chunks)}
+            # Nhận lô theo thứ tự hoàn thành (lỗi báo ngay), nhưng vẫn phát kết quả theo thứ tự file
+            done, next_index = {}, 0
+            try:
+                for future in as_completed(futures):
+                    if not self.is_running:
+                        break
+                    index = futures[future]
+                    filename = os.path.basename(chunks[index][0])
+                    done[index] = future.result()
+                    while next_index in done:
+                        for file_path, detections, w, h, thumbnail in done.pop(next_index):
+                            filename = os.path.basename(file_path)
+                            image_path = file_path
+                            if self.volatile:
+                                image_path = volatile_copy(file_path, self.temp_dir, self.temp_originals_dir)
+                            self.signals.file_processed.emit(file_path, image_path, detections, w, h, thumbnail)
+                        next_index += 1
+            finally:
+                # Dừng hoặc lô đầu tiên lỗi: hủy các lô chưa chạy và không chờ các lô đang chạy xong
+                executor.shutdown(wait=False, cancel_futures=True)
+
+        except Exception as e:
+            self.signals.error.emit(f"Lỗi xử lý file {filename}: {e}")
+        finally:
+            self.signals.finished.emit()
+
+    def stop(self):
+        self.is_running = False
+
+class VideoPipeline:
+    """Xử lý Video theo luồng: suy luận từng lô frame và gửi detection về ngay.
+
+    Với stride > 1 chỉ suy luận 1 frame mỗi `stride` frame (frame bỏ qua không cần giải mã),
+    detection của frame bỏ qua được nội suy giữa hai keyframe. Chế độ adaptive giảm stride
+    về 1 khi cảnh thay đổi mạnh hoặc số detection tăng, rồi nới dần trở lại. Với motion_threshold,
+    keyframe gần như không đổi so với frame suy luận gần nhất (MotionGate) dùng lại detection cũ.
+    """
+    def __init__(self, model, file_path, temp_dir, signals, batch_size=DEFAULT_BATCH_SIZE, stride=1, adaptive=False,
+                 tracker=None, cache=None, rois=None, motion_threshold=None):
+        self.model = model
+        self.file_path = file_path
+        self.temp_dir = temp_dir
+        self.signals = signals
+        self.batch_size = max(1, int(batch_size))
+        self.stride = max(1, int(stride))
+        self.adaptive = adaptive
+        self.tracker = tracker # ByteTracker hoặc None (không gán track_id)
+        self.cache = cache # DetectionCache hoặc None
+        self.rois = rois or None # ROI của video: chỉ suy luận trong các polygon này
+        self.motion_threshold = motion_threshold or None # None = suy luận mọi keyframe
+        self.inferred_frames = 0 # Số frame thực sự được đưa vào model
+        self.is_running = True
+        self.temp_originals_dir = os.path.join(self.temp_dir, 'originals')
+        os.makedirs(self.temp_originals_dir, exist_ok=True)
+
+    def run(self):
+        filename = os.path.basename(self.file_path)
+        cap = None
+        try:
+            filename_base = os.path.splitext(filename)[0]
+
+            thumbnail_path, w, h = create_video_thumbnail(
+                self.file_path, os.path.join(self.temp_originals_dir, f"{filename_base}_thumb.jpg"))
+
+            cap = cv2.VideoCapture(self.file_path)
+            if not cap.isOpened():
+                raise IOError(f"Không thể mở video {filename}")
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            if fps <= 0: fps = 30
+            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+            # UI có thể bắt đầu phát ngay, detection được đẩy về theo từng frame
+            self.signals.video_started.emit(self.file_path, thumbnail_path or "", w, h, float(fps), total_frames)
+
+            cache_key = None
+            if self.cache is not None:
+                # Kết quả phụ thuộc cả cách chọn keyframe và tracker, không chỉ model
+                extra = {name: value for name, value in (('rois', self.rois), ('motion', self.motion_threshold)) if value}
+                cache_key = self.cache.key(file_digest(self.file_path), stride=self.stride, adaptive=self.adaptive,
+                                           batch_size=self.batch_size, tracking=self.tracker is not None, **extra)
+                cached = self.cache.get_video(cache_key)
+                if cached is not None:
+                    self.signals.video_processed.emit(self.file_path, cached)
+                    return
+
+            detections = VideoDetections()
+            frame_idx = 0 # Số frame đã đọc/bỏ qua
+            current_stride = self.stride
+            prev_key = None # (frame_idx, detections) của keyframe gần nhất
+            prev_signature = None
+            last_count = 0
+            end_of_video = False
+            gate = MotionGate(self.motion_threshold, self.rois) if self.motion_threshold else None
+
+            while self.is_running and not end_of_video:
+                keyframes = []
+                while len(keyframes) < self.batch_size:
+                    ret, frame = cap.read()
+                    if not ret:
+                        end_of_video = True
+                        break
+                    # Frame bị motion gate bỏ qua giữ chỗ bằng None: dùng lại detection của keyframe trước
+                    keyframes.append((frame_idx, frame if gate is None or gate.should_infer(frame) else None))
+                    frame_idx += 1
+
+                    if self.adaptive:
+                        signature = scene_signature(frame)
+                        if prev_signature is not None and scene_change(prev_signature, signature) > SCENE_CHANGE_THRESHOLD:
+                            current_stride = 1
+                        else:
+                            current_stride = min(self.stride, current_stride + 1)
+                        prev_signature = signature
+
+                    # Bỏ qua các frame giữa hai keyframe bằng grab() (không giải mã)
+                    skipped = 0
+                    while skipped < current_stride - 1:
+                        if not cap.grab():
+                            end_of_video = True
+                            break
+                        skipped += 1
+                        frame_idx += 1
+                    if end_of_video:
+                        break
+                    # Adaptive lúc cảnh yên (stride > 1): suy luận từng keyframe ngay để số detection tăng
+                    # kéo stride về 1 từ keyframe kế tiếp, không trễ cả một lô batch_size * stride frame
+                    if self.adaptive and current_stride > 1:
+                        break
+                if not keyframes:
+                    break
+
+                frames = [f for _, f in keyframes if f is not None]
+                if not frames:
+                    batch_detections = []
+                elif self.rois:
+                    batch_detections = predict_roi_batch(self.model, frames, [self.rois] * len(frames))
+                else:
+                    results = self.model.predict(frames, save=False, verbose=False, iou=PREDICT_IOU)
+                    batch_detections = [results_to_detections(result) for result in results]
+                self.inferred_frames += len(frames)
+                predicted = iter(batch_detections)
+                for key_idx, frame in keyframes:
+                    if frame is not None:
+                        key_dets = next(predicted)
+                    else:
+                        key_dets = prev_key[1] if prev_key is not None else EMPTY_DETECTIONS
+                    if prev_key is not None:
+                        gap = key_idx - prev_key[0]
+                        for idx in range(prev_key[0] + 1, key_idx):
+                            t = (idx - prev_key[0]) / gap
+                            self._emit_frame(detections, idx, interpolate_detections(prev_key[1], key_dets, t))
+                    self._emit_frame(detections, key_idx, key_dets)
+
+                    if self.adaptive and len(key_dets) > last_count:
+                        current_stride = 1
+                    last_count = len(key_dets)
+                    prev_key = (key_idx, key_dets)
+
+            # Các frame sau keyframe cuối giữ nguyên detection cuối cùng
+            if prev_key is not None:
+                for idx in range(prev_key[0] + 1, frame_idx):
+                    self._emit_frame(detections, idx, prev_key[1])
+
+            if cache_key is not None and self.is_running:
+                self.cache.put_video(cache_key, detections)
+            self.signals.video_processed.emit(self.file_path, detections)
+            
+        except Exception as e:
+            self.signals.error.emit(f"Lỗi xử lý video {filename}: {e}")
+        finally:
+            if cap is not None:
+                cap.release()
+            self.signals.finished.emit()
+
+    def _emit_frame(self, detections, frame_idx, frame_dets):
+        track_ids = self.tracker.update(frame_dets, frame_idx) if self.tracker else None
+        detections.append(frame_dets, track_ids)
+        self.signals.video_frame.emit(self.file_path, frame_idx, frame_dets, track_ids)
+
+    def stop(self):
+        self.is_running = False
@@ -7,6 +7,9 @@ import tempfile
 import time
 import subprocess 
 import random 
+import json
+import queue
+from collections import OrderedDict
 
 # --- Thư viện bên ngoài cần thiết ---
 # Cần cài đặt: pip install pyqt5 opencv-python ultralytics mss pynput
@@ -26,216 +29,164 @@ except ImportError:
     Listener = None
 
 
-from PyQt5.QtCore import Qt, QSize, QDir, QRect, QPoint, QTimer, QCoreApplication, QThread, QRectF
+from PyQt5.QtCore import Qt, QSize, QDir, QRect, QPoint, QTimer, QCoreApplication, QThread, QRectF, QPointF
 from PyQt5.QtCore import QObject, pyqtSignal, QThreadPool, QRunnable
-from PyQt5.QtGui import QPixmap, QImage, QIcon, QPainter, QCursor, QColor
+from PyQt5.QtCore import QAbstractListModel, QSortFilterProxyModel, QModelIndex
+from PyQt5.QtGui import QPixmap, QImage, QIcon, QPainter, QCursor, QColor, QPen, QBrush, QFont, QFontMetrics, QPolygonF
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QPushButton, QLabel, QFileDialog,
     QVBoxLayout, QHBoxLayout, QMessageBox, QAction, QToolBar,
-    QSplitter, QListWidget, QGraphicsView, QGraphicsScene, QMenuBar,
-    QListWidgetItem, QSizePolicy, QStatusBar, QToolButton, QSlider,
-    QLineEdit
+    QSplitter, QListView, QGraphicsView, QGraphicsScene, QMenuBar,
+    QSizePolicy, QStatusBar, QToolButton, QSlider,
+    QLineEdit, QInputDialog, QGraphicsItemGroup, QGraphicsRectItem, QGraphicsSimpleTextItem,
+    QGraphicsPolygonItem
 )
 
 # Thư viện YOLOv8
 try:
-    from ultralytics import YOLO
+    import ultralytics # noqa: F401 (load_model import YOLO khi cần)
 except ImportError:
     print("Lỗi: Thiếu thư viện 'ultralytics'. Vui lòng cài đặt bằng: pip install ultralytics")
     sys.exit(1)
 
+# Phần xử lý dùng chung với chế độ dòng lệnh (không phụ thuộc PyQt)
+from vehicle_detector_core import (
+    DEFAULT_BATCH_SIZE, PREDICT_IOU, EMPTY_DETECTIONS, decode_image, make_thumbnail, draw_detections, bgr_to_rgb,
+    export_annotated_video, detections_to_pixel_boxes, VideoDetections, ByteTracker, results_to_detections,
+    ImagePipeline, ParallelImagePipeline, VideoPipeline, DetectionCache, DETECTION_CACHE_DIR, file_digest,
+    inference_params, THUMBNAIL_CACHE_DIR, thumbnail_cache_path, write_image, SearchIndex, FileRecord, DetectionStore,
+    save_session, load_session, load_model, DEFAULT_WARMUP_RUNS, layout_labels,
+    BACKEND_PYTORCH, BACKEND_ONNX, BACKEND_OPENVINO, backend_available,
+    quantize_model, compare_models, read_class_labels, DEFAULT_LABELS_PATH, split_calibration,
+    runtime_backend, tiling_config, MotionGate, DEFAULT_MOTION_THRESHOLD, RoiStore, roi_mask, roi_polygons_px, roi_keep, detections_in_roi
+)
+
 # Buộc PyQt5 render bằng CPU (giải quyết lỗi xung đột DLL)
 os.environ["QT_OPENGL"] = "software" 
 
+# Tên hiển thị của các backend suy luận
+INFERENCE_BACKEND_NAMES = {BACKEND_PYTORCH: "PyTorch", BACKEND_ONNX: "ONNX Runtime", BACKEND_OPENVINO: "OpenVINO"}
+
+# Số ảnh gốc đã giải mã giữ trong bộ nhớ để vẽ lại/hiển thị
+IMAGE_CACHE_SIZE = 4
+
+# Số thumbnail (QPixmap) của File List giữ trong bộ nhớ
+THUMBNAIL_MEMORY_SIZE = 512
+
+# Số frame tối đa chờ trong hàng đợi live (frame cũ bị bỏ để giữ độ trễ thấp)
+LIVE_QUEUE_SIZE = 2
+
+def bgr_to_qimage(img_bgr):
+    """Chuyển ndarray BGR sang QImage RGB888 (sở hữu bộ nhớ riêng)."""
+    rgb = bgr_to_rgb(img_bgr)
+    h, w, ch = rgb.shape
+    return QImage(rgb.data, w, h, ch * w, QImage.Format_RGB888).copy()
+
 # --- Các Tín hiệu và Worker ---
 
 class WorkerSignals(QObject):
-    file_processed = pyqtSignal(str) 
-    result = pyqtSignal(str, str, list, int, int) # original_path, original_image_path (temp), label_data, w, h
-    video_processed = pyqtSignal(str, str, str, int, int) # original_path, result_video_path, thumbnail_path, w, h
+    file_processed = pyqtSignal(str, str, object, int, int, object) # original_path, image_path, detections (Nx6), w, h, thumbnail (BGR)
+    result = pyqtSignal(str, str, object, int, int, object) # original_path, image_path, detections (Nx6), w, h, image (BGR đã giải mã)
+    queue_depths = pyqtSignal(int, int, int) # số lô chờ suy luận, số lô chờ hậu xử lý, sức chứa mỗi hàng đợi
+    video_started = pyqtSignal(str, str, int, int, float, int) # original_path, thumbnail_path, w, h, fps, total_frames
+    video_frame = pyqtSignal(str, int, object, object) # original_path, frame_idx, detections (Nx6), track_ids
+    video_processed = pyqtSignal(str, object) # original_path, VideoDetections
+    video_saved = pyqtSignal(str, str) # original_path, save_path
     
-    recording_finished = pyqtSignal(str) 
+    recording_finished = pyqtSignal(str) # video_path ("" nếu không ghi file)
+    live_frame = pyqtSignal(int, object, object, object) # frame_idx, frame (BGR), detections (Nx6), track_ids
+    thumbnail_loaded = pyqtSignal(str, object) # source_path, QImage (None nếu lỗi)
+    model_progress = pyqtSignal(str) # mô tả bước đang chạy
+    model_quantized = pyqtSignal(str, str, object) # int8_path, report_path, báo cáo so sánh (dict)
+    model_loaded = pyqtSignal(str, str, object, object, object) # model_path, runtime_path, model, DetectionCache, timings (s)
     
     finished = pyqtSignal()
     error = pyqtSignal(str)
 
 class PredictionWorker(QRunnable):
-    """Worker dùng cho xử lý ảnh (Cập nhật: Gửi về W, H)."""
-    def __init__(self, model, file_paths, temp_dir, is_batch=False):
+    """Worker dùng cho xử lý ảnh: chạy ImagePipeline trên threadpool, kết quả gửi qua pyqtSignal."""
+    def __init__(self, model, file_paths, temp_dir, is_batch=False, batch_size=DEFAULT_BATCH_SIZE, label_export_dir=None,
+                 volatile=False, cache=None, tiling=None, rois=None):
         super().__init__()
-        self.model = model
-        self.file_paths = file_paths if isinstance(file_paths, list) else [file_paths]
-        self.temp_dir = temp_dir
-        self.is_batch = is_batch 
         self.signals = WorkerSignals()
-        
-        self.temp_originals_dir = os.path.join(self.temp_dir, 'originals')
-        self.temp_labels_dir = os.path.join(self.temp_dir, 'labels')
-        os.makedirs(self.temp_originals_dir, exist_ok=True)
-        os.makedirs(self.temp_labels_dir, exist_ok=True)
+        self.pipeline = ImagePipeline(model, file_paths, temp_dir, self.signals, is_batch=is_batch, batch_size=batch_size,
+                                      label_export_dir=label_export_dir, volatile=volatile, cache=cache, tiling=tiling,
+                                      rois=rois)
 
     def run(self):
-        try:
-            for file_path in self.file_paths:
-                filename = os.path.basename(file_path)
-                base_name = os.path.splitext(filename)[0]
-                
-                temp_original_path = os.path.join(self.temp_originals_dir, filename)
-                shutil.copy(file_path, temp_original_path)
+        self.pipeline.run()
 
-                img = cv2.imread(temp_original_path)
-                if img is None:
-                    print(f"Không thể đọc ảnh: {temp_original_path}")
-                    continue
-                h, w, _ = img.shape
+class ParallelPredictionWorker(QRunnable):
+    """Worker xử lý thư mục ảnh bằng nhiều tiến trình (ParallelImagePipeline), kết quả theo đúng thứ tự."""
+    def __init__(self, model_path, file_paths, temp_dir, num_workers, batch_size=DEFAULT_BATCH_SIZE,
+                 label_export_dir=None, volatile=False, cache=None, tiling=None, rois=None):
+        super().__init__()
+        self.signals = WorkerSignals()
+        self.pipeline = ParallelImagePipeline(model_path, file_paths, temp_dir, self.signals, num_workers=num_workers,
+                                              batch_size=batch_size, label_export_dir=label_export_dir,
+                                              volatile=volatile, cache=cache, tiling=tiling, rois=rois)
 
-                results = self.model.predict(file_path, save=False, save_txt=True, save_conf=True, 
-                                              project=self.temp_labels_dir, name=f'{base_name}_labels', exist_ok=True, verbose=False, iou=0.7)
-                
-                label_path = os.path.join(self.temp_labels_dir, f'{base_name}_labels', 'labels', f'{base_name}.txt')
-                
-                if not os.path.exists(label_path):
-                    label_dir_path = os.path.join(self.temp_labels_dir, f'{base_name}_labels', 'labels')
-                    if os.path.exists(label_dir_path):
-                        all_labels = [f for f in os.listdir(label_dir_path) if f.endswith('.txt')]
-                        if all_labels:
-                            label_path = os.path.join(label_dir_path, all_labels[0])
-                        else:
-                            open(label_path, 'w').close() 
-                    else:
-                        os.makedirs(label_dir_path, exist_ok=True)
-                        open(label_path, 'w').close() 
-
-                label_data = []
-                if os.path.exists(label_path):
-                    with open(label_path, 'r') as f:
-                        for line in f:
-                            parts = line.strip().split()
-                            if len(parts) >= 6:
-                                try:
-                                    label_data.append([
-                                        int(parts[0]), float(parts[1]), float(parts[2]),
-                                        float(parts[3]), float(parts[4]), float(parts[5])
-                                    ])
-                                except ValueError:
-                                    print(f"Bỏ qua dòng nhãn không hợp lệ: {line}")
-                
-                if self.is_batch:
-                    self.signals.file_processed.emit(file_path)
-                else:
-                    self.signals.result.emit(file_path, temp_original_path, label_data, w, h)
-                    
-        except Exception as e:
-            self.signals.error.emit(f"Lỗi xử lý file {filename}: {e}")
-        finally:
-            self.signals.finished.emit()
+    def run(self):
+        self.pipeline.run()
+
+    def stop(self):
+        self.pipeline.stop()
 
 class VideoWorker(QRunnable):
-    """Worker dùng cho xử lý Video (Cập nhật: Gửi về W, H)."""
-    def __init__(self, model, file_path, temp_dir):
+    """Worker dùng cho xử lý Video: chạy VideoPipeline (stream từng frame) trên threadpool."""
+    def __init__(self, model, file_path, temp_dir, batch_size=DEFAULT_BATCH_SIZE, stride=1, adaptive=False, tracker=None,
+                 cache=None, rois=None, motion_threshold=None):
         super().__init__()
-        self.model = model
-        self.file_path = file_path
-        self.temp_dir = temp_dir
         self.signals = WorkerSignals()
-        self.temp_originals_dir = os.path.join(self.temp_dir, 'originals')
-        os.makedirs(self.temp_originals_dir, exist_ok=True)
+        self.pipeline = VideoPipeline(model, file_path, temp_dir, self.signals, batch_size=batch_size,
+                                      stride=stride, adaptive=adaptive, tracker=tracker, cache=cache, rois=rois,
+                                      motion_threshold=motion_threshold)
 
-    def _create_thumbnail(self, original_video_path, filename_base):
-        thumbnail_path = os.path.join(self.temp_originals_dir, f"{filename_base}_thumb.jpg")
-        width, height = 0, 0
-        
-        try:
-            cap = cv2.VideoCapture(original_video_path)
-            if not cap.isOpened():
-                return None, 0, 0
-            
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            thumb_frame = max(1, total_frames // 3)
-            cap.set(cv2.CAP_PROP_POS_FRAMES, thumb_frame) 
-            
-            ret, frame = cap.read()
-            cap.release()
-            
-            if not ret:
-                return None, width, height
-            
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            h, w, ch = frame_rgb.shape
-            bytes_per_line = ch * w
-            q_img = QImage(frame_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            
-            pixmap = QPixmap.fromImage(q_img)
-            
-            painter = QPainter(pixmap)
-            play_color = QColor(255, 255, 255, 180) 
-            painter.setBrush(play_color)
-            painter.setPen(Qt.NoPen)
-            
-            center_x = pixmap.width() // 2
-            center_y = pixmap.height() // 2
-            size = min(pixmap.width(), pixmap.height()) // 4
-            
-            points = [
-                QPoint(center_x - size // 2 + 5, center_y - size // 2),
-                QPoint(center_x + size // 2 + 5, center_y),
-                QPoint(center_x - size // 2 + 5, center_y + size // 2),
-            ]
-            painter.drawPolygon(*points)
-            painter.end()
+    def run(self):
+        self.pipeline.run()
 
-            pixmap.save(thumbnail_path, "JPG")
-            return thumbnail_path, width, height
+    def stop(self):
+        self.pipeline.stop()
 
-        except Exception as e:
-            print(f"Lỗi tạo thumbnail: {e}")
-            return None, width, height
+class VideoExportWorker(QRunnable):
+    """Worker ghi video kết quả (vẽ detection lên frame gốc) - chỉ chạy khi người dùng lưu."""
+    def __init__(self, source_path, save_path, detections, class_names, class_colors,
+                 show_box=True, show_class=True, show_conf=True):
+        super().__init__()
+        self.source_path = source_path
+        self.save_path = save_path
+        self.detections = detections
+        self.class_names = dict(class_names)
+        self.class_colors = dict(class_colors)
+        self.flags = (show_box, show_class, show_conf)
+        self.signals = WorkerSignals()
 
     def run(self):
         try:
-            filename = os.path.basename(self.file_path)
-            filename_base = os.path.splitext(filename)[0]
-
-            thumbnail_path, w, h = self._create_thumbnail(self.file_path, filename_base)
-            
-            results = self.model.predict(self.file_path, save=True, 
-                                          project=self.temp_dir, name='yolo_video_results', exist_ok=True, verbose=False, iou=0.7)
-            
-            save_dir = results[0].save_dir
-            result_video_path = None
-            
-            processed_files = []
-            for f in os.listdir(save_dir):
-                if f.endswith(('.mp4', '.avi')):
-                    processed_files.append(os.path.join(save_dir, f))
-            
-            if processed_files:
-                result_video_path = max(processed_files, key=os.path.getmtime)
-            
-            if not result_video_path or not os.path.exists(result_video_path):
-                 result_video_path = os.path.join(save_dir, filename)
-                 if not os.path.exists(result_video_path):
-                    raise FileNotFoundError(f"Không tìm thấy video kết quả sau xử lý tại {save_dir}")
-            
-            self.signals.video_processed.emit(self.file_path, result_video_path, thumbnail_path, w, h)
-            
+            export_annotated_video(self.source_path, self.save_path, self.detections,
+                                   self.class_names, self.class_colors, *self.flags)
+            self.signals.video_saved.emit(self.source_path, self.save_path)
         except Exception as e:
-            self.signals.error.emit(f"Lỗi xử lý video {filename}: {e}")
+            self.signals.error.emit(f"Lỗi ghi video {os.path.basename(self.save_path)}: {e}")
         finally:
             self.signals.finished.emit()
 
 class RecordingWorker(QRunnable):
-    """Worker để quay video màn hình trong một luồng riêng biệt."""
-    def __init__(self, rect, temp_dir, fps=20):
+    """Worker để quay video màn hình trong một luồng riêng biệt.
+
+    Nếu có frame_queue, mỗi frame được đẩy vào hàng đợi (giới hạn) cho LiveDetectionWorker;
+    record=False bỏ hẳn bước ghi file.
+    """
+    def __init__(self, rect, temp_dir, fps=20, frame_queue=None, record=True):
         super().__init__()
         self.signals = WorkerSignals()
         self.rect = rect
         self.temp_dir = temp_dir
         self.fps = fps
+        self.frame_queue = frame_queue
+        self.record = record
         self.is_running = True
+        self.live_queue_closed = False
         
         self.width = rect.width() - (rect.width() % 2)
         self.height = rect.height() - (rect.height() % 2)
@@ -246,16 +197,39 @@ class RecordingWorker(QRunnable):
             'height': self.height
         }
 
+    def _push_live_frame(self, item):
+        """Đẩy frame (hoặc None để báo dừng) vào hàng đợi live; nếu đầy thì bỏ frame cũ nhất."""
+        try:
+            self.frame_queue.put_nowait(item)
+        except queue.Full:
+            try:
+                self.frame_queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.frame_queue.put_nowait(item)
+            except queue.Full:
+                pass
+
+    def _close_live_queue(self):
+        """Báo LiveDetectionWorker dừng (một lần) sau frame cuối cùng."""
+        if self.frame_queue is not None and not self.live_queue_closed:
+            self.live_queue_closed = True
+            self._push_live_frame(None)
+
     def run(self):
-        video_path = os.path.join(self.temp_dir, f"recording_{int(time.time())}.mp4")
+        video_path = os.path.join(self.temp_dir, f"recording_{int(time.time())}.mp4") if self.record else ""
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        writer = None
         
         try:
-            writer = cv2.VideoWriter(video_path, fourcc, self.fps, (self.width, self.height))
-            if not writer.isOpened():
-                raise Exception("Không thể khởi tạo VideoWriter.")
+            if self.record:
+                writer = cv2.VideoWriter(video_path, fourcc, self.fps, (self.width, self.height))
+                if not writer.isOpened():
+                    raise Exception("Không thể khởi tạo VideoWriter.")
                 
             sct = mss()
+            frame_idx = 0
             
             while self.is_running:
                 start_time = time.time()
@@ -264,25 +238,205 @@ class RecordingWorker(QRunnable):
                 frame = np.array(img)
                 frame_bgr = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
                 
-                writer.write(frame_bgr)
+                if writer is not None:
+                    writer.write(frame_bgr)
+                if self.frame_queue is not None:
+                    self._push_live_frame((frame_idx, frame_bgr))
+                frame_idx += 1
                 
                 elapsed = time.time() - start_time
                 sleep_time = (1.0 / self.fps) - elapsed
                 if sleep_time > 0:
                     time.sleep(sleep_time)
 
-            writer.release()
+            if writer is not None:
+                writer.release()
+            # Đóng hàng đợi trước khi báo xong để UI chờ live worker xử lý hết các frame còn lại
+            self._close_live_queue()
             self.signals.recording_finished.emit(video_path)
             
         except Exception as e:
             self.signals.error.emit(f"Lỗi khi đang quay: {e}")
         finally:
-            if 'writer' in locals() and writer.isOpened():
+            if writer is not None and writer.isOpened():
                 writer.release()
+            self._close_live_queue()
 
     def stop(self):
         self.is_running = False
 
+class LiveDetectionWorker(QRunnable):
+    """Worker suy luận các frame màn hình lấy từ hàng đợi, gửi kết quả về UI ngay.
+
+    Với motion_threshold, frame gần như không đổi so với frame suy luận gần nhất dùng lại detection cũ.
+    """
+    def __init__(self, model, frame_queue, tracker=None, motion_threshold=None):
+        super().__init__()
+        self.model = model
+        self.frame_queue = frame_queue
+        self.tracker = tracker
+        self.gate = MotionGate(motion_threshold) if motion_threshold else None
+        self.signals = WorkerSignals()
+
+    def run(self):
+        detections = None
+        try:
+            while True:
+                item = self.frame_queue.get()
+                if item is None:
+                    break
+                frame_idx, frame = item
+                # Gate luôn xem frame (kể cả frame đầu) để frame tham chiếu đúng là frame đã suy luận
+                infer = self.gate is None or self.gate.should_infer(frame)
+                if infer or detections is None:
+                    result = self.model.predict(frame, save=False, verbose=False, iou=PREDICT_IOU)[0]
+                    detections = results_to_detections(result)
+                track_ids = self.tracker.update(detections, frame_idx) if self.tracker else None
+                self.signals.live_frame.emit(frame_idx, frame, detections, track_ids)
+        except Exception as e:
+            self.signals.error.emit(f"Lỗi phát hiện trực tiếp: {e}")
+        finally:
+            self.signals.finished.emit()
+
+class ModelLoadWorker(QRunnable):
+    """Export (nếu cần) + load model + warm-up + hash trọng số (cho detection cache) ngoài luồng UI."""
+    def __init__(self, model_path, warmup_runs=DEFAULT_WARMUP_RUNS, backend=BACKEND_PYTORCH):
+        super().__init__()
+        self.model_path = model_path
+        self.warmup_runs = warmup_runs
+        self.backend = backend
+        self.signals = WorkerSignals()
+
+    def run(self):
+        try:
+            model, runtime_path, timings = load_model(self.model_path, self.warmup_runs,
+                                                      progress=self.signals.model_progress.emit, backend=self.backend)
+            self.signals.model_progress.emit("Đang tính hash model...")
+            start = time.perf_counter()
+            cache = DetectionCache(DETECTION_CACHE_DIR, file_digest(self.model_path),
+                                   inference_params(model, self.backend))
+            timings['hash_s'] = time.perf_counter() - start
+            self.signals.model_loaded.emit(self.model_path, runtime_path, model, cache, timings)
+        except Exception as e:
+            self.signals.error.emit(f"Lỗi: Không load được model: {e}")
+        finally:
+            self.signals.finished.emit()
+
+class QuantizeWorker(QRunnable):
+    """Lượng tử hóa INT8 từ thư mục ảnh hiệu chuẩn rồi so sánh với model FP32 theo từng class."""
+    def __init__(self, model, model_path, calibration_paths, eval_paths, class_names):
+        super().__init__()
+        self.model = model
+        self.model_path = model_path
+        self.calibration_paths = calibration_paths
+        self.eval_paths = eval_paths # Ảnh đánh giá, không nằm trong tập hiệu chuẩn
+        self.class_names = class_names
+        self.signals = WorkerSignals()
+
+    def run(self):
+        try:
+            progress = self.signals.model_progress.emit
+            int8_path = quantize_model(self.model_path, self.calibration_paths, progress=progress)
+            candidate, _, _ = load_model(int8_path, warmup_runs=0, progress=progress)
+            report = compare_models(self.model, candidate, self.eval_paths, self.class_names, progress=progress)
+            report.update(reference_model=self.model_path, candidate_model=int8_path,
+                          calibration_images=self.calibration_paths, eval_images=self.eval_paths)
+            report_path = f"{os.path.splitext(int8_path)[0]}_report.json"
+            with open(report_path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            self.signals.model_quantized.emit(int8_path, report_path, report)
+        except Exception as e:
+            self.signals.error.emit(f"Lỗi lượng tử hóa INT8: {e}")
+        finally:
+            self.signals.finished.emit()
+
+class ThumbnailWorker(QRunnable):
+    """Đọc/tạo thumbnail ở luồng nền: ưu tiên file trên đĩa, chưa có thì thu nhỏ từ ảnh nguồn và ghi lại."""
+    def __init__(self, tasks, cache_dir):
+        super().__init__()
+        self.tasks = tasks # list (source_path, thumbnail BGR hoặc None)
+        self.cache_dir = cache_dir
+        self.signals = WorkerSignals()
+
+    def run(self):
+        for source_path, thumbnail in self.tasks:
+            disk_path = thumbnail_cache_path(self.cache_dir, source_path)
+            try:
+                if thumbnail is not None:
+                    # Thumbnail đã có trong bộ nhớ, chỉ cần ghi xuống đĩa
+                    if not os.path.exists(disk_path):
+                        os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+                        write_image(disk_path, thumbnail)
+                    continue
+
+                thumbnail = decode_image(disk_path) if os.path.exists(disk_path) else None
+                if thumbnail is None:
+                    image = decode_image(source_path)
+                    if image is not None:
+                        thumbnail = make_thumbnail(image)
+                        os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+                        write_image(disk_path, thumbnail)
+                self.signals.thumbnail_loaded.emit(source_path, bgr_to_qimage(thumbnail) if thumbnail is not None else None)
+            except Exception as e:
+                print(f"Lỗi tạo thumbnail {source_path}: {e}")
+                self.signals.thumbnail_loaded.emit(source_path, None)
+
+class ThumbnailCache(QObject):
+    """Thumbnail ~128px cho File List: LRU QPixmap trong bộ nhớ + file JPEG trên đĩa, đọc/tạo ở luồng nền."""
+    thumbnail_ready = pyqtSignal(str) # source_path
+
+    def __init__(self, threadpool, cache_dir=THUMBNAIL_CACHE_DIR, capacity=THUMBNAIL_MEMORY_SIZE, parent=None):
+        super().__init__(parent)
+        self.threadpool = threadpool
+        self.cache_dir = cache_dir
+        self.capacity = capacity
+        self._pixmaps = OrderedDict() # source_path -> QPixmap (LRU)
+        self._pending = set()
+        self._tasks = []
+
+    def get(self, source_path):
+        """QPixmap nếu đã có trong bộ nhớ; chưa có thì xếp lịch đọc/tạo ở nền và trả về None."""
+        pixmap = self._pixmaps.get(source_path)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(source_path)
+            return pixmap
+        if source_path not in self._pending:
+            self._pending.add(source_path)
+            self._enqueue((source_path, None))
+        return None
+
+    def put(self, source_path, thumbnail_bgr):
+        """Nhận thumbnail BGR đã tạo sẵn (từ worker suy luận): giữ trong bộ nhớ và ghi xuống đĩa ở nền."""
+        self._remember(source_path, QPixmap.fromImage(bgr_to_qimage(thumbnail_bgr)))
+        self._enqueue((source_path, thumbnail_bgr))
+
+    def _enqueue(self, task):
+        # Gom các yêu cầu trong cùng một vòng event loop vào một worker
+        if not self._tasks:
+            QTimer.singleShot(0, self._flush)
+        self._tasks.append(task)
+
+    def _flush(self):
+        tasks, self._tasks = self._tasks, []
+        if not tasks:
+            return
+        worker = ThumbnailWorker(tasks, self.cache_dir)
+        worker.signals.thumbnail_loaded.connect(self._on_loaded)
+        self.threadpool.start(worker)
+
+    def _on_loaded(self, source_path, qimage):
+        self._pending.discard(source_path)
+        if qimage is None:
+            return
+        self._remember(source_path, QPixmap.fromImage(qimage))
+        self.thumbnail_ready.emit(source_path)
+
+    def _remember(self, source_path, pixmap):
+        self._pixmaps[source_path] = pixmap
+        self._pixmaps.move_to_end(source_path)
+        while len(self._pixmaps) > self.capacity:
+            self._pixmaps.popitem(last=False)
+
 # --- Chức năng Chụp màn hình (Sử dụng QScreen.grabWindow) ---
 
 class ScreenshotTool(QMainWindow):
@@ -377,10 +531,151 @@ class ScreenshotTool(QMainWindow):
 
 # --- Các lớp UI Chính ---
 
+class FileListModel(QAbstractListModel):
+    """Model của File List: mỗi hàng chỉ giữ đường dẫn, text/icon được tính lười khi view cần vẽ.
+
+    Hàng gần như chỉ được nối thêm (index path -> row ổn định, chỉ hàng tạm bị lỗi mới bị xóa); thứ tự hiển thị
+    do OrderRole quyết định, file "đưa lên đầu" nhận order âm và proxy sắp xếp lại.
+    """
+    PathRole = Qt.UserRole
+    OrderRole = Qt.UserRole + 1
+
+    def __init__(self, text_provider, icon_provider, parent=None):
+        super().__init__(parent)
+        self.text_provider = text_provider # (path, view_mode) -> str
+        self.icon_provider = icon_provider # (path, view_mode) -> QIcon
+        self.view_mode = 'icon'
+        self._paths = []
+        self._orders = []
+        self._rows = {} # path -> row
+        self._thumbnail_rows = {} # nguồn thumbnail -> row
+        self._next_order = 0
+        self._front_order = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._paths)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        path = self._paths[index.row()]
+        if role == Qt.DisplayRole:
+            return self.text_provider(path, self.view_mode)
+        if role == Qt.DecorationRole:
+            return self.icon_provider(path, self.view_mode)
+        if role in (Qt.ToolTipRole, self.PathRole):
+            return path
+        if role == self.OrderRole:
+            return self._orders[index.row()]
+        return None
+
+    def contains(self, path):
+        return path in self._rows
+
+    def path_at(self, row):
+        return self._paths[row]
+
+    def row_of(self, path):
+        return self._rows.get(path, -1)
+
+    def add_file(self, path, front=False, thumbnail_source=None):
+        """Thêm file, hoặc đưa file đã có lên đầu nếu front=True. Trả về row trong model."""
+        if front:
+            self._front_order -= 1
+            order = self._front_order
+        else:
+            self._next_order += 1
+            order = self._next_order
+
+        row = self._rows.get(path)
+        if row is None:
+            row = len(self._paths)
+            self.beginInsertRows(QModelIndex(), row, row)
+            self._paths.append(path)
+            self._orders.append(order)
+            self._rows[path] = row
+            self.endInsertRows()
+        else:
+            if front:
+                self._orders[row] = order
+            self.refresh(path)
+
+        if thumbnail_source:
+            self._thumbnail_rows[thumbnail_source] = row
+        return row
+
+    def add_files(self, paths, thumbnail_sources):
+        """Nối nhiều file mới trong một lần chèn (mở phiên lớn), bỏ qua file đã có."""
+        new = [(path, source) for path, source in zip(paths, thumbnail_sources) if path not in self._rows]
+        if not new:
+            return
+        first = len(self._paths)
+        self.beginInsertRows(QModelIndex(), first, first + len(new) - 1)
+        for row, (path, source) in enumerate(new, first):
+            self._next_order += 1
+            self._paths.append(path)
+            self._orders.append(self._next_order)
+            self._rows[path] = row
+            if source:
+                self._thumbnail_rows[source] = row
+        self.endInsertRows()
+
+    def remove_file(self, path):
+        """Xóa một hàng (VD: hàng tạm của video xử lý lỗi), đánh lại row cho các hàng phía sau."""
+        row = self._rows.get(path)
+        if row is None:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._paths[row]
+        del self._orders[row]
+        self._rows = {p: i for i, p in enumerate(self._paths)}
+        self._thumbnail_rows = {source: r - (r > row) for source, r in self._thumbnail_rows.items() if r != row}
+        self.endRemoveRows()
+
+    def refresh(self, path):
+        row = self._rows.get(path)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+    def refresh_thumbnail(self, thumbnail_source):
+        row = self._thumbnail_rows.get(thumbnail_source)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def set_view_mode(self, mode):
+        """Đổi kiểu hiển thị: chỉ phát một dataChanged, view tự hỏi lại text/icon của các hàng đang vẽ."""
+        self.view_mode = mode
+        if self._paths:
+            self.dataChanged.emit(self.index(0), self.index(len(self._paths) - 1), [Qt.DisplayRole, Qt.DecorationRole])
+
+    def clear(self):
+        self.beginResetModel()
+        self._paths, self._orders, self._rows, self._thumbnail_rows = [], [], {}, {}
+        self._next_order = self._front_order = 0
+        self.endResetModel()
+
+class FileFilterProxyModel(QSortFilterProxyModel):
+    """Lọc theo tập path khớp truy vấn (tính sẵn từ SearchIndex) và sắp xếp theo OrderRole của FileListModel."""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.matches = None # None = không lọc
+        self.setSortRole(FileListModel.OrderRole)
+        self.setDynamicSortFilter(True)
+
+    def set_matches(self, paths):
+        self.matches = paths
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        return self.matches is None or self.sourceModel().path_at(source_row) in self.matches
+
 class MainViewer(QGraphicsView):
     drag_enter_signal = pyqtSignal()
     drag_leave_signal = pyqtSignal()
     drop_signal = pyqtSignal(list)
+    roi_drawn = pyqtSignal(list) # list[(x, y)] pixel trên ảnh gốc
     
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -389,6 +684,11 @@ class MainViewer(QGraphicsView):
         self.setScene(self.scene)
         self.current_pixmap_item = None 
         self.current_pixmap = None 
+        self.overlay_layers = {} # 'box' / 'class' / 'conf' -> QGraphicsItemGroup vẽ phía trên ảnh
+        self.roi_layer = None
+        self.roi_mode = None # None / 'rect' / 'polygon'
+        self._roi_points = []
+        self._roi_preview = None
         
         self.setRenderHint(QPainter.Antialiasing)
         self.setDragMode(QGraphicsView.ScrollHandDrag)
@@ -405,6 +705,8 @@ class MainViewer(QGraphicsView):
         self.current_pixmap = new_pixmap 
         
         self.scene.clear()
+        self.overlay_layers = {}
+        self._reset_roi_items()
         self.current_pixmap_item = self.scene.addPixmap(new_pixmap)
             
         self.scene.setSceneRect(self.scene.itemsBoundingRect())
@@ -432,8 +734,135 @@ class MainViewer(QGraphicsView):
             
             self.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)
 
+    def set_overlay(self, boxes, colors, class_labels, conf_labels):
+        """Dựng overlay vector phía trên ảnh: lớp box, lớp nhãn class, lớp nhãn class + conf.
+
+        boxes là mảng Nx4 (x1, y1, x2, y2) pixel, colors là màu BGR. Bật/tắt hiển thị chỉ cần
+        set_overlay_visible, không phải vẽ lại ảnh.
+        """
+        self.clear_overlay()
+        if not len(boxes):
+            return
+
+        img_h = self.current_pixmap.height() if self.current_pixmap is not None else 0
+        font = QFont()
+        font.setPixelSize(14)
+        font.setBold(True)
+
+        box_layer, class_layer, conf_layer = QGraphicsItemGroup(), QGraphicsItemGroup(), QGraphicsItemGroup()
+        qcolors = [QColor(int(r), int(g), int(b)) for b, g, r in colors]
+        for (x1, y1, x2, y2), color in zip(boxes.tolist(), qcolors):
+            rect_item = QGraphicsRectItem(x1, y1, x2 - x1, y2 - y1)
+            rect_item.setPen(QPen(color, 2))
+            box_layer.addToGroup(rect_item)
+        for layer, labels in ((class_layer, class_labels), (conf_layer, conf_labels)):
+            for item in self._make_label_items(labels, font, qcolors, boxes, img_h):
+                layer.addToGroup(item)
+
+        for z, (name, layer) in enumerate((('box', box_layer), ('class', class_layer), ('conf', conf_layer)), start=1):
+            layer.setZValue(z)
+            self.scene.addItem(layer)
+            self.overlay_layers[name] = layer
+
+    def _make_label_items(self, labels, font, colors, boxes, img_h):
+        """Nhãn có nền màu class, bố trí bằng layout_labels như draw_detections (mỗi nhãn dựng một lần)."""
+        descent = QFontMetrics(font).descent()
+        text_items, sizes = [], []
+        for label in labels:
+            text_item = QGraphicsSimpleTextItem(label)
+            text_item.setFont(font)
+            text_item.setBrush(QBrush(Qt.black))
+            text_rect = text_item.boundingRect()
+            text_items.append(text_item)
+            sizes.append((text_rect.width(), text_rect.height() - descent, descent)) # (w, phần trên baseline, baseline)
+
+        text_sizes = np.ceil(np.array(sizes, dtype=np.float32)).astype(np.int32)
+        rect_top, _, _ = layout_labels(np.asarray(boxes, dtype=np.int32), text_sizes, img_h)
+        backgrounds = []
+        for text_item, color, x1, top in zip(text_items, colors, boxes[:, 0].tolist(), rect_top.tolist()):
+            text_rect = text_item.boundingRect()
+            background = QGraphicsRectItem(0, 0, text_rect.width(), text_rect.height())
+            background.setBrush(QBrush(color))
+            background.setPen(QPen(Qt.NoPen))
+            background.setPos(x1, top)
+            text_item.setParentItem(background)
+            backgrounds.append(background)
+        return backgrounds
+
+    def set_overlay_visible(self, show_box, show_class, show_conf):
+        if not self.overlay_layers:
+            return
+        self.overlay_layers['box'].setVisible(show_box)
+        self.overlay_layers['class'].setVisible(show_box and show_class and not show_conf)
+        self.overlay_layers['conf'].setVisible(show_box and show_class and show_conf)
+
+    def clear_overlay(self):
+        for layer in self.overlay_layers.values():
+            self.scene.removeItem(layer)
+        self.overlay_layers = {}
+
+    # --- ROI ---
+    def _reset_roi_items(self):
+        """Gọi sau scene.clear(): các item ROI đã bị xoá cùng scene."""
+        self.roi_layer = None
+        self._roi_preview = None
+        self._roi_points = []
+
+    def set_rois(self, polygons):
+        """Vẽ các ROI (list polygon pixel) thành lớp viền nét đứt phía trên overlay."""
+        if self.roi_layer is not None:
+            self.scene.removeItem(self.roi_layer)
+            self.roi_layer = None
+        if not polygons:
+            return
+        pen = QPen(QColor(255, 215, 0), 2, Qt.DashLine)
+        pen.setCosmetic(True)
+        layer = QGraphicsItemGroup()
+        for points in polygons:
+            item = QGraphicsPolygonItem(QPolygonF([QPointF(float(x), float(y)) for x, y in points]))
+            item.setPen(pen)
+            layer.addToGroup(item)
+        layer.setZValue(4)
+        self.scene.addItem(layer)
+        self.roi_layer = layer
+
+    def set_roi_mode(self, mode):
+        """Bật chế độ vẽ ROI ('rect' / 'polygon') hoặc tắt (None); khi vẽ thì tắt kéo ảnh."""
+        self._cancel_roi()
+        self.roi_mode = mode
+        self.setDragMode(QGraphicsView.NoDrag if mode else QGraphicsView.ScrollHandDrag)
+        self.viewport().setCursor(Qt.CrossCursor if mode else Qt.OpenHandCursor)
+
+    def _cancel_roi(self):
+        if self._roi_preview is not None:
+            self.scene.removeItem(self._roi_preview)
+            self._roi_preview = None
+        self._roi_points = []
+
+    def _image_point(self, event):
+        """Toạ độ pixel trên ảnh của vị trí chuột, kẹp trong biên ảnh."""
+        pos = self.mapToScene(event.pos())
+        w, h = self.current_pixmap.width(), self.current_pixmap.height()
+        return (min(max(pos.x(), 0.0), float(w)), min(max(pos.y(), 0.0), float(h)))
+
+    def _update_roi_preview(self, points):
+        if self._roi_preview is None:
+            pen = QPen(QColor(255, 215, 0), 2, Qt.DotLine)
+            pen.setCosmetic(True)
+            self._roi_preview = QGraphicsPolygonItem()
+            self._roi_preview.setPen(pen)
+            self._roi_preview.setZValue(5)
+            self.scene.addItem(self._roi_preview)
+        self._roi_preview.setPolygon(QPolygonF([QPointF(x, y) for x, y in points]))
+
+    def _finish_roi(self, points):
+        self._cancel_roi()
+        self.roi_drawn.emit(points)
+
     def clear_view(self):
         self.scene.clear()
+        self.overlay_layers = {}
+        self._reset_roi_items()
         self.current_pixmap = None
         self.current_pixmap_item = None
         self.scene.setSceneRect(QRectF()) # Reset SceneRect
@@ -459,7 +888,17 @@ class MainViewer(QGraphicsView):
             super().wheelEvent(event)
             
     def mousePressEvent(self, event):
-        """Fit to View bằng chuột giữa."""
+        """Fit to View bằng chuột giữa; ở chế độ ROI thì chuột trái vẽ, chuột phải huỷ."""
+        if self.roi_mode and self.current_pixmap is not None and event.button() in (Qt.LeftButton, Qt.RightButton):
+            if event.button() == Qt.RightButton:
+                self._cancel_roi()
+            elif self.roi_mode == 'rect':
+                self._roi_points = [self._image_point(event)]
+            else:
+                self._roi_points.append(self._image_point(event))
+                self._update_roi_preview(self._roi_points)
+            event.accept()
+            return
         if event.button() == Qt.MiddleButton:
             if self.current_pixmap_item:
                 
@@ -469,6 +908,35 @@ class MainViewer(QGraphicsView):
                 self.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)
         else:
             super().mousePressEvent(event)
+
+    def mouseMoveEvent(self, event):
+        if self.roi_mode == 'rect' and self._roi_points:
+            (x1, y1), (x2, y2) = self._roi_points[0], self._image_point(event)
+            self._update_roi_preview([(x1, y1), (x2, y1), (x2, y2), (x1, y2)])
+            event.accept()
+            return
+        super().mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if self.roi_mode == 'rect' and self._roi_points and event.button() == Qt.LeftButton:
+            (x1, y1), (x2, y2) = self._roi_points[0], self._image_point(event)
+            if abs(x2 - x1) > 3 and abs(y2 - y1) > 3:
+                self._finish_roi([(x1, y1), (x2, y1), (x2, y2), (x1, y2)])
+            else:
+                self._cancel_roi()
+            event.accept()
+            return
+        super().mouseReleaseEvent(event)
+
+    def mouseDoubleClickEvent(self, event):
+        """Double-click khép polygon ROI (cần ít nhất 3 đỉnh)."""
+        if self.roi_mode == 'polygon' and event.button() == Qt.LeftButton:
+            # Lần nhấn thứ hai của double-click không qua mousePressEvent nên đỉnh cuối đã có sẵn.
+            if len(self._roi_points) >= 3:
+                self._finish_roi(list(self._roi_points))
+            event.accept()
+            return
+        super().mouseDoubleClickEvent(event)
             
     def resizeEvent(self, event):
         """Tự động Fit to View khi thay đổi kích thước cửa sổ."""
@@ -513,34 +981,67 @@ class VehicleDetectorGUI(QMainWindow):
 
         # --- Trạng thái Mô hình & Dữ liệu ---
         self.model = None
+        self.model_path = None
+        self.runtime_model_path = None # File thực sự được load (bản export ONNX/OpenVINO nếu có)
+        self.inference_backend = BACKEND_PYTORCH
+        self.loading_backend = BACKEND_PYTORCH # Backend của lần load đang chạy
+        self.detection_cache = None # DetectionCache của model hiện tại
+        self.cache_enabled = True
         self.class_names = {} 
         self.class_colors = {} 
         
         self.current_image_path = None 
         self.auto_save = False
         self.export_location = None
-        self.file_list = [] 
-        self.save_status = {} 
         self.listed_file_names = set() 
-        self.file_metadata = {} 
+        self.file_metadata = {} # path -> FileRecord
+        self.detection_store = DetectionStore() # detection của mọi ảnh, theo file_id
         self.file_id_counter = 0 
+        self.batch_size = DEFAULT_BATCH_SIZE
+        self.warmup_runs = DEFAULT_WARMUP_RUNS # Số lần suy luận ảnh giả sau khi load model (0 = tắt)
+        self.model_loading = False
+        self.pending_model_load = None # Model cần load ngay khi tác vụ model hiện tại kết thúc
+        self.process_workers = 0 # Số tiến trình suy luận thư mục ảnh (0 = chạy trên 1 luồng)
+        self.video_stride = 1 # Suy luận 1 frame mỗi N frame video
+        self.video_adaptive = False
+        self.motion_threshold = 0.0 # Motion gate cho video/live (0 = suy luận mọi frame)
+        self.tiling = tiling_config() # Tham số suy luận theo tile cho ảnh lớn
+        self.tiling_enabled = False
+        self.rois = RoiStore() # ROI người dùng vẽ, theo đường dẫn file (lưu bền vững)
+        self.roi_masks = {} # (path, w, h) -> mask ROI đã dựng, dùng để lọc detection khi hiển thị
+        self.tracking_enabled = True # Gán track_id ổn định cho video/live
+        self.label_export_dir = None # Xuất file nhãn .txt (tùy chọn)
+        self.image_cache = OrderedDict() # image_path -> ảnh BGR đã giải mã (LRU)
 
         self.temp_dir = tempfile.mkdtemp()
         self.temp_image_result_dir = os.path.join(self.temp_dir, 'yolo_image_results')
         
         self.threadpool = QThreadPool()
+        self.thumbnails = ThumbnailCache(self.threadpool, parent=self)
+        self.pending_videos = set() # Video đang chờ VideoWorker bắt đầu (hiện "Đang xử lý...")
+        self.search_index = SearchIndex() # Tên file + detection theo class, cập nhật khi worker xử lý xong
+        self.search_query = "" # Truy vấn đang lọc File List
+        self.search_index_stale = False # Mở phiên chỉ nạp detection; chỉ mục dựng lại khi tìm kiếm lần đầu
         
         self.widget_styles = {}
         
         # --- Video Playback Attributes ---
         self.video_timer = QTimer(self)
         self.video_capture = None
-        self.current_video_result_path = None
+        self.video_frame = None # (frame_idx, frame gốc) đang hiển thị, để vẽ lại khi tạm dừng
+        self.current_video_path = None
         self.video_timer.timeout.connect(self._next_video_frame) 
 
         self.current_recorder = None
         self.key_listener = None # Listener cho phím 'Esc'
 
+        # --- Phát hiện trực tiếp (live) trên vùng màn hình ---
+        self.live_mode_pending = False
+        self.is_live_mode = False
+        self.live_record = False # Có ghi lại file video khi chạy live hay không
+        self.live_detections = None
+        self.live_finish = {} # Khi dừng live: chờ đủ 'video_path' (recorder xong) và 'worker_done' (live worker xong)
+
         # --- Trạng thái Show/Hide ---
         self.is_box_visible = True
         self.is_class_visible = True
@@ -553,6 +1054,7 @@ class VehicleDetectorGUI(QMainWindow):
         self.icon_video_path = "D:/model_completed/executive/video_icon.png".replace("\\", "/")
         self.icon_image_default = QIcon(self.icon_image_path)
         self.icon_video_default = QIcon(self.icon_video_path)
+        self.icon_video_processing = QIcon.fromTheme("video-x-generic")
         
         self.init_ui()
         
@@ -588,14 +1090,14 @@ class VehicleDetectorGUI(QMainWindow):
             self.setWindowOpacity(1.0) # Khôi phục độ mờ hoàn toàn
             self.show()
 
-    def _start_video_playback(self, result_path):
-        """Bắt đầu chạy video trong MainViewer."""
+    def _start_video_playback(self, video_path):
+        """Bắt đầu chạy video gốc trong MainViewer (detection được vẽ lúc hiển thị)."""
         self._stop_video_playback()
         
-        self.video_capture = cv2.VideoCapture(result_path)
+        self.video_capture = cv2.VideoCapture(video_path)
         
         if not self.video_capture.isOpened():
-            self.show_status_message(f"Lỗi: Không thể mở video kết quả '{os.path.basename(result_path)}'.", 5000)
+            self.show_status_message(f"Lỗi: Không thể mở video '{os.path.basename(video_path)}'.", 5000)
             self.video_capture = None
             return
 
@@ -607,7 +1109,7 @@ class VehicleDetectorGUI(QMainWindow):
         self.video_slider.setValue(0)
         
         self.video_timer.start(int(1000 / fps)) 
-        self.current_video_result_path = result_path
+        self.current_video_path = video_path
         self.btn_play_pause.setIcon(QIcon.fromTheme("media-playback-pause"))
         self.show_status_message(f"Đang phát video với FPS: {fps:.1f}", 2000)
         
@@ -618,7 +1120,8 @@ class VehicleDetectorGUI(QMainWindow):
         if self.video_capture:
             self.video_capture.release()
             self.video_capture = None
-        self.current_video_result_path = None
+        self.video_frame = None
+        self.current_video_path = None
         self.btn_play_pause.setIcon(QIcon.fromTheme("media-playback-start"))
         
     def _toggle_play_pause(self):
@@ -643,14 +1146,18 @@ class VehicleDetectorGUI(QMainWindow):
     def _next_video_frame(self):
         """Đọc frame tiếp theo và cập nhật MainViewer."""
         if self.video_capture and self.video_capture.isOpened():
+            metadata = self.file_metadata.get(self.current_image_path)
+            detections = metadata.detections if metadata else None
+            frame_idx = int(self.video_capture.get(cv2.CAP_PROP_POS_FRAMES))
+
+            # Video còn đang xử lý: chờ tới khi frame này có detection
+            if metadata and metadata.processing and detections is not None and frame_idx >= len(detections):
+                return
+
             ret, frame = self.video_capture.read()
             if ret:
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                height, width, channel = frame.shape
-                bytes_per_line = 3 * width
-                q_image = QImage(frame.data, width, height, bytes_per_line, QImage.Format_RGB888)
-                
-                self.main_viewer.update_video_frame(q_image) 
+                self.video_frame = (frame_idx, frame)
+                self._show_video_frame(frame_idx, frame, detections)
                 
                 frame_num = self.video_capture.get(cv2.CAP_PROP_POS_FRAMES)
                 total_frames = self.video_capture.get(cv2.CAP_PROP_FRAME_COUNT)
@@ -666,6 +1173,18 @@ class VehicleDetectorGUI(QMainWindow):
         else:
             self._stop_video_playback()
 
+    def _show_video_frame(self, frame_idx, frame, detections):
+        """Vẽ detection (theo cờ Show/Hide và ROI) lên bản sao của frame gốc rồi hiển thị."""
+        frame = frame.copy() # Giữ frame gốc để vẽ lại khi đổi cờ lúc đang tạm dừng
+        if detections is not None:
+            frame_dets, track_ids = detections.get(frame_idx), detections.get_track_ids(frame_idx)
+            mask = self._roi_mask_for(self.current_image_path, frame.shape[1], frame.shape[0])
+            if mask is not None and len(frame_dets):
+                inside = roi_keep(frame_dets, mask)
+                frame_dets, track_ids = frame_dets[inside], track_ids[inside]
+            self._draw_detections(frame, frame_dets, track_ids)
+        self.main_viewer.update_video_frame(bgr_to_qimage(frame))
+
     def __del__(self):
         self._stop_video_playback()
         if self.current_recorder:
@@ -716,6 +1235,7 @@ class VehicleDetectorGUI(QMainWindow):
         self.main_viewer = MainViewer()
         
         self.main_viewer.drop_signal.connect(self._handle_drop)
+        self.main_viewer.roi_drawn.connect(self._handle_roi_drawn)
         
         self.video_controls_widget = QWidget()
         video_layout = QHBoxLayout(self.video_controls_widget)
@@ -870,6 +1390,71 @@ class VehicleDetectorGUI(QMainWindow):
         self.act_load_recording = file_menu.addAction("Area Recorder (Quay Vùng)")
         self.act_load_recording.triggered.connect(self.process_screen_recording)
 
+        self.act_live_detection = file_menu.addAction("Live Detection (Phát hiện trực tiếp)")
+        self.act_live_detection.triggered.connect(self.process_live_detection)
+
+        self.act_live_record = file_menu.addAction("Live: ghi lại video (OFF)")
+        self.act_live_record.triggered.connect(self.toggle_live_record)
+        self.act_live_record.setCheckable(True)
+
+        self.act_batch_size = file_menu.addAction(f"Batch size ({self.batch_size})")
+        self.act_batch_size.triggered.connect(self.choose_batch_size)
+
+        self.act_warmup = file_menu.addAction(f"Model warm-up ({self.warmup_runs or 'OFF'})")
+        self.act_warmup.triggered.connect(self.choose_warmup_runs)
+
+        self.act_backend = file_menu.addAction(f"Inference backend ({INFERENCE_BACKEND_NAMES[self.inference_backend]})")
+        self.act_backend.triggered.connect(self.choose_inference_backend)
+
+        self.act_quantize = file_menu.addAction("Quantize model (INT8)...")
+        self.act_quantize.triggered.connect(self.quantize_current_model)
+
+        self.act_process_workers = file_menu.addAction("Process workers (OFF)")
+        self.act_process_workers.triggered.connect(self.choose_process_workers)
+
+        self.act_video_stride = file_menu.addAction(f"Video stride ({self.video_stride})")
+        self.act_video_stride.triggered.connect(self.choose_video_stride)
+
+        self.act_video_adaptive = file_menu.addAction("Adaptive stride (OFF)")
+        self.act_video_adaptive.triggered.connect(self.toggle_video_adaptive)
+        self.act_video_adaptive.setCheckable(True)
+
+        self.act_motion_gate = file_menu.addAction("Motion gate (OFF)")
+        self.act_motion_gate.triggered.connect(self.choose_motion_threshold)
+        self.act_motion_gate.setCheckable(True)
+
+        self.act_tiling = file_menu.addAction("Tiled inference (OFF)")
+        self.act_tiling.triggered.connect(self.toggle_tiling)
+        self.act_tiling.setCheckable(True)
+
+        self.act_skip_empty_tiles = file_menu.addAction("Skip empty tiles (ON)")
+        self.act_skip_empty_tiles.triggered.connect(self.toggle_skip_empty_tiles)
+        self.act_skip_empty_tiles.setCheckable(True)
+        self.act_skip_empty_tiles.setChecked(True)
+
+        self.act_tracking = file_menu.addAction("Tracking (ON)")
+        self.act_tracking.triggered.connect(self.toggle_tracking)
+        self.act_tracking.setCheckable(True)
+        self.act_tracking.setChecked(True)
+
+        self.act_detection_cache = file_menu.addAction("Detection cache (ON)")
+        self.act_detection_cache.triggered.connect(self.toggle_detection_cache)
+        self.act_detection_cache.setCheckable(True)
+        self.act_detection_cache.setChecked(True)
+
+        self.act_clear_cache = file_menu.addAction("Clear detection cache")
+        self.act_clear_cache.triggered.connect(self.clear_detection_cache)
+
+        self.act_export_labels = file_menu.addAction("Export label files (OFF)")
+        self.act_export_labels.triggered.connect(self.toggle_label_export)
+        self.act_export_labels.setCheckable(True)
+
+        file_menu.addSeparator()
+        self.act_save_session = file_menu.addAction("Save session...")
+        self.act_save_session.triggered.connect(self.save_session)
+        self.act_open_session = file_menu.addAction("Open session...")
+        self.act_open_session.triggered.connect(self.open_session)
+
         view_menu = menu_bar.addMenu("View")
         
         self.act_zoom_in = view_menu.addAction("Zoom In")
@@ -887,12 +1472,33 @@ class VehicleDetectorGUI(QMainWindow):
         self.act_show_hide_conf = view_menu.addAction("Show/Hide Confidence (ON)")
         self.act_show_hide_conf.triggered.connect(self.toggle_confidence); self.act_show_hide_conf.setCheckable(True); self.act_show_hide_conf.setChecked(True)
         
+        roi_menu = menu_bar.addMenu("ROI")
+
+        self.act_roi_rect = roi_menu.addAction("Draw rectangle ROI")
+        self.act_roi_rect.setCheckable(True)
+        self.act_roi_rect.triggered.connect(lambda checked: self.set_roi_mode('rect' if checked else None))
+
+        self.act_roi_polygon = roi_menu.addAction("Draw polygon ROI (double-click to close)")
+        self.act_roi_polygon.setCheckable(True)
+        self.act_roi_polygon.triggered.connect(lambda checked: self.set_roi_mode('polygon' if checked else None))
+
+        self.act_roi_clear = roi_menu.addAction("Clear ROI")
+        self.act_roi_clear.triggered.connect(self.clear_rois)
+
+        roi_menu.addSeparator()
+        self.act_roi_redetect = roi_menu.addAction("Re-detect in ROI")
+        self.act_roi_redetect.triggered.connect(self.redetect_current_file)
+        
         self.setMenuBar(menu_bar)
         
         self.dependent_widgets.extend([
-            self.act_load_folder, self.act_autosave, self.act_export_loc, self.act_load_recording,
+            self.act_load_folder, self.act_autosave, self.act_export_loc, self.act_load_recording, self.act_batch_size,
+            self.act_process_workers,
+            self.act_live_detection, self.act_live_record,
+            self.act_video_stride, self.act_video_adaptive, self.act_motion_gate, self.act_tiling, self.act_skip_empty_tiles, self.act_tracking, self.act_export_labels,
+            self.act_detection_cache, self.act_clear_cache, self.act_quantize,
             self.act_zoom_in, self.act_zoom_out, self.act_show_hide_box,
-            self.act_show_hide_class, self.act_show_hide_conf
+            self.act_show_hide_class, self.act_show_hide_conf, self.act_roi_redetect
         ])
 
     def menu_zoom_in(self):
@@ -920,9 +1526,12 @@ class VehicleDetectorGUI(QMainWindow):
         self.label_filename.setMaximumHeight(40)
         
         self.label_size = QLabel("Kích thước: N/A")
+        self.label_counts = QLabel("Số lượng: N/A")
+        self.label_counts.setWordWrap(True)
         
         vbox.addWidget(self.label_filename)
         vbox.addWidget(self.label_size)
+        vbox.addWidget(self.label_counts)
         
         button_layout = QHBoxLayout()
         self.btn_save = QPushButton("Save")
@@ -943,7 +1552,7 @@ class VehicleDetectorGUI(QMainWindow):
         search_layout.setSpacing(3)
 
         self.search_bar = QLineEdit()
-        self.search_bar.setPlaceholderText("Tìm kiếm file...")
+        self.search_bar.setPlaceholderText("Tìm kiếm file... (vd: any MRLS, >=3 Tank above 0.6)")
         self.search_bar.textChanged.connect(self._filter_file_list)
         
         search_button = QPushButton("Search")
@@ -957,38 +1566,47 @@ class VehicleDetectorGUI(QMainWindow):
         
         vbox.addWidget(search_widget)
         
-        self.list_file = QListWidget()
+        self.file_model = FileListModel(self._list_item_text, self._list_item_icon, self)
+        self.file_proxy = FileFilterProxyModel(self)
+        self.file_proxy.setSourceModel(self.file_model)
+        self.file_proxy.sort(0, Qt.AscendingOrder)
+        self.thumbnails.thumbnail_ready.connect(self.file_model.refresh_thumbnail)
+
+        self.list_file = QListView()
+        self.list_file.setModel(self.file_proxy)
+        self.list_file.setUniformItemSizes(True)
+        self.list_file.setLayoutMode(QListView.Batched)
         
         self.list_file.setStyleSheet("""
-            QListWidget {
+            QListView {
                 background-color: #FFFFFF;
                 border: none;
             }
-            QListWidget::item {
+            QListView::item {
                 background-color: #E0E0E0;
                 border: 1px solid white;
                 border-radius: 2px;
                 margin: 1px;
                 padding: 2px;
             }
-            QListWidget::item:selected {
+            QListView::item:selected {
                 background-color: #B0C4DE;
             }
-            QListWidget::item:hover {
+            QListView::item:hover {
                 background-color: #D3D3D3;
             }
         """)
         
-        self.list_file.setViewMode(QListWidget.IconMode) 
+        self.list_file.setViewMode(QListView.IconMode) 
         self.list_file.setIconSize(QSize(80, 60)) 
         self.list_file.setWindowTitle("File List")
-        self.list_file.itemClicked.connect(self.load_selected_file) 
+        self.list_file.clicked.connect(self.load_selected_file) 
         
         self.list_file.setGridSize(QSize(95, 100)) 
         
-        self.list_file.setFlow(QListWidget.LeftToRight)
+        self.list_file.setFlow(QListView.LeftToRight)
         self.list_file.setWrapping(True)
-        self.list_file.setResizeMode(QListWidget.Adjust) # Tự động điều chỉnh cột
+        self.list_file.setResizeMode(QListView.Adjust) # Tự động điều chỉnh cột
         self.list_file.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
         
         self.list_file.setTextElideMode(Qt.ElideRight)
@@ -1047,77 +1665,84 @@ class VehicleDetectorGUI(QMainWindow):
                     widget.setStyleSheet(self.widget_styles.get(widget, ""))
 
         if enabled:
-            self.btn_clear.setEnabled(self.list_file.count() > 0)
+            self.btn_clear.setEnabled(self.file_model.rowCount() > 0)
         
     def _set_view_icon(self):
-        self.list_file.setViewMode(QListWidget.IconMode)
+        self.list_file.setViewMode(QListView.IconMode)
         self.list_file.setIconSize(QSize(80, 60))
         self.list_file.setGridSize(QSize(95, 100))
-        self.list_file.setFlow(QListWidget.LeftToRight)
+        self.list_file.setFlow(QListView.LeftToRight)
         self.list_file.setWrapping(True)
-        self._update_list_item_text_format('icon')
+        self.file_model.set_view_mode('icon')
 
     def _set_view_detail(self):
-        self.list_file.setViewMode(QListWidget.ListMode)
+        self.list_file.setViewMode(QListView.ListMode)
         self.list_file.setIconSize(QSize(24, 24))
         self.list_file.setGridSize(QSize(0, 30))
-        self.list_file.setFlow(QListWidget.TopToBottom)
+        self.list_file.setFlow(QListView.TopToBottom)
         self.list_file.setWrapping(False)
-        self._update_list_item_text_format('detail')
+        self.file_model.set_view_mode('detail')
 
     def _set_view_contents(self):
-        self.list_file.setViewMode(QListWidget.ListMode)
+        self.list_file.setViewMode(QListView.ListMode)
         self.list_file.setIconSize(QSize(64, 64))
         self.list_file.setGridSize(QSize(0, 75))
-        self.list_file.setFlow(QListWidget.TopToBottom)
+        self.list_file.setFlow(QListView.TopToBottom)
         self.list_file.setWrapping(False)
-        self._update_list_item_text_format('contents')
-
-    def _update_list_item_text_format(self, mode):
-        """Cập nhật text của tất cả item dựa trên view mode."""
-        for i in range(self.list_file.count()):
-            item = self.list_file.item(i)
-            original_path = item.toolTip()
-            metadata = self.file_metadata.get(original_path)
-            
-            if not metadata:
-                continue
-
-            is_video = metadata['type'] == 'video'
-
-            if mode == 'icon':
-                thumb_path = metadata.get('thumbnail_path') if is_video else metadata.get('original_path')
-                if thumb_path and os.path.exists(thumb_path):
-                    item.setIcon(QIcon(thumb_path))
-                else:
-                    item.setIcon(self.icon_video_default if is_video else self.icon_image_default)
-                
-                item.setText(self._format_filename(original_path, max_len=20))
-            
-            elif mode == 'detail':
-                item.setIcon(self.icon_video_default if is_video else self.icon_image_default)
-                item.setText(self._format_filename(original_path, max_len=100))
-            
-            elif mode == 'contents':
-                thumb_path = metadata.get('thumbnail_path') if is_video else metadata.get('original_path')
-                if thumb_path and os.path.exists(thumb_path):
-                    item.setIcon(QIcon(thumb_path))
-                else:
-                    item.setIcon(self.icon_video_default if is_video else self.icon_image_default)
+        self.file_model.set_view_mode('contents')
+
+    def _list_item_text(self, path, mode):
+        """Text của một hàng File List theo view mode (FileListModel gọi khi cần vẽ)."""
+        metadata = self.file_metadata.get(path)
+        if path in self.pending_videos or metadata is None:
+            return os.path.basename(path) + " (Đang xử lý...)"
+
+        if mode == 'detail':
+            return self._format_filename(path, max_len=100)
+        if mode == 'contents':
+            formatted_name = self._format_filename(path, max_len=40)
+            original_dir = os.path.dirname(path)
+            if len(original_dir) > 40:
+                original_dir = original_dir[:20] + "..." + original_dir[-17:]
+            return f"{formatted_name}\n{original_dir}\n{metadata.width}x{metadata.height}"
+
+        text = self._format_filename(path, max_len=20)
+        if metadata.kind == 'video':
+            text += " (V)"
+        return text
+
+    def _list_item_icon(self, path, mode):
+        """Icon của một hàng File List: chỉ các hàng đang được vẽ mới yêu cầu thumbnail."""
+        metadata = self.file_metadata.get(path)
+        if path in self.pending_videos or metadata is None:
+            return self.icon_video_processing
+        if mode == 'detail':
+            return self._default_list_icon(metadata)
+        return self._get_list_icon(metadata)
+
+    def _default_list_icon(self, metadata):
+        return self.icon_video_default if metadata.kind == 'video' else self.icon_image_default
+
+    def _get_list_icon(self, metadata):
+        """Icon cho File List: thumbnail từ ThumbnailCache, chưa có thì icon mặc định (thumbnail được tạo ở nền)."""
+        source_path = metadata.thumbnail_path if metadata.kind == 'video' else metadata.image_path
+        pixmap = self.thumbnails.get(source_path) if source_path else None
+        return QIcon(pixmap) if pixmap is not None else self._default_list_icon(metadata)
+
+    def _select_list_path(self, path, load=True):
+        """Chọn hàng của path trên File List (qua proxy) và tải file đó nếu load=True."""
+        row = self.file_model.row_of(path)
+        if row < 0:
+            return
+        index = self.file_proxy.mapFromSource(self.file_model.index(row))
+        if index.isValid():
+            self.list_file.setCurrentIndex(index)
+            self.list_file.scrollTo(index)
+        if load:
+            self._load_file(path)
 
-                w = metadata.get('width', 0)
-                h = metadata.get('height', 0)
-                
-                formatted_name = self._format_filename(original_path, max_len=40)
-                original_dir = os.path.dirname(original_path)
-                if len(original_dir) > 40:
-                    original_dir = original_dir[:20] + "..." + original_dir[-17:]
-                
-                size_str = f"{w}x{h}"
-                item.setText(f"{formatted_name}\n{original_dir}\n{size_str}")
-                
     def _filter_file_list(self):
-        query = self.search_bar.text().lower().strip()
+        query = self.search_bar.text().strip()
         
         if not query:
             self._show_all_list_items()
@@ -1126,18 +1751,40 @@ class VehicleDetectorGUI(QMainWindow):
         if len(query) < 3 and self.sender() == self.search_bar:
             return
 
-        for i in range(self.list_file.count()):
-            item = self.list_file.item(i)
-            file_name = item.toolTip().lower()
-            
-            if query in file_name:
-                item.setHidden(False)
-            else:
-                item.setHidden(True)
+        self.search_query = query
+        if self.search_index_stale:
+            self._rebuild_search_index()
+        self.file_proxy.set_matches(self.search_index.search(query, self.class_names))
                 
+    def _rebuild_search_index(self):
+        self.search_index.clear()
+        for path, metadata in self.file_metadata.items():
+            if metadata.kind == 'video':
+                self.search_index.add_video(path, metadata.detections)
+            else:
+                self.search_index.add(path, self.detection_store.get(metadata.file_id))
+        self.search_index_stale = False
+
     def _show_all_list_items(self):
-        for i in range(self.list_file.count()):
-            self.list_file.item(i).setHidden(False)
+        self.search_query = ""
+        self.file_proxy.set_matches(None)
+
+    def _index_file(self, path, detections=None, video_detections=None):
+        """Cập nhật chỉ mục tìm kiếm cho một file; nếu đang lọc thì cập nhật luôn kết quả của file đó.
+
+        Gọi trước khi thêm/làm mới hàng trên File List để proxy lọc đúng hàng mới.
+        """
+        if video_detections is not None:
+            self.search_index.add_video(path, video_detections)
+        else:
+            self.search_index.add(path, detections)
+
+        matches = self.file_proxy.matches
+        if matches is not None:
+            if self.search_index.matches(path, self.search_query, self.class_names):
+                matches.add(path)
+            else:
+                matches.discard(path)
             
     def _handle_drop(self, paths):
         """Xử lý các file/folder được thả vào MainViewer."""
@@ -1164,83 +1811,52 @@ class VehicleDetectorGUI(QMainWindow):
         else:
             self.show_status_message("Không tìm thấy file ảnh hợp lệ trong các file đã thả.", 3000)
 
-    def add_file_to_list(self, file_path):
+    def add_file_to_list(self, file_path, image_path, detections, w, h, thumbnail):
         """Được gọi bởi Worker khi một file ảnh trong batch được xử lý xong."""
         file_name = os.path.basename(file_path)
         
         if file_name in self.listed_file_names: 
             return
-            
-        original_img_path = os.path.join(self.temp_dir, 'originals', file_name)
-        
-        label_data = [] 
-        label_path = os.path.join(self.temp_dir, 'labels', os.path.splitext(file_name)[0] + '_labels', 'labels', os.path.splitext(file_name)[0] + '.txt')
 
-        w, h = 0, 0
-        try:
-            img = cv2.imread(original_img_path)
-            h, w, _ = img.shape
-        except Exception:
-            pass
+        file_id = self._file_id_for(file_path)
+        self.file_metadata[file_path] = FileRecord(file_id, 'image', w, h, image_path=image_path)
+        self.detection_store.add(file_id, detections)
 
-        self.file_id_counter += 1
-        self.file_metadata[file_path] = {
-            'type': 'image', 
-            'original_path': original_img_path, 
-            'label_path': label_path, 
-            'label_data': label_data,
-            'id': self.file_id_counter,
-            'save_status': False,
-            'width': w,
-            'height': h
-        }
-
-        current_view_mode = self.list_file.viewMode()
-        is_detail_view = (current_view_mode == QListWidget.ListMode and self.list_file.gridSize().height() <= 30)
-        
-        if is_detail_view:
-            icon = QIcon(self.icon_image_default)
-        else:
-            temp_pixmap = QPixmap()
-            if temp_pixmap.load(original_img_path):
-                icon = QIcon(temp_pixmap)
-            else:
-                icon = QIcon(self.icon_image_default)
+        # Thumbnail đã được worker thu nhỏ sẵn; icon chỉ được lấy khi hàng được vẽ
+        self.thumbnails.put(image_path, thumbnail)
         
-        item = QListWidgetItem(icon, self._format_filename(file_path, max_len=20))
-        item.setToolTip(file_path) 
-        
-        self.list_file.addItem(item)
-        self.file_list.append(file_path)
+        self._index_file(file_path, detections)
+        self.file_model.add_file(file_path, thumbnail_source=image_path)
         self.listed_file_names.add(file_name) 
         
         self.btn_clear.setEnabled(True)
         
-        self._update_list_item_text_format(self.list_file.viewMode())
-        
-        if self.list_file.count() == 1:
-            self.list_file.setCurrentRow(0)
-            self.load_selected_file(item)
+        if self.file_model.rowCount() == 1:
+            self._select_list_path(file_path)
     
-    def update_ui_from_thread(self, original_path, temp_original_path, label_data, w, h):
+    def _file_id_for(self, file_path):
+        """file_id của file: dùng lại id cũ khi suy luận lại (store ghi đè đoạn cũ), file mới thì cấp id mới."""
+        record = self.file_metadata.get(file_path)
+        if record is not None:
+            return record.file_id
+        self.file_id_counter += 1
+        return self.file_id_counter
+
+    def update_ui_from_thread(self, original_path, image_path, label_data, w, h, image):
         """Cập nhật UI từ luồng xử lý ảnh đơn/screenshot."""
         file_name = os.path.basename(original_path)
+        self._cache_decoded_image(image_path, image)
         
-        self.file_id_counter += 1
-        self.file_metadata[original_path] = {
-            'type': 'image', 
-            'original_path': temp_original_path, 
-            'label_data': label_data, 
-            'id': self.file_id_counter,
-            'save_status': False,
-            'width': w,
-            'height': h
-        }
+        file_id = self._file_id_for(original_path)
+        self.file_metadata[original_path] = FileRecord(file_id, 'image', w, h, image_path=image_path)
+        self.detection_store.add(file_id, label_data)
+
+        self.thumbnails.put(image_path, make_thumbnail(image))
 
-        q_image = self._draw_boxes_on_image(temp_original_path, label_data)
-        if q_image:
-            self.main_viewer.set_image(q_image)
-            self.label_size.setText(f"Kích thước: {q_image.width()}x{q_image.height()}")
+        self.main_viewer.set_image(bgr_to_qimage(image))
+        self._set_image_overlay(original_path, self.file_metadata[original_path])
+        self._show_rois(original_path, w, h)
+        self.label_size.setText(f"Kích thước: {w}x{h}")
         
         formatted_name = self._format_filename(original_path, max_len=50)
         self.label_filename.setText(f"Tên file: {formatted_name}")
@@ -1248,143 +1864,109 @@ class VehicleDetectorGUI(QMainWindow):
         
         is_new_file = file_name not in self.listed_file_names
 
+        self._index_file(original_path, label_data)
         if is_new_file: 
-             current_view_mode = self.list_file.viewMode()
-             is_detail_view = (current_view_mode == QListWidget.ListMode and self.list_file.gridSize().height() <= 30)
-
-             if is_detail_view:
-                 icon = QIcon(self.icon_image_default)
-             else:
-                 temp_pixmap = QPixmap()
-                 if temp_pixmap.load(temp_original_path):
-                     icon = QIcon(temp_pixmap)
-                 else:
-                     icon = QIcon(self.icon_image_default)
-             
-             item = QListWidgetItem(icon, self._format_filename(original_path, max_len=20))
-             item.setToolTip(original_path) 
-             
-             self.list_file.insertItem(0, item)
-             self.file_list.insert(0, original_path)
+             self.file_model.add_file(original_path, front=True, thumbnail_source=image_path)
              self.listed_file_names.add(file_name) 
 
         self.reset_save_button() 
-        self.list_file.setCurrentRow(0) 
+        self._select_list_path(original_path, load=False)
         self.btn_clear.setEnabled(True)
         
-        self._update_list_item_text_format(self.list_file.viewMode())
-        
         if self.auto_save:
             self._auto_save_current_image()
 
-    def _handle_video_processed(self, original_path, result_path, thumbnail_path, w, h):
-        """Được gọi khi VideoWorker hoàn thành."""
+    def _handle_video_started(self, original_path, thumbnail_path, w, h, fps, total_frames):
+        """Được gọi khi VideoWorker bắt đầu: thêm video vào list và phát ngay."""
         self._stop_video_playback() 
         file_name = os.path.basename(original_path)
         
-        self.file_id_counter += 1
-        self.file_metadata[original_path] = {
-            'type': 'video', 
-            'result_path': result_path, 
-            'thumbnail_path': thumbnail_path,
-            'id': self.file_id_counter,
-            'save_status': False,
-            'width': w,
-            'height': h
-        }
-        
-        if original_path not in self.file_list:
-            self.file_list.insert(0, original_path)
-            self.listed_file_names.add(file_name) 
-        
-        current_view_mode = self.list_file.viewMode()
-        is_detail_view = (current_view_mode == QListWidget.ListMode and self.list_file.gridSize().height() <= 30)
-
-        if is_detail_view:
-            icon = QIcon(self.icon_video_default)
-        else:
-            icon = QIcon(thumbnail_path) if thumbnail_path else QIcon(self.icon_video_default)
+        file_id = self._file_id_for(original_path)
+        self.detection_store.remove(file_id) # Detection video nằm trong VideoDetections, không trong store
+        self.file_metadata[original_path] = FileRecord(
+            file_id, 'video', w, h, source_path=original_path, thumbnail_path=thumbnail_path,
+            detections=VideoDetections(), processing=True, fps=fps, total_frames=total_frames
+        )
         
-        text = self._format_filename(original_path, max_len=20)
-        if not text.endswith("(V)"):
-            text += " (V)"
-            
-        item = QListWidgetItem(icon, text)
-        item.setToolTip(original_path) 
-        
-        for i in range(self.list_file.count()):
-            list_item = self.list_file.item(i)
-            if list_item.toolTip() == original_path:
-                self.list_file.takeItem(i)
-                break
-        
-        self.list_file.insertItem(0, item)
-        self.list_file.setCurrentRow(0)
+        self.listed_file_names.add(file_name) 
+        self.pending_videos.discard(original_path)
+        self._index_file(original_path, EMPTY_DETECTIONS)
+        self.file_model.add_file(original_path, front=True, thumbnail_source=thumbnail_path)
         self.btn_clear.setEnabled(True)
         
-        self._update_list_item_text_format(self.list_file.viewMode())
-        
-        self.load_selected_file(item)
-        self.show_status_message(f"✅ Video {file_name} đã xử lý xong và sẵn sàng phát.", 5000)
+        self._select_list_path(original_path)
+
+    def _handle_video_frame(self, original_path, frame_idx, detections, track_ids):
+        """Nhận detection của từng frame từ VideoWorker."""
+        metadata = self.file_metadata.get(original_path)
+        if metadata and metadata.kind == 'video' and frame_idx == len(metadata.detections):
+            metadata.detections.append(detections, track_ids)
 
-    def load_selected_file(self, item):
-        """Tải ảnh/video khi click."""
-        if not item:
+    def _handle_video_processed(self, original_path, detections):
+        """Được gọi khi VideoWorker hoàn thành toàn bộ video."""
+        metadata = self.file_metadata.get(original_path)
+        if not metadata:
             return
-            
-        full_path_original = item.toolTip()
-        
+        metadata.detections = detections
+        metadata.processing = False
+        self._index_file(original_path, video_detections=detections)
+        self.file_model.refresh(original_path) # proxy lọc lại hàng này theo detection mới
+        self.show_status_message(f"✅ Video {os.path.basename(original_path)} đã xử lý xong.", 5000)
+        if original_path == self.current_image_path:
+            self._update_counts_label(original_path, metadata)
+
+        if self.auto_save and original_path == self.current_image_path:
+            self._auto_save_current_image()
+
+    def load_selected_file(self, index):
+        """Tải ảnh/video khi click (index của File List)."""
+        if index is None or not index.isValid():
+            return
+        self._load_file(index.data(FileListModel.PathRole))
+
+    def _load_file(self, full_path_original):
+        """Tải ảnh/video theo đường dẫn gốc."""
         if full_path_original:
             self.current_image_path = full_path_original
             self._stop_video_playback()
             self.main_viewer.clear_view() # Hàm này đã reset cờ user_has_zoomed
             
             metadata = self.file_metadata.get(full_path_original)
+            self._update_counts_label(full_path_original, metadata)
             
-            if metadata and metadata['type'] == 'video':
+            if metadata and metadata.kind == 'video':
                 self.video_controls_widget.setVisible(True) 
                 
-                result_path = metadata['result_path']
-                if os.path.exists(result_path):
-                    self._start_video_playback(result_path)
+                source_path = metadata.source_path
+                if os.path.exists(source_path):
+                    self._start_video_playback(source_path)
+                    self._show_rois(full_path_original, metadata.width, metadata.height)
                     
                     formatted_name = self._format_filename(full_path_original, max_len=50)
                     self.label_filename.setText(f"Video: {formatted_name}")
                     
-                    self.label_size.setText(f"Kích thước: {metadata.get('width', 0)}x{metadata.get('height', 0)}")
-                    self.reset_save_button(is_video=True, saved=metadata.get('save_status', False))
+                    self.label_size.setText(f"Kích thước: {metadata.width}x{metadata.height}")
+                    self.reset_save_button(is_video=True, saved=metadata.save_status)
                 else:
-                    self.show_status_message("Không tìm thấy video kết quả đã xử lý.", 5000)
+                    self.show_status_message("Không tìm thấy file video gốc.", 5000)
 
-            elif metadata and metadata['type'] == 'image':
+            elif metadata and metadata.kind == 'image':
                 self.video_controls_widget.setVisible(False) 
                 
-                label_data = metadata.get('label_data')
-                if not label_data:
-                    label_path = metadata.get('label_path', '')
-                    if os.path.exists(label_path):
-                         label_data = []
-                         with open(label_path, 'r') as f:
-                             for line in f:
-                                parts = line.strip().split()
-                                if len(parts) >= 6:
-                                    try:
-                                        label_data.append([int(parts[0]), float(parts[1]), float(parts[2]), float(parts[3]), float(parts[4]), float(parts[5])])
-                                    except ValueError:
-                                        pass
-                         metadata['label_data'] = label_data
-
-                q_image = self._draw_boxes_on_image(metadata['original_path'], label_data)
+                # Ảnh gốc lấy từ LRU đã giải mã; box/nhãn là overlay riêng nên không vẽ vào ảnh
+                base_image = self._get_decoded_image(metadata.image_path)
                 
-                if q_image:
-                    self.main_viewer.set_image(q_image) # Hàm này đã reset cờ user_has_zoomed
+                if base_image is not None:
+                    self.main_viewer.set_image(bgr_to_qimage(base_image)) # Hàm này đã reset cờ user_has_zoomed
+                    self._set_image_overlay(full_path_original, metadata)
+                    self._show_rois(full_path_original, metadata.width, metadata.height)
                     
                     formatted_name = self._format_filename(full_path_original, max_len=50)
                     self.label_filename.setText(f"Tên file: {formatted_name}")
                     
-                    self.label_size.setText(f"Kích thước: {q_image.width()}x{q_image.height()}")
+                    self.label_size.setText(f"Kích thước: {base_image.shape[1]}x{base_image.shape[0]}")
                     
-                    self.reset_save_button(is_video=False, saved=metadata.get('save_status', False))
+                    self.reset_save_button(is_video=False, saved=metadata.save_status)
                     
                     if self.auto_save:
                         self._auto_save_current_image()
@@ -1395,87 +1977,108 @@ class VehicleDetectorGUI(QMainWindow):
             else:
                  self.show_status_message(f"Lỗi: Không tìm thấy Metadata cho file {os.path.basename(full_path_original)}.", 5000)
     
-    def _get_color_for_class(self, class_id):
-        """Lấy màu ngẫu nhiên (hoặc định sẵn) cho class."""
-        if class_id not in self.class_colors:
-            self.class_colors[class_id] = [random.randint(0, 255) for _ in range(3)]
-        return self.class_colors[class_id]
+    def _cache_decoded_image(self, image_path, image):
+        """Giữ ảnh đã giải mã trong LRU nhỏ để không phải đọc lại từ đĩa."""
+        self.image_cache[image_path] = image
+        self.image_cache.move_to_end(image_path)
+        while len(self.image_cache) > IMAGE_CACHE_SIZE:
+            self.image_cache.popitem(last=False)
+
+    def _get_decoded_image(self, image_path):
+        """Lấy ảnh gốc từ LRU, chỉ giải mã lại khi cache miss."""
+        image = self.image_cache.get(image_path)
+        if image is not None:
+            self.image_cache.move_to_end(image_path)
+            return image
 
-    def _draw_boxes_on_image(self, image_path, label_data):
-        """Đọc ảnh gốc và file nhãn, sau đó vẽ box dựa trên cờ Show/Hide."""
         if not os.path.exists(image_path):
-            self.show_status_message(f"Thiếu file tạm: {os.path.basename(image_path)}", 3000)
+            self.show_status_message(f"Thiếu file ảnh: {os.path.basename(image_path)}", 3000)
             return None
-            
-        img_np = cv2.imread(image_path)
-        if img_np is None:
+
+        image = decode_image(image_path)
+        if image is None:
             self.show_status_message(f"Lỗi đọc ảnh: {os.path.basename(image_path)}", 3000)
             return None
-            
-        h, w, _ = img_np.shape
-
-        if self.is_box_visible:
-            if not label_data and self.current_image_path:
-                 metadata = self.file_metadata.get(self.current_image_path, {})
-                 label_path = metadata.get('label_path', '')
-                 if os.path.exists(label_path):
-                    label_data =[]
-                    with open(label_path, 'r') as f:
-                         for line in f:
-                            parts = line.strip().split()
-                            if len(parts) >= 6:
-                                try:
-                                    label_data.append([int(parts[0]), float(parts[1]), float(parts[2]), float(parts[3]), float(parts[4]), float(parts[5])])
-                                except ValueError:
-                                    pass
-                    metadata['label_data'] = label_data
-
-            if label_data:
-                for (class_id, x_c, y_c, b_w, b_h, conf) in label_data:
-                    x_center = x_c * w
-                    y_center = y_c * h
-                    box_w = b_w * w
-                    box_h = b_h * h
-                    
-                    x1 = int(x_center - box_w / 2)
-                    y1 = int(y_center - box_h / 2)
-                    x2 = int(x_center + box_w / 2)
-                    y2 = int(y_center + box_h / 2)
-                    
-                    color = self._get_color_for_class(class_id)
-                    
-                    cv2.rectangle(img_np, (x1, y1), (x2, y2), color, 2)
-                    
-                    if self.is_class_visible:
-                        label = f"{self.class_names.get(class_id, 'Unknown')}"
-                        
-                        if self.is_confidence_visible:
-                            label += f" {conf:.2f}"
-                        
-                        (text_w, text_h), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
-                        
-                        margin = 10 
-                        
-                        rect_y_top = y1 - text_h - (baseline + 3)
-                        text_y_pos = y1 - (baseline // 2) - 3
-
-                        if rect_y_top < margin:
-                            rect_y_top = y2 + 3
-                            text_y_pos = y2 + text_h + 3
-                            
-                            if text_y_pos + baseline > h - margin:
-                                rect_y_top = y1 + 3
-                                text_y_pos = y1 + text_h + 3
-                        
-                        cv2.rectangle(img_np, (x1, rect_y_top), (x1 + text_w, text_y_pos + baseline), color, -1)
-                        cv2.putText(img_np, label, (x1, text_y_pos), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0,0,0), 2) 
+        self._cache_decoded_image(image_path, image)
+        return image
 
-                        
-        img_np_rgb = cv2.cvtColor(img_np, cv2.COLOR_BGR2RGB)
-        height_q, width_q, channel = img_np_rgb.shape
-        bytes_per_line = 3 * width_q
-        q_image = QImage(img_np_rgb.data, width_q, height_q, bytes_per_line, QImage.Format_RGB888)
-        return q_image
+    def _draw_detections(self, img_np, label_data, track_ids=None):
+        """Vẽ detection lên ảnh BGR (tại chỗ) theo các cờ Show/Hide hiện tại."""
+        draw_detections(img_np, label_data, self.class_names, self.class_colors,
+                        self.is_box_visible, self.is_class_visible, self.is_confidence_visible, track_ids=track_ids)
+
+    def _new_tracker(self):
+        return ByteTracker() if self.tracking_enabled else None
+
+    def _format_class_counts(self, counts):
+        return ", ".join(f"{self.class_names.get(c, c)}: {n}" for c, n in sorted(counts.items())) or "0"
+
+    def _update_counts_label(self, file_path, metadata):
+        """Hiển thị số đối tượng theo class: ảnh đếm box, video đếm số track (phương tiện) khác nhau."""
+        if not metadata:
+            self.label_counts.setText("Số lượng: N/A")
+        elif metadata.kind == 'video':
+            counts = metadata.detections.unique_class_counts()
+            if counts:
+                self.label_counts.setText(f"Số phương tiện: {self._format_class_counts(counts)}")
+            else:
+                self.label_counts.setText("Số phương tiện: N/A (tracking tắt)")
+        else:
+            if self.rois.get(file_path):
+                classes, n = np.unique(self._image_detections(file_path, metadata)[:, 0].astype(np.int64), return_counts=True)
+                counts = dict(zip(classes.tolist(), n.tolist()))
+            else:
+                counts = self.detection_store.class_counts(metadata.file_id)
+            self.label_counts.setText(f"Số lượng: {self._format_class_counts(counts)}")
+
+    def _roi_mask_for(self, file_path, w, h):
+        """Mask ROI (HxW) của file, dựng một lần cho mỗi kích thước; None nếu file không có ROI."""
+        rois = self.rois.get(file_path) if file_path else None
+        if not rois or w <= 0 or h <= 0:
+            return None
+        key = (file_path, w, h)
+        mask = self.roi_masks.get(key)
+        if mask is None:
+            mask = self.roi_masks[key] = roi_mask(rois, w, h)
+        return mask
+
+    def _image_detections(self, file_path, metadata):
+        """Detection của ảnh, bỏ các box có tâm ngoài ROI (nếu ảnh có ROI)."""
+        label_data = self.detection_store.get(metadata.file_id)
+        mask = self._roi_mask_for(file_path, metadata.width, metadata.height)
+        return detections_in_roi(label_data, mask) if mask is not None else label_data
+
+    def _show_rois(self, file_path, w, h):
+        self.main_viewer.set_rois(roi_polygons_px(self.rois.get(file_path), w, h) if w > 0 and h > 0 else [])
+
+    def _set_image_overlay(self, file_path, metadata):
+        """Dựng overlay box/nhãn cho ảnh đang hiển thị rồi áp các cờ Show/Hide."""
+        label_data = self._image_detections(file_path, metadata)
+        boxes = detections_to_pixel_boxes(label_data, metadata.width, metadata.height, clip=True)
+        class_ids = label_data[:, 0].astype(int).tolist() if len(label_data) else []
+        colors = [self.class_colors.setdefault(c, [random.randint(0, 255) for _ in range(3)]) for c in class_ids]
+        names = [f"{self.class_names.get(c, 'Unknown')}" for c in class_ids]
+        conf_labels = [f"{name} {conf:.2f}" for name, conf in zip(names, label_data[:, 5].tolist())] if names else []
+        self.main_viewer.set_overlay(boxes, colors, names, conf_labels)
+        self._apply_overlay_visibility()
+
+    def _apply_overlay_visibility(self):
+        self.main_viewer.set_overlay_visible(self.is_box_visible, self.is_class_visible, self.is_confidence_visible)
+
+    def _render_annotated_pixmap(self, file_path, metadata):
+        """Ảnh kết quả (box vẽ vào ảnh) để lưu file, theo các cờ Show/Hide hiện tại."""
+        q_image = self._draw_boxes_on_image(metadata.image_path, self._image_detections(file_path, metadata))
+        return QPixmap.fromImage(q_image) if q_image else None
+
+    def _draw_boxes_on_image(self, image_path, label_data):
+        """Lấy ảnh gốc (đã cache), sau đó vẽ box (mảng Nx6) dựa trên cờ Show/Hide."""
+        base_image = self._get_decoded_image(image_path)
+        if base_image is None:
+            return None
+            
+        img_np = base_image.copy()
+        self._draw_detections(img_np, label_data)
+        return bgr_to_qimage(img_np)
 
     # --- Các hàm Xử lý Sự kiện UI ---
 
@@ -1503,22 +2106,31 @@ class VehicleDetectorGUI(QMainWindow):
             
         self.show_status_message(f"Đang xử lý video {os.path.basename(video_path)}. Vui lòng chờ...", 0) 
         
-        for i in range(self.list_file.count()):
-            item = self.list_file.item(i)
-            if item.toolTip() == video_path:
-                self.list_file.takeItem(i)
-                break
-        
-        placeholder_item = QListWidgetItem(QIcon.fromTheme("video-x-generic"), os.path.basename(video_path) + " (Đang xử lý...)")
-        placeholder_item.setToolTip(video_path)
-        self.list_file.insertItem(0, placeholder_item)
-        self.list_file.setCurrentItem(placeholder_item)
-
-        worker = VideoWorker(self.model, video_path, self.temp_dir)
+        # Hàng tạm "Đang xử lý..." ở đầu danh sách cho tới khi VideoWorker bắt đầu
+        self.pending_videos.add(video_path)
+        self.file_model.add_file(video_path, front=True)
+        self._select_list_path(video_path, load=False)
+
+        worker = VideoWorker(self.model, video_path, self.temp_dir, batch_size=self.batch_size,
+                             stride=self.video_stride, adaptive=self.video_adaptive, tracker=self._new_tracker(),
+                             cache=self._active_cache(), rois=self.rois.get(video_path) or None,
+                             motion_threshold=self.motion_threshold or None)
+        worker.signals.video_started.connect(self._handle_video_started)
+        worker.signals.video_frame.connect(self._handle_video_frame)
         worker.signals.video_processed.connect(self._handle_video_processed)
-        worker.signals.error.connect(lambda msg: self.show_status_message(f"LỖI VIDEO: {msg}", 8000))
+        worker.signals.error.connect(lambda msg: self._handle_video_error(video_path, msg))
         self.threadpool.start(worker)
 
+    def _handle_video_error(self, video_path, message):
+        """VideoWorker lỗi: bỏ hàng tạm "Đang xử lý..." nếu video chưa kịp bắt đầu."""
+        self.show_status_message(f"LỖI VIDEO: {message}", 8000)
+        if video_path in self.pending_videos:
+            self.pending_videos.discard(video_path)
+            if video_path in self.file_metadata:
+                self.file_model.refresh(video_path) # Video đã có từ trước: giữ hàng với kết quả cũ
+            else:
+                self.file_model.remove_file(video_path)
+
     def load_folder(self):
         if not self.model:
             self.show_status_message("Vui lòng load model trước.", 3000)
@@ -1577,6 +2189,14 @@ class VehicleDetectorGUI(QMainWindow):
         """Quay video màn hình (Screen Recording)."""
         desktop_pixmap = self._prepare_screenshot_tool()
         if desktop_pixmap:
+            self.live_mode_pending = False
+            self.screenshot_tool.start_snip(desktop_pixmap, is_recording=True)
+
+    def process_live_detection(self):
+        """Phát hiện trực tiếp trên vùng màn hình (không cần quay xong rồi mới xử lý)."""
+        desktop_pixmap = self._prepare_screenshot_tool()
+        if desktop_pixmap:
+            self.live_mode_pending = True
             self.screenshot_tool.start_snip(desktop_pixmap, is_recording=True)
 
     def start_recording_worker(self, rect):
@@ -1584,22 +2204,108 @@ class VehicleDetectorGUI(QMainWindow):
         if self.current_recorder:
             self.show_status_message("Đã có một tiến trình quay đang chạy.", 3000)
             return
-            
-        self.show_status_message("Bắt đầu quay! Nhấn 'Esc' để dừng...", 0)
-        self.current_recorder = RecordingWorker(rect, self.temp_dir)
+
+        self.is_live_mode = self.live_mode_pending
+        self.live_mode_pending = False
+
+        if self.is_live_mode:
+            frame_queue = queue.Queue(maxsize=LIVE_QUEUE_SIZE)
+            self.current_recorder = RecordingWorker(rect, self.temp_dir, frame_queue=frame_queue, record=self.live_record)
+            self.live_detections = VideoDetections() if self.live_record else None
+
+            live_worker = LiveDetectionWorker(self.model, frame_queue, tracker=self._new_tracker(),
+                                              motion_threshold=self.motion_threshold or None)
+            self.live_finish = {}
+            live_worker.signals.live_frame.connect(self._handle_live_frame)
+            live_worker.signals.finished.connect(self._handle_live_worker_finished)
+            live_worker.signals.error.connect(lambda msg: self.show_status_message(f"LỖI LIVE: {msg}", 8000))
+
+            self._stop_video_playback()
+            self.main_viewer.clear_view()
+            self.current_image_path = None
+            self.video_controls_widget.setVisible(False)
+            self.set_transparent_mode(False)
+            self.show_status_message("Đang phát hiện trực tiếp! Nhấn 'Esc' để dừng...", 0)
+        else:
+            self.show_status_message("Bắt đầu quay! Nhấn 'Esc' để dừng...", 0)
+            self.current_recorder = RecordingWorker(rect, self.temp_dir)
         
         self.current_recorder.signals.recording_finished.connect(self.handle_recording_finished)
         self.current_recorder.signals.error.connect(lambda msg: self.show_status_message(f"Lỗi Quay Video: {msg}", 8000))
         
         self.threadpool.start(self.current_recorder)
+        if self.is_live_mode:
+            self.threadpool.start(live_worker)
+
+    def _handle_live_frame(self, frame_idx, frame, detections, track_ids):
+        """Vẽ detection của frame live lên MainViewer."""
+        if not self.is_live_mode:
+            return
+        if self.live_detections is not None:
+            # Frame bị bỏ trong hàng đợi dùng lại detection gần nhất
+            last_idx = len(self.live_detections) - 1
+            last, last_ids = self.live_detections.get(last_idx), self.live_detections.get_track_ids(last_idx)
+            while len(self.live_detections) < frame_idx:
+                self.live_detections.append(last, last_ids)
+            if len(self.live_detections) == frame_idx:
+                self.live_detections.append(detections, track_ids)
+
+        self._draw_detections(frame, detections, track_ids)
+        self.main_viewer.update_video_frame(bgr_to_qimage(frame))
+        self.label_filename.setText(f"Live: frame {frame_idx} - {len(detections)} đối tượng")
+        self.label_size.setText(f"Kích thước: {frame.shape[1]}x{frame.shape[0]}")
+
+    def _add_live_recording(self, video_path):
+        """Thêm file quay ở chế độ live vào list, dùng luôn detection đã có (không suy luận lại)."""
+        cap = cv2.VideoCapture(video_path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 20
+        w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+
+        # Frame cuối bị bỏ khỏi hàng đợi dùng lại detection gần nhất để số frame khớp với video
+        last_idx = len(self.live_detections) - 1
+        last, last_ids = self.live_detections.get(last_idx), self.live_detections.get_track_ids(last_idx)
+        while len(self.live_detections) < total_frames:
+            self.live_detections.append(last, last_ids)
+
+        self._handle_video_started(video_path, "", w, h, float(fps), total_frames)
+        metadata = self.file_metadata[video_path]
+        metadata.detections = self.live_detections
+        metadata.processing = False
+        self.live_detections = None
 
     def handle_recording_finished(self, video_path):
         """Xử lý file video sau khi quay xong."""
         self.current_recorder = None
         self.set_transparent_mode(False)
+
+        if self.is_live_mode:
+            self.live_finish['video_path'] = video_path
+            self._finish_live_mode()
+            return
+
         self.show_status_message(f"Đã quay xong: {os.path.basename(video_path)}. Bắt đầu xử lý...", 3000)
         self.run_video_prediction(video_path)
 
+    def _handle_live_worker_finished(self):
+        self.live_finish['worker_done'] = True
+        self._finish_live_mode()
+
+    def _finish_live_mode(self):
+        """Kết thúc live khi recorder đã dừng và live worker đã xử lý hết frame trong hàng đợi."""
+        if 'video_path' not in self.live_finish or not self.live_finish.get('worker_done'):
+            return
+        video_path = self.live_finish['video_path']
+        self.live_finish = {}
+        self.is_live_mode = False
+        if video_path:
+            self._add_live_recording(video_path)
+            self.show_status_message(f"Đã dừng live, lưu bản quay: {os.path.basename(video_path)}.", 3000)
+        else:
+            self.show_status_message("Đã dừng phát hiện trực tiếp.", 3000)
+
     def run_screenshot_prediction(self, snipped_pixmap: QPixmap):
         """Xử lý QPixmap nhận được từ ScreenshotTool (chụp ảnh)."""
         self.setCursor(QCursor(Qt.ArrowCursor))
@@ -1617,22 +2323,33 @@ class VehicleDetectorGUI(QMainWindow):
             if not snipped_pixmap.save(temp_file_path, "PNG"):
                 raise Exception("Không thể lưu QPixmap.")
             
-            self.run_prediction_worker(temp_file_path, is_batch=False)
+            self.run_prediction_worker(temp_file_path, is_batch=False, volatile=True)
             
         except Exception as e:
             self.show_status_message(f"Lỗi Chụp Ảnh: {e}", 5000)
             self.showNormal()
             
-    def run_prediction_worker(self, file_paths, is_batch=False):
+    def run_prediction_worker(self, file_paths, is_batch=False, volatile=False):
         """Khởi tạo và chạy PredictionWorker trên threadpool."""
         if not self.model:
             self.show_status_message("Lỗi: Model chưa được load.", 5000)
             return
 
-        worker = PredictionWorker(self.model, file_paths, self.temp_dir, is_batch)
+        rois = self.rois.snapshot(file_paths if isinstance(file_paths, list) else [file_paths])
+        if is_batch and self.process_workers > 0 and self.runtime_model_path:
+            # Thư mục lớn: chia cho nhiều tiến trình, mỗi tiến trình load model riêng
+            worker = ParallelPredictionWorker(self.runtime_model_path, file_paths, self.temp_dir, self.process_workers,
+                                              batch_size=self.batch_size, label_export_dir=self.label_export_dir,
+                                              volatile=volatile, cache=self._active_cache(), tiling=self._active_tiling(),
+                                              rois=rois)
+        else:
+            worker = PredictionWorker(self.model, file_paths, self.temp_dir, is_batch, batch_size=self.batch_size,
+                                      label_export_dir=self.label_export_dir, volatile=volatile,
+                                      cache=self._active_cache(), tiling=self._active_tiling(), rois=rois)
         
         if is_batch:
             worker.signals.file_processed.connect(self.add_file_to_list)
+            worker.signals.queue_depths.connect(self._show_queue_depths)
             worker.signals.finished.connect(lambda: self.show_status_message(f"Hoàn tất xử lý {len(file_paths)} ảnh.", 3000))
         else:
             worker.signals.result.connect(self.update_ui_from_thread)
@@ -1641,12 +2358,17 @@ class VehicleDetectorGUI(QMainWindow):
         
         self.threadpool.start(worker)
 
+    def _show_queue_depths(self, decoded, pending_post, capacity):
+        """Độ sâu hàng đợi của pipeline ảnh: giải mã luôn đầy = suy luận là nút cổ chai, và ngược lại."""
+        self.show_status_message(f"Đang xử lý ảnh... Hàng đợi: đã giải mã {decoded}/{capacity}, "
+                                 f"chờ hậu xử lý {pending_post}/{capacity}", 2000)
+
     # --- Các hàm UI khác ---
 
     def _mark_save_success(self, file_path):
         if file_path:
             if file_path in self.file_metadata:
-                self.file_metadata[file_path]['save_status'] = True
+                self.file_metadata[file_path].save_status = True
         
         self.btn_save.setText("Save ✓")
         default_style = self.btn_clear.styleSheet() 
@@ -1675,10 +2397,12 @@ class VehicleDetectorGUI(QMainWindow):
              self.show_status_message("Lỗi: Không tìm thấy metadata.", 3000)
              return
              
-        if metadata and metadata['type'] == 'video':
-             result_path = metadata.get('result_path')
-             if not result_path or not os.path.exists(result_path):
-                 self.show_status_message("Video kết quả chưa được xử lý hoặc đã bị xóa.", 5000)
+        if metadata and metadata.kind == 'video':
+             if metadata.processing:
+                 self.show_status_message("Video đang được xử lý, vui lòng chờ xong rồi lưu.", 5000)
+                 return
+             if not os.path.exists(metadata.source_path):
+                 self.show_status_message("File video gốc đã bị xóa.", 5000)
                  return
              
              current_file_name = os.path.basename(self.current_image_path)
@@ -1692,16 +2416,12 @@ class VehicleDetectorGUI(QMainWindow):
                 self.show_status_message("Hủy lưu file.", 3000)
                 return
 
-             try:
-                shutil.copy(result_path, save_path)
-                self.export_location = os.path.dirname(save_path)
-                self.show_status_message(f"Đã lưu video thành công tại: {os.path.basename(save_path)}", 5000)
-                self._mark_save_success(self.current_image_path)
-             except Exception as e:
-                 self.show_status_message(f"Lỗi khi copy video: {e}", 5000)
+             self.export_location = os.path.dirname(save_path)
+             self._start_video_export(self.current_image_path, save_path)
                  
-        elif metadata and metadata['type'] == 'image':
-            if self.main_viewer.current_pixmap is None:
+        elif metadata and metadata.kind == 'image':
+            pixmap_to_save = self._render_annotated_pixmap(self.current_image_path, metadata)
+            if pixmap_to_save is None:
                  self.show_status_message("Không thể lưu: Ảnh hiển thị không tồn tại.", 3000)
                  return
                  
@@ -1717,8 +2437,27 @@ class VehicleDetectorGUI(QMainWindow):
                 return
             
             self.export_location = os.path.dirname(save_path)
-            self._save_image_to_path(save_path, self.main_viewer.current_pixmap)
+            self._save_image_to_path(save_path, pixmap_to_save)
         
+    def _start_video_export(self, original_path, save_path):
+        """Ghi video có vẽ detection ra file (chạy nền, chỉ khi người dùng lưu)."""
+        metadata = self.file_metadata[original_path]
+        self.show_status_message(f"Đang ghi video {os.path.basename(save_path)}...", 0)
+
+        worker = VideoExportWorker(metadata.source_path, save_path, metadata.detections,
+                                   self.class_names, self.class_colors,
+                                   self.is_box_visible, self.is_class_visible, self.is_confidence_visible)
+        worker.signals.video_saved.connect(self._handle_video_saved)
+        worker.signals.error.connect(lambda msg: self.show_status_message(f"LỖI LƯU VIDEO: {msg}", 8000))
+        self.threadpool.start(worker)
+
+    def _handle_video_saved(self, original_path, save_path):
+        self.show_status_message(f"Đã lưu video thành công tại: {os.path.basename(save_path)}", 5000)
+        if original_path in self.file_metadata:
+            self.file_metadata[original_path].save_status = True
+        if original_path == self.current_image_path:
+            self._mark_save_success(original_path)
+
     def reset_save_button(self, is_video=False, saved=False):
         self.btn_save.setStyleSheet(self.widget_styles.get(self.btn_save, ""))
         
@@ -1743,14 +2482,18 @@ class VehicleDetectorGUI(QMainWindow):
         
         self._stop_video_playback()
         self.main_viewer.clear_view() # Hàm này đã reset cờ user_has_zoomed
-        self.list_file.clear()
-        self.file_list = []
-        self.save_status = {}
+        self.file_model.clear()
+        self.pending_videos.clear()
+        self.search_index.clear()
+        self.search_index_stale = False
         self.listed_file_names = set() 
         self.file_metadata = {} 
+        self.detection_store.clear()
+        self.image_cache.clear()
         self.current_image_path = None
         self.label_filename.setText("Tên file: (Chưa có ảnh)")
         self.label_size.setText("Kích thước: N/A")
+        self.label_counts.setText("Số lượng: N/A")
         self.reset_save_button()
         self.video_controls_widget.setVisible(False)
         self.btn_clear.setEnabled(False)
@@ -1764,35 +2507,24 @@ class VehicleDetectorGUI(QMainWindow):
             return False
             
         metadata = self.file_metadata.get(self.current_image_path)
-        if not metadata or metadata.get('save_status', False):
+        if not metadata or metadata.save_status:
             return False
 
         self.show_status_message(f"Auto-saving {os.path.basename(self.current_image_path)}...", 2000)
         
         current_file_name = os.path.basename(self.current_image_path)
         
-        if metadata['type'] == 'video':
-            result_path = metadata.get('result_path')
-            if not result_path or not os.path.exists(result_path):
-                 self.show_status_message("Lỗi auto-save: Video kết quả không tồn tại.", 5000)
-                 return
+        if metadata.kind == 'video':
+            if metadata.processing:
+                return False # Sẽ auto-save khi VideoWorker xử lý xong
             default_name = current_file_name.replace('.', '_processed.')
             save_path = os.path.join(self.export_location, default_name)
-            try:
-                shutil.copy(result_path, save_path)
-                self._mark_save_success(self.current_image_path)
-            except Exception as e:
-                 self.show_status_message(f"Lỗi auto-save video: {e}", 5000)
+            self._start_video_export(self.current_image_path, save_path)
                  
-        elif metadata['type'] == 'image':
-            if self.main_viewer.current_pixmap is None:
-                q_image = self._draw_boxes_on_image(metadata['original_path'], metadata.get('label_data'))
-                if q_image:
-                     pixmap_to_save = QPixmap.fromImage(q_image)
-                else:
-                    return False
-            else:
-                pixmap_to_save = self.main_viewer.current_pixmap
+        elif metadata.kind == 'image':
+            pixmap_to_save = self._render_annotated_pixmap(self.current_image_path, metadata)
+            if pixmap_to_save is None:
+                return False
 
             default_name = current_file_name.replace('.', '_processed.')
             save_path = os.path.join(self.export_location, default_name)
@@ -1822,6 +2554,263 @@ class VehicleDetectorGUI(QMainWindow):
         self.act_autosave.setText(f"Auto-save result ({'ON' if self.auto_save else 'OFF'})")
 
     
+    def choose_batch_size(self):
+        """Chọn số ảnh gộp vào một lần suy luận khi xử lý thư mục."""
+        value, ok = QInputDialog.getInt(self, "Batch size", "Số ảnh mỗi lần suy luận:", self.batch_size, 1, 256)
+        if ok:
+            self.batch_size = value
+            self.act_batch_size.setText(f"Batch size ({self.batch_size})")
+            self.show_status_message(f"Batch size: {self.batch_size}", 3000)
+
+    def choose_warmup_runs(self):
+        """Số lần suy luận ảnh giả ngay sau khi load model (áp dụng cho lần load sau)."""
+        value, ok = QInputDialog.getInt(self, "Model warm-up", "Số lần warm-up sau khi load model (0 = tắt):",
+                                        self.warmup_runs, 0, 10)
+        if ok:
+            self.warmup_runs = value
+            self.act_warmup.setText(f"Model warm-up ({self.warmup_runs or 'OFF'})")
+            self.show_status_message(f"Model warm-up: {self.warmup_runs or 'OFF'}", 3000)
+
+    def choose_inference_backend(self):
+        """Chọn backend suy luận; model đang dùng được export (một lần) và load lại qua backend mới."""
+        if self.model_loading:
+            self.show_status_message("Đang load model, hãy đợi xong rồi đổi backend.", 3000)
+            return
+        backends = list(INFERENCE_BACKEND_NAMES)
+        names = [INFERENCE_BACKEND_NAMES[b] + ("" if backend_available(b) else " (chưa cài)") for b in backends]
+        name, ok = QInputDialog.getItem(self, "Inference backend", "Backend suy luận trên CPU:", names,
+                                        backends.index(self.inference_backend), False)
+        if not ok:
+            return
+        backend = backends[names.index(name)]
+        if not backend_available(backend):
+            self.show_status_message(f"Chưa cài runtime cho {INFERENCE_BACKEND_NAMES[backend]}.", 4000)
+            return
+        if self.model_path:
+            # Backend chỉ được đổi khi model load thành công qua backend mới (xem _handle_model_loaded)
+            self._start_model_load(self.model_path, backend)
+        else:
+            self._set_inference_backend(backend)
+            self.show_status_message(f"Backend: {INFERENCE_BACKEND_NAMES[backend]}", 3000)
+
+    def _set_inference_backend(self, backend):
+        self.inference_backend = backend
+        self.act_backend.setText(f"Inference backend ({INFERENCE_BACKEND_NAMES[backend]})")
+
+    def quantize_current_model(self):
+        """Tạo model INT8 từ model .pt đang dùng với ảnh hiệu chuẩn trong thư mục được chọn."""
+        if (self.model_loading or not self.model_path or not self.model_path.endswith('.pt')
+                or self.inference_backend != BACKEND_PYTORCH):
+            self.show_status_message("Cần load model .pt (FP32) trước khi lượng tử hóa.", 4000)
+            return
+        folder_path = QFileDialog.getExistingDirectory(self, "Chọn thư mục ảnh hiệu chuẩn (VD: assets/import)")
+        if not folder_path:
+            return
+        supported_extensions = ('.jpg', '.jpeg', '.png')
+        paths = [os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.lower().endswith(supported_extensions)]
+        try:
+            calibration, evaluation = split_calibration(paths)
+        except ValueError as e:
+            self.show_status_message(str(e), 4000)
+            return
+
+        class_names = read_class_labels(DEFAULT_LABELS_PATH) if os.path.exists(DEFAULT_LABELS_PATH) else self.class_names
+        self.model_loading = True
+        self.btn_import_model.setEnabled(False)
+        worker = QuantizeWorker(self.model, self.model_path, calibration, evaluation, class_names)
+        worker.signals.model_progress.connect(self.show_status_message)
+        worker.signals.model_quantized.connect(self._handle_model_quantized)
+        worker.signals.error.connect(lambda message: self.show_status_message(message, 8000))
+        worker.signals.finished.connect(self._handle_quantize_finished)
+        self.threadpool.start(worker)
+
+    def _handle_quantize_finished(self):
+        self._handle_model_load_finished()
+        if self.pending_model_load:
+            path, self.pending_model_load = self.pending_model_load, None
+            self._start_model_load(path)
+
+    def _handle_model_quantized(self, int8_path, report_path, report):
+        lines = [f"{name}: recall {s['recall']}, precision {s['precision']} ({s['matched']}/{s['reference']})"
+                 for name, s in report['classes'].items() if s['reference'] or s['candidate']]
+        overall = report['overall']
+        text = (f"Model INT8: {int8_path}\n"
+                f"FP32 {report['ms_per_image']['reference']} ms/ảnh, INT8 {report['ms_per_image']['candidate']} ms/ảnh "
+                f"(x{report['speedup']}) trên {report['images']} ảnh đánh giá "
+                f"(hiệu chuẩn: {len(report['calibration_images'])} ảnh khác)\n"
+                f"Tổng: recall {overall['recall']}, precision {overall['precision']}\n\n" + "\n".join(lines) +
+                f"\n\nBáo cáo: {report_path}\n\nLoad model INT8 ngay?")
+        reply = QMessageBox.question(self, "Lượng tử hóa INT8", text, QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply == QMessageBox.Yes:
+            # Worker có thể chưa báo finished -> load sau khi worker kết thúc
+            if self.model_loading:
+                self.pending_model_load = int8_path
+            else:
+                self._start_model_load(int8_path)
+
+    def _active_cache(self):
+        return self.detection_cache if self.cache_enabled else None
+
+    def toggle_detection_cache(self):
+        """Bật/tắt dùng lại detection đã lưu trên đĩa (bỏ qua suy luận khi trúng cache)."""
+        self.cache_enabled = not self.cache_enabled
+        self.act_detection_cache.setChecked(self.cache_enabled)
+        self.act_detection_cache.setText(f"Detection cache ({'ON' if self.cache_enabled else 'OFF'})")
+
+    def clear_detection_cache(self):
+        if self.detection_cache is not None:
+            self.detection_cache.clear()
+        else:
+            shutil.rmtree(DETECTION_CACHE_DIR, ignore_errors=True)
+        self.show_status_message("Đã xóa detection cache.", 3000)
+
+    def choose_process_workers(self):
+        """Chọn số tiến trình suy luận song song khi xử lý thư mục (0 = tắt)."""
+        max_workers = os.cpu_count() or 1
+        value, ok = QInputDialog.getInt(self, "Process workers", f"Số tiến trình suy luận (0 = tắt, tối đa {max_workers}):",
+                                        self.process_workers, 0, max_workers)
+        if ok:
+            self.process_workers = value
+            self.act_process_workers.setText(f"Process workers ({self.process_workers or 'OFF'})")
+            self.show_status_message(f"Process workers: {self.process_workers or 'OFF'}", 3000)
+
+    def choose_video_stride(self):
+        """Chọn khoảng cách giữa hai frame được suy luận (stride tối đa khi bật adaptive)."""
+        value, ok = QInputDialog.getInt(self, "Video stride", "Suy luận 1 frame mỗi N frame:", self.video_stride, 1, 120)
+        if ok:
+            self.video_stride = value
+            self.act_video_stride.setText(f"Video stride ({self.video_stride})")
+            self.show_status_message(f"Video stride: {self.video_stride}", 3000)
+
+    def toggle_live_record(self):
+        self.live_record = not self.live_record
+        self.act_live_record.setChecked(self.live_record)
+        self.act_live_record.setText(f"Live: ghi lại video ({'ON' if self.live_record else 'OFF'})")
+
+    def toggle_tracking(self):
+        self.tracking_enabled = not self.tracking_enabled
+        self.act_tracking.setChecked(self.tracking_enabled)
+        self.act_tracking.setText(f"Tracking ({'ON' if self.tracking_enabled else 'OFF'})")
+
+    def toggle_video_adaptive(self):
+        self.video_adaptive = not self.video_adaptive
+        self.act_video_adaptive.setChecked(self.video_adaptive)
+        self.act_video_adaptive.setText(f"Adaptive stride ({'ON' if self.video_adaptive else 'OFF'})")
+        if self.video_adaptive and self.video_stride == 1:
+            self.show_status_message("Adaptive stride cần Video stride > 1 để có tác dụng.", 4000)
+
+    def choose_motion_threshold(self):
+        """Chọn ngưỡng motion gate: chỉ suy luận lại khi đủ % pixel thay đổi so với frame suy luận gần nhất."""
+        current = self.motion_threshold or DEFAULT_MOTION_THRESHOLD
+        value, ok = QInputDialog.getDouble(self, "Motion gate", "% pixel thay đổi để suy luận lại (0 = tắt):",
+                                           current * 100, 0.0, 100.0, 2)
+        if ok:
+            self.motion_threshold = value / 100
+        self.act_motion_gate.setChecked(bool(self.motion_threshold))
+        label = f"{self.motion_threshold * 100:g}%" if self.motion_threshold else "OFF"
+        self.act_motion_gate.setText(f"Motion gate ({label})")
+        if ok:
+            self.show_status_message(f"Motion gate: {label}", 3000)
+
+    def _active_tiling(self):
+        return self.tiling if self.tiling_enabled else None
+
+    def toggle_tiling(self):
+        """Bật suy luận theo tile cho ảnh (hỏi kích thước tile và độ chồng lấn), hoặc tắt."""
+        if not self.tiling_enabled:
+            tile_size, ok = QInputDialog.getInt(self, "Tiled inference", "Kích thước tile (px):",
+                                                self.tiling['tile_size'], 160, 4096, 32)
+            if ok:
+                overlap, ok = QInputDialog.getDouble(self, "Tiled inference", "Độ chồng lấn giữa các tile (0 - 0.5):",
+                                                     self.tiling['overlap'], 0.0, 0.5, 2)
+            if ok:
+                self.tiling = tiling_config(tile_size, overlap, self.tiling['skip_empty'])
+                self.tiling_enabled = True
+        else:
+            self.tiling_enabled = False
+
+        self.act_tiling.setChecked(self.tiling_enabled)
+        state = f"{self.tiling['tile_size']}px, {self.tiling['overlap']:.0%}" if self.tiling_enabled else "OFF"
+        self.act_tiling.setText(f"Tiled inference ({state})")
+        self.show_status_message(f"Tiled inference: {state}", 3000)
+
+    def toggle_skip_empty_tiles(self):
+        self.tiling = tiling_config(self.tiling['tile_size'], self.tiling['overlap'], not self.tiling['skip_empty'])
+        self.act_skip_empty_tiles.setChecked(self.tiling['skip_empty'])
+        self.act_skip_empty_tiles.setText(f"Skip empty tiles ({'ON' if self.tiling['skip_empty'] else 'OFF'})")
+
+    def _ordered_records(self):
+        """(path, FileRecord) theo thứ tự đang hiển thị trên File List."""
+        rows = sorted(range(self.file_model.rowCount()),
+                      key=lambda row: self.file_model.data(self.file_model.index(row), FileListModel.OrderRole))
+        paths = (self.file_model.path_at(row) for row in rows)
+        return [(path, self.file_metadata[path]) for path in paths if path in self.file_metadata]
+
+    def save_session(self):
+        """Lưu File List + toàn bộ detection ra thư mục phiên để mở lại mà không cần suy luận."""
+        if not self.file_metadata:
+            self.show_status_message("Chưa có file nào để lưu phiên.", 3000)
+            return
+        folder_path = QFileDialog.getExistingDirectory(self, "Chọn thư mục lưu phiên")
+        if not folder_path:
+            return
+        try:
+            start = time.perf_counter()
+            count = save_session(folder_path, self._ordered_records(), self.detection_store,
+                                 self.class_names, self.temp_dir)
+        except Exception as e:
+            QMessageBox.critical(self, "Lỗi", f"Không thể lưu phiên: {e}")
+            return
+        skipped = len(self.file_metadata) - count
+        note = f" (bỏ qua {skipped} video đang xử lý)" if skipped else ""
+        self.show_status_message(f"Đã lưu phiên {count} file{note} trong {time.perf_counter() - start:.2f}s.", 5000)
+
+    def open_session(self):
+        """Mở phiên đã lưu: thay File List hiện tại, detection được memory-map từ đĩa."""
+        folder_path = QFileDialog.getExistingDirectory(self, "Chọn thư mục phiên")
+        if not folder_path:
+            return
+        if self.threadpool.activeThreadCount() > 0:
+            self.show_status_message("Đang có tác vụ chạy nền, hãy đợi xong rồi mở phiên.", 4000)
+            return
+        try:
+            start = time.perf_counter()
+            records, store, class_names = load_session(folder_path)
+        except Exception as e:
+            QMessageBox.critical(self, "Lỗi", f"Không thể mở phiên: {e}")
+            return
+
+        self.clear_all(ask_confirm=False)
+        if not self.class_names:
+            self.class_names = class_names
+        self.detection_store = store
+        for path, record in records:
+            self.file_metadata[path] = record
+            self.listed_file_names.add(os.path.basename(path))
+        self.file_id_counter = max((record.file_id for _, record in records), default=0)
+        self.search_index_stale = True
+        self.file_model.add_files([path for path, _ in records],
+                                  [record.thumbnail_path if record.kind == 'video' else record.image_path
+                                   for _, record in records])
+        if records:
+            self.btn_clear.setEnabled(True)
+            self._select_list_path(records[0][0])
+        self.show_status_message(f"Đã mở phiên {len(records)} file trong {time.perf_counter() - start:.2f}s.", 5000)
+
+    def toggle_label_export(self):
+        """Bật/tắt ghi file nhãn YOLO (.txt) ra thư mục do người dùng chọn."""
+        if self.label_export_dir:
+            self.label_export_dir = None
+            self.show_status_message("Đã TẮT xuất file nhãn.", 3000)
+        else:
+            folder_path = QFileDialog.getExistingDirectory(self, "Chọn thư mục xuất file nhãn")
+            if folder_path:
+                self.label_export_dir = folder_path
+                self.show_status_message(f"File nhãn sẽ được ghi vào: {folder_path}", 3000)
+
+        self.act_export_labels.setChecked(bool(self.label_export_dir))
+        self.act_export_labels.setText(f"Export label files ({'ON' if self.label_export_dir else 'OFF'})")
+
     def choose_export_location(self):
         """Trả về True nếu chọn thành công, False nếu hủy."""
         folder_path = QFileDialog.getExistingDirectory(self, "Chọn thư mục xuất kết quả")
@@ -1882,51 +2871,127 @@ class VehicleDetectorGUI(QMainWindow):
             
         self._redraw_current_image()
 
+    # --- ROI ---
+
+    def set_roi_mode(self, mode):
+        """Bật chế độ vẽ ROI trên MainViewer; hai chế độ loại trừ nhau."""
+        self.act_roi_rect.setChecked(mode == 'rect')
+        self.act_roi_polygon.setChecked(mode == 'polygon')
+        self.main_viewer.set_roi_mode(mode)
+        if mode:
+            hint = "kéo chuột trái" if mode == 'rect' else "click từng đỉnh, double-click để khép"
+            self.show_status_message(f"Vẽ ROI: {hint}; chuột phải để huỷ.", 5000)
+
+    def _handle_roi_drawn(self, points):
+        """ROI vừa vẽ (pixel) -> chuẩn hóa theo kích thước file hiện tại rồi lưu."""
+        metadata = self.file_metadata.get(self.current_image_path)
+        if not metadata or metadata.width <= 0 or metadata.height <= 0:
+            return
+        polygon = [(x / metadata.width, y / metadata.height) for x, y in points]
+        self.rois.set(self.current_image_path, self.rois.get(self.current_image_path) + [polygon])
+        self._refresh_rois()
+        self.show_status_message("Đã thêm ROI. Chọn 'Re-detect in ROI' để suy luận lại trong vùng này.", 5000)
+
+    def clear_rois(self):
+        if not self.current_image_path or not self.rois.get(self.current_image_path):
+            return
+        self.rois.set(self.current_image_path, [])
+        self._refresh_rois()
+        self.show_status_message("Đã xoá ROI của file hiện tại.", 3000)
+
+    def _refresh_rois(self):
+        """Vẽ lại ROI và lọc lại detection hiển thị của file hiện tại sau khi ROI thay đổi."""
+        path = self.current_image_path
+        self.roi_masks = {key: mask for key, mask in self.roi_masks.items() if key[0] != path}
+        metadata = self.file_metadata.get(path)
+        if not metadata:
+            return
+        self._show_rois(path, metadata.width, metadata.height)
+        self._update_counts_label(path, metadata)
+        if metadata.kind == 'image':
+            self._set_image_overlay(path, metadata)
+
+    def redetect_current_file(self):
+        """Suy luận lại file hiện tại; nếu file có ROI thì chỉ suy luận trong ROI."""
+        path = self.current_image_path
+        metadata = self.file_metadata.get(path)
+        if not self.model or not metadata or metadata.processing:
+            return
+        if metadata.kind == 'video':
+            if os.path.exists(metadata.source_path):
+                self.run_video_prediction(path)
+                return
+        elif os.path.exists(path):
+            self.run_prediction_worker(path, is_batch=False)
+            return
+        self.show_status_message("Không tìm thấy file gốc để suy luận lại.", 5000)
+
     def _redraw_current_image(self):
-        """Hàm helper để vẽ lại ảnh hiện tại khi thay đổi cờ Show/Hide."""
-        if self.current_image_path and self.file_metadata.get(self.current_image_path, {}).get('type') == 'image':
-            current_item = self.list_file.currentItem()
-            if current_item:
-                # Khi vẽ lại, chúng ta muốn nó fit
-                self.main_viewer.user_has_zoomed = False
-                self.load_selected_file(current_item)
+        """Áp cờ Show/Hide cho file hiện tại: ảnh chỉ bật/tắt các lớp overlay, video vẽ lại frame đang hiển thị."""
+        metadata = self.file_metadata.get(self.current_image_path)
+        if metadata and metadata.kind == 'image':
+            self._apply_overlay_visibility()
+        elif metadata and metadata.kind == 'video' and self.video_frame is not None:
+            self._show_video_frame(*self.video_frame, metadata.detections)
 
     def import_model(self):
-        path, _ = QFileDialog.getOpenFileName(self, "Chọn model YOLO", "", "YOLO model (*.pt)")
+        """Chọn file model rồi load trên threadpool; UI vẫn phản hồi trong lúc load và warm-up."""
+        if self.model_loading:
+            return
+        path, _ = QFileDialog.getOpenFileName(self, "Chọn model YOLO", "", "YOLO model (*.pt *.onnx)")
         if path:
-            try:
-                self.model = YOLO(path)
-                self.class_names = self.model.names
-                self.class_colors = {i: [random.randint(100, 255) for _ in range(3)] for i in self.class_names.keys()}
-                
-                self.show_status_message(f"✅ Model đã load: {os.path.basename(path)}", 5000)
-                
-                style_check = f"""
-                    QToolButton {{
-                        border-image: url("{self.icon_path_model_check}") 0 0 0 0 stretch stretch;
-                        border: 1px solid #888;
-                    }}
-                """
-                self.btn_import_model.setStyleSheet(style_check)
-                self.widget_styles[self.btn_import_model] = style_check
-                
-                self._set_controls_enabled(True)
-                
-            except Exception as e:
-                self.show_status_message(f"Lỗi: Không load được model: {e}", 5000)
-                self.model = None
-                
-                style_model = f"""
-                    QToolButton {{
-                        border-image: url("{self.icon_path_model}") 0 0 0 0 stretch stretch;
-                        border: 1px solid #888;
-                    }}
-                """
-                self.btn_import_model.setStyleSheet(style_model)
-                self.widget_styles[self.btn_import_model] = style_model
-                
-                self._set_controls_enabled(False)
-            
+            self._start_model_load(path)
+
+    def _start_model_load(self, path, backend=None):
+        if self.model_loading:
+            return
+        self.model_loading = True
+        self.loading_backend = backend or self.inference_backend
+        self.btn_import_model.setEnabled(False)
+        worker = ModelLoadWorker(path, self.warmup_runs, self.loading_backend)
+        worker.signals.model_progress.connect(self.show_status_message)
+        worker.signals.model_loaded.connect(self._handle_model_loaded)
+        worker.signals.error.connect(self._handle_model_load_error)
+        worker.signals.finished.connect(self._handle_model_load_finished)
+        self.threadpool.start(worker)
+
+    def _set_model_button_style(self, loaded):
+        icon_path = self.icon_path_model_check if loaded else self.icon_path_model
+        style = f"""
+            QToolButton {{
+                border-image: url("{icon_path}") 0 0 0 0 stretch stretch;
+                border: 1px solid #888;
+            }}
+        """
+        self.btn_import_model.setStyleSheet(style)
+        self.widget_styles[self.btn_import_model] = style
+
+    def _handle_model_loaded(self, path, runtime_path, model, cache, timings):
+        self.model = model
+        self.model_path = path
+        self.runtime_model_path = runtime_path
+        self.detection_cache = cache
+        self._set_inference_backend(self.loading_backend)
+        self.class_names = self.model.names
+        self.class_colors = {i: [random.randint(100, 255) for _ in range(3)] for i in self.class_names.keys()}
+
+        backend = INFERENCE_BACKEND_NAMES[runtime_backend(runtime_path)]
+        export = f"export {timings['export_s']:.2f}s, " if timings['export_s'] >= 0.01 else ""
+        self.show_status_message(f"✅ Model đã load: {os.path.basename(path)} [{backend}] ({export}load {timings['load_s']:.2f}s, "
+                                 f"warm-up {timings['warmup_s']:.2f}s, hash {timings['hash_s']:.2f}s)", 8000)
+        self._set_model_button_style(True)
+        self._set_controls_enabled(True)
+
+    def _handle_model_load_error(self, message):
+        """Load lỗi: giữ nguyên model và backend đang dùng (nếu có), chỉ báo lỗi."""
+        if self.model is not None:
+            message += f" - vẫn dùng {os.path.basename(self.model_path)} [{INFERENCE_BACKEND_NAMES[self.inference_backend]}]"
+        self.show_status_message(message, 8000)
+
+    def _handle_model_load_finished(self):
+        self.model_loading = False
+        self.btn_import_model.setEnabled(True)
+
     # --- Listener phím (cho 'Esc') ---
     
     def on_press(self, key):
@@ -1985,24 +3050,26 @@ class VehicleDetectorGUI(QMainWindow):
         else:
             super().keyPressEvent(event)
             
+    def _select_list_row(self, row):
+        """Chọn và tải hàng thứ row (theo thứ tự đang hiển thị, sau lọc)."""
+        index = self.file_proxy.index(row, 0)
+        if index.isValid():
+            self.list_file.setCurrentIndex(index)
+            self.load_selected_file(index)
+
     def next_image(self):
-        current_row = self.list_file.currentRow()
-        if current_row == -1 and self.list_file.count() > 0: 
-            self.list_file.setCurrentRow(0)
-            self.load_selected_file(self.list_file.item(0))
-        elif current_row < self.list_file.count() - 1:
-            next_item = self.list_file.item(current_row + 1)
-            self.list_file.setCurrentItem(next_item)
-            self.load_selected_file(next_item)
+        current_row = self.list_file.currentIndex().row()
+        if current_row == -1 and self.file_proxy.rowCount() > 0: 
+            self._select_list_row(0)
+        elif current_row < self.file_proxy.rowCount() - 1:
+            self._select_list_row(current_row + 1)
         else:
             self.show_status_message("Đã đến cuối danh sách.", 2000)
 
     def previous_image(self):
-        current_row = self.list_file.currentRow()
+        current_row = self.list_file.currentIndex().row()
         if current_row > 0:
-            previous_item = self.list_file.item(current_row - 1)
-            self.list_file.setCurrentItem(previous_item)
-            self.load_selected_file(previous_item)
+            self._select_list_row(current_row - 1)
         elif current_row == 0:
             self.show_status_message("Đã ở đầu danh sách.", 2000)
         else: